@@ -0,0 +1,128 @@
+"""Compare archive compression codecs on real or synthetic messages.
+
+Usage: python benchmark_archive.py [FILE_OR_DIR ...]
+
+Messages are stored through datmail.storage.Storage into an in-memory
+stand-in for S3, so only compression and decompression are measured.
+Without arguments, a mix of synthetic list mails with attachments is used.
+"""
+
+import argparse
+import email.message
+import os
+import random
+import time
+
+from datmail.storage import CODECS, Storage
+
+
+class InMemoryS3:
+    """The subset of the boto3 S3 client used by Storage."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Body, Bucket, Key, Metadata=None, **kwargs):
+        body = Body.read() if hasattr(Body, "read") else bytes(Body)
+        self.objects[Bucket, Key] = (body, dict(Metadata or {}))
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None):
+        # Read in parts, as the transfer manager does for multipart uploads
+        chunksize = getattr(Config, "multipart_chunksize", 8 * 1024 * 1024)
+        parts = []
+        for part in iter(lambda: Fileobj.read(chunksize), b""):
+            parts.append(part)
+        metadata = (ExtraArgs or {}).get("Metadata")
+        self.objects[Bucket, Key] = (b"".join(parts), dict(metadata or {}))
+
+    def get_object(self, Bucket, Key):
+        body, metadata = self.objects[Bucket, Key]
+        return {"Body": _Body(body), "Metadata": metadata}
+
+
+class _Body:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+def synthetic_messages(count=50):
+    rng = random.Random(0)
+    words = "fredagscafeen bestyrelse kaffe kage regnskab vagtplan referat".split()
+    for i in range(count):
+        message = email.message.EmailMessage()
+        message["From"] = "bruger%d@example.com" % i
+        message["To"] = "best@fredagscafeen.dk"
+        message["Subject"] = "Referat %d" % i
+        message.set_content(" ".join(rng.choice(words) for _ in range(400)))
+        if i % 2 == 0:
+            # Text-like attachment (e.g. a spreadsheet export)
+            rows = "\n".join(
+                ";".join(str(rng.randint(0, 999)) for _ in range(8))
+                for _ in range(2000)
+            )
+            message.add_attachment(rows.encode(), "text", "csv", filename="data.csv")
+        if i % 3 == 0:
+            # Incompressible attachment (e.g. a JPEG)
+            message.add_attachment(
+                os.urandom(200000), "image", "jpeg", filename="photo.jpg"
+            )
+        yield message.as_bytes()
+
+
+def file_messages(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.listdir(path))
+            yield from file_messages([os.path.join(path, n) for n in names])
+        else:
+            with open(path, "rb") as fp:
+                yield fp.read()
+
+
+def benchmark(messages, codec):
+    s3 = InMemoryS3()
+    storage = Storage("bench", "local", compression=codec, s3_client=s3)
+    put_time = get_time = 0.0
+    for i, body in enumerate(messages):
+        key = "archive/%d.eml" % i
+        t = time.process_time()
+        storage.put_object(body, key)
+        put_time += time.process_time() - t
+        t = time.process_time()
+        assert storage.get_object(key) == body
+        get_time += time.process_time() - t
+    stored = sum(len(body) for body, metadata in s3.objects.values())
+    return stored, put_time, get_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help=".eml files or directories")
+    args = parser.parse_args()
+
+    messages = list(file_messages(args.paths) if args.paths else synthetic_messages())
+    raw = sum(len(m) for m in messages)
+    print("%d messages, %d bytes" % (len(messages), raw))
+    print(
+        "%-6s %12s %7s %14s %14s"
+        % ("codec", "stored", "saved", "put ms/msg", "get ms/msg")
+    )
+    for codec in [None] + sorted(CODECS):
+        stored, put_time, get_time = benchmark(messages, codec)
+        print(
+            "%-6s %12d %6.1f%% %14.3f %14.3f"
+            % (
+                codec or "none",
+                stored,
+                100 * (1 - stored / raw),
+                1000 * put_time / len(messages),
+                1000 * get_time / len(messages),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import argparse
 import threading
 
 from emailtunnel import logger
+from datmail.aio import ExecutorIngestServer
 from datmail.control import create_control_server
 from datmail.config import (
     DATMAIL_CONTROL_HOST,
@@ -27,6 +28,13 @@ def configure_logging():
 parser = argparse.ArgumentParser()
 parser.add_argument("-p", "--port", type=int, default=25, help="Relay port")
 parser.add_argument("-P", "--listen-port", type=int, default=9000, help="Listen port")
+parser.add_argument(
+    "--executor",
+    "--asyncio",
+    dest="executor",
+    action="store_true",
+    help="Accept mail on an event loop and run envelopes in a thread pool",
+)
 
 
 def main():
@@ -38,7 +46,11 @@ def main():
     relay_host = "host.docker.internal"
     relay_port = args.port
 
-    server = DatForwarder(receiver_host, receiver_port, relay_host, relay_port)
+    if args.executor:
+        # ExecutorIngestServer owns the listener; the forwarder only relays
+        server = DatForwarder(None, None, relay_host, relay_port)
+    else:
+        server = DatForwarder(receiver_host, receiver_port, relay_host, relay_port)
     control_server = create_control_server(
         server,
         token=DATMAIL_CONTROL_TOKEN,
@@ -50,8 +62,12 @@ def main():
         daemon=True,
     )
     control_thread.start()
+    if args.executor:
+        runner = ExecutorIngestServer(server, receiver_host, receiver_port)
+    else:
+        runner = server
     try:
-        server.run()
+        runner.run()
     except Exception as exn:
         logger.exception("Uncaught exception in DatForwarder.run")
     else:
@@ -59,6 +75,7 @@ def main():
     finally:
         control_server.shutdown()
         control_server.server_close()
+        server.shutdown()
 
 
 if __name__ == "__main__":
@@ -1,13 +1,30 @@
+import concurrent.futures
+import itertools
 import re
-from collections import namedtuple, defaultdict
+from collections import OrderedDict, namedtuple, defaultdict
 
 from emailtunnel import InvalidRecipient, logger
 
 import datmail.django_api_client
+import datmail.mailinglist
 from datmail.config import ADMINS
 
+try:
+    from datmail.config import UNKNOWN_ALIAS_LOG_SAMPLE
+except ImportError:
+    UNKNOWN_ALIAS_LOG_SAMPLE = 100
+
 GroupAliasBase = namedtuple("GroupAlias", "name")
 
+# Aliases in an expression like "best+koordinator-anders" are looked up
+# concurrently on this pool.
+alias_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=8, thread_name_prefix="datmail-alias"
+)
+
+unknown_alias_count = itertools.count(1)
+circuit_open_count = itertools.count(1)
+
 
 class GroupAlias(GroupAliasBase):
     def __str__(self):
@@ -22,7 +39,7 @@ def get_admin_emails():
 
     email_addresses = []
     try:
-        api_client = datmail.django_api_client.DjangoAPIClient()
+        api_client = datmail.django_api_client.get_shared_client()
         email_addresses, _ = api_client.get_admin_emails()
     except:
         pass
@@ -40,7 +57,7 @@ def translate_recipient(name, list_group_origins=False):
     ["anders@bruunseverinsen.dk", ...]
     """
 
-    api_client = datmail.django_api_client.DjangoAPIClient()
+    api_client = datmail.django_api_client.get_shared_client()
 
     recipient_emails, group_origins = parse_recipient(name.lower(), api_client)
     assert isinstance(recipient_emails, list) and isinstance(group_origins, list)
@@ -51,63 +68,176 @@ def translate_recipient(name, list_group_origins=False):
         return recipient_emails
 
 
+def expand_recipient(name):
+    """Translate recipient `name` into a RecipientExpansion.
+
+    Unlike translate_recipient, no email strings are built until the
+    caller asks for the groups.
+    """
+
+    api_client = datmail.django_api_client.get_shared_client()
+    return evaluate_recipient(name.lower(), api_client)
+
+
 def parse_recipient(recipient, api_client):
     """
     Evaluate each address which is divided by + and -.
-    Collects the resulting sets of not matched and the set of spam addresses.
-    And return the set of person indexes that are to receive the email.
+    Return the sorted recipient emails and the group alias each came from.
     """
 
+    expansion = evaluate_recipient(recipient, api_client)
+    email_origins = {}
+    for groupAlias, emails in expansion.groups():
+        for email in emails:
+            email_origins[email] = groupAlias
+
+    recipient_emails = sorted(email_origins)
+    return recipient_emails, [email_origins[r] for r in recipient_emails]
+
+
+def evaluate_recipient(recipient, api_client):
+    """
+    Evaluate each address which is divided by + and -, on member bitmaps.
+    Raise InvalidRecipient listing every alias that does not resolve,
+    or if nobody is left to receive the email.
+    """
+
+    index = datmail.mailinglist.member_index
     personEmailOps = []
     invalid_recipients = []
-    for sign, name in re.findall(r"([+-]?)([^+-]+)", recipient):
+    terms = re.findall(r"([+-]?)([^+-]+)", recipient)
+    aliases = resolve_aliases([name for sign, name in terms], api_client)
+    for sign, name in terms:
         try:
-            emailList, groupAlias, listId, isOnlyInternal = parse_alias(name, api_client)
-            personEmailOps.append((sign or "+", emailList, groupAlias))
+            emailList, groupAlias, listId, isOnlyInternal = aliases[name].result()
         except InvalidRecipient as e:
             invalid_recipients.append(e.args[0])
+            continue
+        if isinstance(emailList, datmail.mailinglist.MemberList):
+            bitmap = emailList.bitmap_in(index)
+        else:
+            bitmap = index.bitmap(emailList)
+        personEmailOps.append((sign or "+", bitmap, groupAlias))
 
     if invalid_recipients:
         raise InvalidRecipient(invalid_recipients)
 
-    # Mapping: email -> groupAlias that included this email
-    email_origins = {}
-    recipient_emails = set()
-    for sign, emailList, groupAlias in personEmailOps:
-        for email in emailList:
-            if sign == "+":
-                recipient_emails.add(email)
-                email_origins[email] = groupAlias
-            else:                
-                email_origins[email] = None
-                # If no more groups claim this email, remove it from the recipient set
-                if not email_origins[email]:
-                    recipient_emails.discard(email)
-
-    recipient_emails = sorted(recipient_emails)
-    if not recipient_emails:
+    expansion = RecipientExpansion(personEmailOps, index)
+    if not expansion:
         raise InvalidRecipient(recipient)
-    return recipient_emails, [email_origins[r] for r in recipient_emails]
+    return expansion
+
+
+class RecipientExpansion:
+    """The members selected by a recipient expression like "best-anders".
+
+    `ops` is a list of (sign, bitmap, group alias) with bitmaps over the
+    MemberIndex `index`. Each recipient originates from the last "+" group
+    that includes them; a later "-" removes them until another "+" adds
+    them.
+    """
+
+    def __init__(self, ops, index):
+        self.ops = ops
+        self.index = index
+        bitmap = 0
+        for sign, bits, groupAlias in ops:
+            if sign == "+":
+                bitmap |= bits
+            else:
+                bitmap &= ~bits
+        self.bitmap = bitmap
+
+    def __bool__(self):
+        return self.bitmap != 0
+
+    def __len__(self):
+        return bin(self.bitmap).count("1")
+
+    def emails(self):
+        return self.index.lookup(self.bitmap)
+
+    def group_bitmaps(self):
+        """Return [(group alias, bitmap)], sorted by group alias."""
+        remaining = self.bitmap
+        group_bitmaps = {}
+        for sign, bits, groupAlias in reversed(self.ops):
+            if sign != "+" or not remaining & bits:
+                continue
+            group_bitmaps[groupAlias] = group_bitmaps.get(groupAlias, 0) | (
+                remaining & bits
+            )
+            remaining &= ~bits
+        return sorted(group_bitmaps.items())
+
+    def groups(self):
+        """Yield (group alias, emails), sorted by group alias.
+
+        The emails of a group are only looked up when it is reached.
+        """
+        for groupAlias, bits in self.group_bitmaps():
+            yield groupAlias, self.index.lookup(bits)
+
+
+def resolve_aliases(names, api_client):
+    """Start parse_alias for each distinct name; return {name: future}."""
+    names = list(OrderedDict.fromkeys(names))
+    if len(names) == 1:
+        # Nothing to overlap, so skip the thread hop
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(parse_alias(names[0], api_client))
+        except InvalidRecipient as e:
+            future.set_exception(e)
+        return {names[0]: future}
+    return {
+        name: alias_executor.submit(parse_alias, name, api_client) for name in names
+    }
 
 
 def parse_alias_group(alias, api_client):
-    list_info = None
+    mailing_list = None
     try:
-        list_info = api_client.get_mailinglist_info(alias)
+        mailing_list = api_client.get_mailinglist(alias)
+    except datmail.django_api_client.CircuitOpenError as e:
+        log_circuit_open(alias, e)
+        return None, None, None, None # Django is down, so not a valid alias
     except Exception:
         logger.exception("Error fetching mailing list info for alias %r", alias)
         return None, None, None, None # API error, so not a valid alias
     
-    if list_info is None:
+    if mailing_list is None:
+        log_unknown_alias(alias)
         return None, None, None, None # No such alias, so not a valid alias
 
-    members = list_info.get("members")
-    if not members:
+    if not mailing_list.info.get("members"):
         return None, None, None, None # No members, so not a valid alias
 
-    email_list = [m.get("email") for m in members if isinstance(m.get("email"), str)]
+    return mailing_list.emails, GroupAlias(alias), mailing_list.id, mailing_list.is_only_internal
+
+
+def log_unknown_alias(alias):
+    """Log the first and then every UNKNOWN_ALIAS_LOG_SAMPLE'th unknown alias.
+
+    Dictionary spam to random local parts would otherwise flood the log.
+    """
+    n = next(unknown_alias_count)
+    if n == 1 or n % UNKNOWN_ALIAS_LOG_SAMPLE == 0:
+        logger.info("No such alias %r (%s unknown aliases so far)", alias, n)
+
 
-    return email_list, GroupAlias(alias), list_info.get("id"), list_info.get("isOnlyInternal")
+def log_circuit_open(alias, error):
+    """Log a lookup refused by an open circuit breaker, without a traceback.
+
+    Like log_unknown_alias, only the first and then every
+    UNKNOWN_ALIAS_LOG_SAMPLE'th is logged, so the log is not flooded just
+    as the breaker is shedding load.
+    """
+    n = next(circuit_open_count)
+    if n == 1 or n % UNKNOWN_ALIAS_LOG_SAMPLE == 0:
+        logger.warning(
+            "Not looking up alias %r: %s (%s refused lookups so far)", alias, error, n
+        )
 
 
 def parse_alias(alias, api_client):
@@ -0,0 +1,140 @@
+import asyncio
+import concurrent.futures
+import email.parser
+import re
+
+from aiosmtpd.smtp import SMTP
+from emailtunnel import Envelope, Message, logger
+
+try:
+    from datmail.config import ASYNC_WORKERS
+except ImportError:
+    ASYNC_WORKERS = 16
+
+
+class ExecutorDjangoAPIClient:
+    """Awaitable facade over a DjangoAPIClient.
+
+    This is not an asyncio HTTP client: each call runs the blocking
+    DjangoAPIClient method in the thread pool, so the event loop keeps
+    accepting mail while Django is slow, and several lookups can be in
+    flight at once. The wrapped client (and its mailing-list cache) is
+    shared with the policy code.
+    """
+
+    def __init__(self, api_client, executor):
+        self.api_client = api_client
+        self.executor = executor
+
+    def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, fn, *args)
+
+    async def get_mailinglist_info(self, list_name):
+        return await self._call(self.api_client.get_mailinglist_info, list_name)
+
+
+class ExecutorIngestServer:
+    """SMTP listener on an event loop, with a thread pool for the policy code.
+
+    Only accepting connections and the SMTP dialogue run on the event
+    loop (aiosmtpd). Parsing, logging and the unchanged, blocking
+    DatForwarder policy code (reject, spam filter, list authorization,
+    header rewriting and relay) run in a pool of `workers` threads, so
+    several envelopes progress at once and one slow dependency only holds
+    up its own envelope. Mailing lists for the local recipients are
+    prefetched concurrently through ExecutorDjangoAPIClient before the
+    policy code runs. Archive uploads are write-behind already (see
+    datmail.archive).
+
+    This server owns the listener: the forwarder's own receiver is never
+    started, and emailtunnel's process_message is bypassed in favour of
+    `receive` and `handle_envelope` below.
+    """
+
+    def __init__(self, forwarder, host, port, workers=ASYNC_WORKERS):
+        self.forwarder = forwarder
+        self.host = host
+        self.port = port
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="datmail-ingest"
+        )
+        self.api_client = ExecutorDjangoAPIClient(forwarder.api_client, self.executor)
+        self.server = None
+
+    def run(self):
+        asyncio.run(self.serve_forever())
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(
+            lambda: SMTP(self), host=self.host, port=self.port
+        )
+        logger.info(
+            "DatForwarder (executor front end) listening on %s:%s",
+            self.host,
+            self.server.sockets[0].getsockname()[1],
+        )
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def handle_DATA(self, server, session, envelope):
+        loop = asyncio.get_running_loop()
+        data = envelope.original_content
+        envelope = await loop.run_in_executor(
+            self.executor,
+            self.receive,
+            session.peer,
+            envelope.mail_from,
+            list(envelope.rcpt_tos),
+            data,
+        )
+        if envelope is None:
+            return "250 OK"
+        await self.prefetch(envelope)
+        return await loop.run_in_executor(
+            self.executor, self.handle_envelope, envelope, session.peer, data
+        )
+
+    def receive(self, peer, mailfrom, rcpttos, data):
+        envelope = None
+        try:
+            message = Message(email.parser.BytesParser().parsebytes(data))
+            envelope = Envelope(message, mailfrom, rcpttos)
+            envelope.raw_data = data
+            self.forwarder.log_receipt(peer, envelope)
+        except Exception:
+            self.forwarder.handle_error(envelope, data)
+            return None
+        return envelope
+
+    async def prefetch(self, envelope):
+        """Warm the mailing-list cache for all local recipients at once."""
+        domain = "@%s" % self.forwarder.DOMAIN
+        names = set()
+        for rcptto in envelope.rcpttos:
+            if domain in rcptto.lower():
+                local_part = rcptto.split("@")[0].lower()
+                names.update(re.findall(r"[^+-]+", local_part))
+        await asyncio.gather(
+            *(self.api_client.get_mailinglist_info(name) for name in names),
+            return_exceptions=True,
+        )
+
+    def handle_envelope(self, envelope, peer, data):
+        try:
+            result = self.forwarder.handle_envelope(envelope, peer)
+        except Exception:
+            self.forwarder.handle_error(envelope, data)
+            return "250 OK"
+        return result if isinstance(result, str) else "250 OK"
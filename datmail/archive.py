@@ -0,0 +1,343 @@
+import collections
+import os
+import queue
+import threading
+import time
+import urllib.parse
+
+from emailtunnel import logger
+
+from datmail.chunks import body_chunks, body_size, join_body
+
+try:
+    from datmail.config import (
+        ARCHIVE_QUEUE_SIZE,
+        ARCHIVE_WORKERS,
+        ARCHIVE_SPOOL_DIR,
+        ARCHIVE_REPLAY_INTERVAL,
+    )
+except ImportError:
+    ARCHIVE_QUEUE_SIZE = 1000
+    ARCHIVE_WORKERS = 4
+    ARCHIVE_SPOOL_DIR = "spool/archive"
+    ARCHIVE_REPLAY_INTERVAL = 60
+
+try:
+    from datmail.config import ARCHIVE_MULTIPART_THRESHOLD
+except ImportError:
+    ARCHIVE_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+# Error codes S3 returns with a 4xx status when it is overloaded
+THROTTLING_CODES = {"SlowDown", "Throttling", "RequestTimeout", "RequestTimeTooSkewed"}
+
+# A replay pass gives up after this many failures in a row: S3 is down
+REPLAY_PROBE = 3
+
+# A spooled message is quarantined after failing this many replay passes
+# in which other messages were uploaded
+REPLAY_MAX_ATTEMPTS = 5
+
+
+def is_transient_error(exc):
+    """Whether the upload error `exc` may go away by itself.
+
+    Connection errors, timeouts, throttling and 5xx responses are
+    transient. Other 4xx responses mean S3 rejected the object, and
+    errors reading the spooled file mean it is corrupt; retrying those
+    is pointless.
+    """
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        code = response.get("Error", {}).get("Code")
+        return status >= 500 or status in (408, 429) or code in THROTTLING_CODES
+    return not isinstance(
+        exc, (ValueError, EOFError, IsADirectoryError, PermissionError)
+    )
+
+
+class ArchiveQueue:
+    """Write-behind queue in front of Storage.
+
+    `upload_object` only enqueues the message and returns; a pool of worker
+    threads does the actual uploads. When the queue is full, or when an
+    upload fails because S3 is unavailable, the message is spilled to a
+    local spool directory instead. The spool is replayed at startup and
+    every `replay_interval` seconds until it is empty. Spooled messages
+    that S3 rejects (see is_transient_error), or that keep failing while
+    others are uploaded, are moved to the spool's quarantine directory so
+    they do not hold up the rest.
+
+    Messages of `large_size` bytes or more are written to the spool right
+    away and uploaded from there, so they are not held in memory while they
+    wait for a worker.
+
+    Objects that have not reached S3 yet are served from memory or from
+    the spool by `get_object`, so resends work during an S3 outage. With
+    a DiskCache as `cache`, uploaded and fetched objects are also kept on
+    local disk for later resends.
+    """
+
+    def __init__(
+        self,
+        storage,
+        spool_dir=ARCHIVE_SPOOL_DIR,
+        maxsize=ARCHIVE_QUEUE_SIZE,
+        workers=ARCHIVE_WORKERS,
+        replay_interval=ARCHIVE_REPLAY_INTERVAL,
+        large_size=ARCHIVE_MULTIPART_THRESHOLD,
+        cache=None,
+    ):
+        self.storage = storage
+        self.large_size = large_size
+        self.cache = cache
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.replay_interval = replay_interval
+        self.queue = queue.Queue(maxsize)
+        self.pending = {}
+        self.stats = collections.Counter()
+        self.last_upload_latency = None
+        self.avg_upload_latency = None
+        self.s3_available = True
+        self.replay_failures = collections.Counter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for i in range(self.workers):
+            self._start_thread(self._upload_loop, "datmail-archive-%d" % i)
+        self._start_thread(self._replay_loop, "datmail-archive-replay")
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        """Stop the workers once the queue has been drained."""
+        self._stopped.set()
+        for _ in range(self.workers):
+            self.queue.put((None, None))
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def upload_object(self, body, object_name):
+        """Archive `body`: bytes-like, or a list of chunks (see body_chunks)."""
+        with self._lock:
+            self.pending[object_name] = body
+        if not self.s3_available:
+            self._spill(object_name, body)
+            return
+        if body_size(body) >= self.large_size:
+            if self._spill(object_name, body, stat="streamed"):
+                try:
+                    # A body of None means: upload the spooled file
+                    self.queue.put_nowait((object_name, None))
+                except queue.Full:
+                    pass  # The replay loop gets to it
+            return
+        try:
+            self.queue.put_nowait((object_name, body))
+        except queue.Full:
+            self._spill(object_name, body)
+
+    def get_object(self, object_name):
+        with self._lock:
+            body = self.pending.get(object_name)
+        if body is not None:
+            return join_body(body)
+        try:
+            with open(self._spool_path(object_name), "rb") as fp:
+                return fp.read()
+        except FileNotFoundError:
+            pass
+        if self.cache is None:
+            return self.storage.get_object(object_name)
+        body = self.cache.get(object_name)
+        if body is None:
+            body = self.storage.get_object(object_name)
+            self.cache.put(object_name, body)
+        return body
+
+    def metrics(self):
+        if self.cache is not None:
+            return dict(self._metrics(), cache=self.cache.metrics())
+        return self._metrics()
+
+    def _metrics(self):
+        return dict(
+            self.stats,
+            queue_depth=self.queue.qsize(),
+            pending=len(self.pending),
+            s3_available=self.s3_available,
+            last_upload_latency=self.last_upload_latency,
+            avg_upload_latency=self.avg_upload_latency,
+        )
+
+    def _put(self, object_name, body):
+        t = time.monotonic()
+        self.storage.put_object(body, object_name)
+        self._record_latency(time.monotonic() - t)
+
+    def _put_spooled(self, object_name):
+        """Upload the spooled file for `object_name` and remove it."""
+        path = self._spool_path(object_name)
+        t = time.monotonic()
+        if os.path.getsize(path) >= self.large_size:
+            self.storage.put_file(path, object_name)
+        else:
+            with open(path, "rb") as fp:
+                self.storage.put_object(fp.read(), object_name)
+        self._record_latency(time.monotonic() - t)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass  # Uploaded by both a worker and the replay loop
+
+    def _record_latency(self, latency):
+        with self._lock:
+            self.stats["uploaded"] += 1
+            self.last_upload_latency = latency
+            if self.avg_upload_latency is None:
+                self.avg_upload_latency = latency
+            else:
+                self.avg_upload_latency += 0.1 * (latency - self.avg_upload_latency)
+
+    def _upload_loop(self):
+        while True:
+            object_name, body = self.queue.get()
+            if object_name is None:
+                return
+            if body is None:
+                try:
+                    self._put_spooled(object_name)
+                except FileNotFoundError:
+                    pass  # Already replayed
+                except Exception as e:
+                    logger.exception("Error uploading spooled %s", object_name)
+                    if is_transient_error(e):
+                        self.s3_available = False
+                    else:
+                        self._quarantine(object_name)
+                else:
+                    self.s3_available = True
+                continue
+            try:
+                self._put(object_name, body)
+            except Exception as e:
+                logger.exception("Error uploading %s; spooling it", object_name)
+                if is_transient_error(e):
+                    self.s3_available = False
+                    self._spill(object_name, body)
+                elif self._spill(object_name, body):
+                    self._quarantine(object_name)
+            else:
+                self.s3_available = True
+                if self.cache is not None:
+                    self.cache.put(object_name, body)
+                self._forget(object_name, body)
+
+    def _forget(self, object_name, body):
+        with self._lock:
+            if self.pending.get(object_name) is body:
+                del self.pending[object_name]
+
+    def _spool_path(self, object_name):
+        return os.path.join(self.spool_dir, urllib.parse.quote(object_name, safe=""))
+
+    def _spill(self, object_name, body, stat="spooled"):
+        path = self._spool_path(object_name)
+        try:
+            with open(path + ".tmp", "wb") as fp:
+                for chunk in body_chunks(body):
+                    fp.write(chunk)
+            os.replace(path + ".tmp", path)
+        except Exception:
+            logger.exception("Could not spool %s; it is not archived", object_name)
+            stat = "lost"
+        with self._lock:
+            self.stats[stat] += 1
+        self._forget(object_name, body)
+        return stat != "lost"
+
+    def _replay_loop(self):
+        while True:
+            self.replay()
+            if self._stopped.wait(self.replay_interval):
+                return
+
+    @property
+    def quarantine_dir(self):
+        return os.path.join(self.spool_dir, "quarantine")
+
+    def _quarantine(self, object_name):
+        """Move the spooled file for `object_name` out of the replay's way."""
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        filename = os.path.basename(self._spool_path(object_name))
+        try:
+            os.replace(
+                self._spool_path(object_name),
+                os.path.join(self.quarantine_dir, filename),
+            )
+        except FileNotFoundError:
+            return
+        logger.error(
+            "Quarantined %s in %s; it is not archived", object_name, self.quarantine_dir
+        )
+        with self._lock:
+            self.stats["quarantined"] += 1
+            self.replay_failures.pop(filename, None)
+
+    def replay(self):
+        """Upload spooled messages.
+
+        Messages S3 rejects are quarantined at once. A pass stops after
+        REPLAY_PROBE transient failures in a row, taking S3 to be down;
+        messages that fail REPLAY_MAX_ATTEMPTS passes in which others
+        were uploaded are quarantined too.
+        """
+        try:
+            filenames = sorted(os.listdir(self.spool_dir))
+        except OSError:
+            return
+        failed = []
+        streak = 0
+        uploaded = False
+        for filename in filenames:
+            if filename.endswith(".tmp") or filename == "quarantine":
+                continue
+            object_name = urllib.parse.unquote(filename)
+            try:
+                self._put_spooled(object_name)
+            except FileNotFoundError:
+                continue  # Uploaded by a worker meanwhile
+            except Exception as e:
+                logger.exception("Replaying archive spool failed at %s", object_name)
+                if not is_transient_error(e):
+                    self._quarantine(object_name)
+                    continue
+                failed.append(filename)
+                streak += 1
+                if streak >= REPLAY_PROBE:
+                    self.s3_available = False
+                    return
+                continue
+            streak = 0
+            uploaded = True
+            with self._lock:
+                self.stats["replayed"] += 1
+                self.replay_failures.pop(filename, None)
+        if failed and not uploaded:
+            self.s3_available = False
+            return
+        self.s3_available = True
+        # S3 works, so these messages fail by themselves
+        for filename in failed:
+            with self._lock:
+                self.replay_failures[filename] += 1
+                attempts = self.replay_failures[filename]
+            if attempts >= REPLAY_MAX_ATTEMPTS:
+                self._quarantine(urllib.parse.unquote(filename))
@@ -0,0 +1,122 @@
+import collections
+import threading
+import time
+
+from emailtunnel import logger
+
+
+CacheEntry = collections.namedtuple("CacheEntry", "value etag fetched_at")
+
+
+class TTLCache:
+    """Bounded, thread-safe LRU cache with TTL and stale-while-revalidate.
+
+    Values are produced by a loader function `load(key, previous)` which
+    receives the previous CacheEntry (or None) so it can revalidate with
+    e.g. an ETag, and must return a `(value, etag)` pair.
+
+    Entries younger than `ttl` seconds are served directly. Entries that
+    are older, but younger than `ttl + stale_ttl`, are served as-is while
+    a background thread refreshes them. Anything older is reloaded inline.
+    """
+
+    def __init__(self, ttl, stale_ttl=0, max_entries=256, clock=time.monotonic):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.stats = collections.Counter()
+        self._entries = collections.OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        if self.max_entries <= 0:
+            value, etag = load(key, None)
+            return value
+
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.fetched_at
+                if age <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry.value
+                if age <= self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.stats["stale_hits"] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(
+                            target=self._refresh,
+                            args=(key, load, entry),
+                            daemon=True,
+                        ).start()
+                    return entry.value
+            self.stats["misses"] += 1
+
+        return self._load(key, load, entry).value
+
+    def peek(self, key):
+        """Return the cached entry for `key` without loading or counting."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def contains(self, key):
+        """Return whether `key` has an entry younger than `ttl`; never loads."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self.clock() - entry.fetched_at > self.ttl:
+                return False
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True
+
+    def put(self, key, value, etag=None, stat=None):
+        entry = CacheEntry(value, etag, self.clock())
+        with self._lock:
+            if stat:
+                self.stats[stat] += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return entry
+
+    def count(self, stat):
+        """Count an event that is not a cache operation in `stats`."""
+        with self._lock:
+            self.stats[stat] += 1
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self, key, load, previous):
+        value, etag = load(key, previous)
+        stat = None
+        if previous is not None and etag is not None and etag == previous.etag:
+            stat = "not_modified"
+            value = previous.value
+        return self.put(key, value, etag, stat)
+
+    def _refresh(self, key, load, previous):
+        stat = "refresh_errors"
+        try:
+            self._load(key, load, previous)
+            stat = "refreshes"
+        except Exception:
+            logger.exception("Background refresh of %r failed", key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+                self.stats[stat] += 1
@@ -0,0 +1,119 @@
+import gzip
+import io
+import lzma
+import tempfile
+import zlib
+
+# Streaming compression keeps this much of its output in memory before
+# the temporary file moves to disk.
+SPOOL_MEMORY = 1024 * 1024
+
+
+def body_chunks(body):
+    """Return `body` as a list of chunks.
+
+    A body is either bytes-like or a list of bytes-like chunks, such as the
+    archive header followed by a memoryview of the SMTP DATA buffer.
+    """
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return [body]
+    return list(body)
+
+
+def body_size(body):
+    return sum(memoryview(chunk).nbytes for chunk in body_chunks(body))
+
+
+def join_body(body):
+    if isinstance(body, bytes):
+        return body
+    return b"".join(body_chunks(body))
+
+
+class ChunkReader(io.RawIOBase):
+    """Seekable file object over a list of chunks, so they need not be joined."""
+
+    def __init__(self, chunks):
+        self.chunks = [memoryview(chunk).cast("B") for chunk in chunks]
+        self.size = sum(len(chunk) for chunk in self.chunks)
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def readinto(self, b):
+        out = memoryview(b).cast("B")
+        n = 0
+        start = 0
+        for chunk in self.chunks:
+            end = start + len(chunk)
+            if self.pos < end and n < len(out):
+                piece = chunk[self.pos - start : self.pos - start + len(out) - n]
+                out[n : n + len(piece)] = piece
+                n += len(piece)
+                self.pos += len(piece)
+            start = end
+        return n
+
+
+# codec name -> (compressor factory, decompress); the codec used for an
+# object is recorded in its "codec" metadata, so objects without it are
+# plain .eml.
+CODECS = {
+    "gzip": (lambda: zlib.compressobj(6, zlib.DEFLATED, 31), gzip.decompress),
+    "lzma": (lzma.LZMACompressor, lzma.decompress),
+}
+
+
+def compress(body, codec):
+    """Return (stored body, codec); codec is None if compressing did not help."""
+    if codec is None:
+        return body, None
+    compressor = CODECS[codec][0]()
+    parts = [compressor.compress(chunk) for chunk in body_chunks(body)]
+    parts.append(compressor.flush())
+    compressed = b"".join(parts)
+    if len(compressed) >= body_size(body):
+        return body, None
+    return compressed, codec
+
+
+def compress_file(fileobj, codec, size):
+    """Compress `fileobj` into a temporary file, reading it block by block.
+
+    Return (file, codec) positioned at the start; like compress, fall back
+    to `fileobj` itself if compressing did not help.
+    """
+    if codec is None:
+        return fileobj, None
+    compressor = CODECS[codec][0]()
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)
+    for block in iter(lambda: fileobj.read(SPOOL_MEMORY), b""):
+        out.write(compressor.compress(block))
+    out.write(compressor.flush())
+    fileobj.seek(0)
+    if out.tell() >= size:
+        out.close()
+        return fileobj, None
+    out.seek(0)
+    return out, codec
+
+
+def decompress(body, codec):
+    if not codec:
+        return body
+    return CODECS[codec][1](body)
@@ -19,3 +19,112 @@ DJANGO_MONITORING_API_TOKEN = "change-this-token"
 DATMAIL_CONTROL_HOST = "0.0.0.0"
 DATMAIL_CONTROL_PORT = 9001
 DATMAIL_CONTROL_TOKEN = "change-this-token"
+# Maximum number of control requests handled at once
+DATMAIL_CONTROL_THREADS = 8
+
+# Mailing-list responses from Django are cached for DJANGO_API_CACHE_TTL
+# seconds and served stale for up to DJANGO_API_CACHE_STALE_TTL more seconds
+# while being refreshed in the background. Set DJANGO_API_CACHE_SIZE = 0
+# to disable the cache.
+DJANGO_API_CACHE_TTL = 60
+DJANGO_API_CACHE_STALE_TTL = 600
+DJANGO_API_CACHE_SIZE = 256
+
+# Seconds between background refreshes of the spam filter rules.
+SPAMFILTER_REFRESH_INTERVAL = 300
+
+# Number of envelopes processed concurrently in `python -m datmail --executor`.
+ASYNC_WORKERS = 16
+
+# Archive uploads to S3 go through a write-behind queue. Messages that do
+# not fit in the queue, or that cannot be uploaded, are spooled to
+# ARCHIVE_SPOOL_DIR and replayed every ARCHIVE_REPLAY_INTERVAL seconds.
+ARCHIVE_QUEUE_SIZE = 1000
+ARCHIVE_WORKERS = 4
+ARCHIVE_SPOOL_DIR = "spool/archive"
+ARCHIVE_REPLAY_INTERVAL = 60
+
+# Monitoring reports to Django are journaled to REPORT_OUTBOX_PATH and sent
+# in batches of up to REPORT_BATCH_SIZE every REPORT_FLUSH_INTERVAL seconds,
+# backing off up to REPORT_MAX_BACKOFF seconds while Django is down.
+# Set REPORT_OUTBOX_PATH = None to report each mail synchronously instead.
+REPORT_OUTBOX_PATH = "spool/outbox.jsonl"
+REPORT_BATCH_SIZE = 100
+REPORT_FLUSH_INTERVAL = 2
+REPORT_MAX_BACKOFF = 300
+# Reports Django rejects with a 4xx response are appended here and dropped.
+REPORT_DEAD_LETTER_PATH = "spool/outbox-dead.jsonl"
+
+# Django API requests share a keep-alive pool of DJANGO_API_POOL_SIZE
+# connections. An endpoint that fails DJANGO_API_BREAKER_THRESHOLD times in
+# a row is skipped for DJANGO_API_BREAKER_RESET seconds.
+DJANGO_API_POOL_SIZE = 10
+DJANGO_API_BREAKER_THRESHOLD = 5
+DJANGO_API_BREAKER_RESET = 30
+
+# Set DIRECTORY_SNAPSHOT_PATH (e.g. "spool/directory.json") to answer all
+# mailing-list and spam filter lookups from a local snapshot, which is
+# synced with Django every DIRECTORY_SYNC_INTERVAL seconds.
+DIRECTORY_SNAPSHOT_PATH = None
+DIRECTORY_SYNC_INTERVAL = 60
+
+# Names that are not mailing lists are remembered for DJANGO_API_NEGATIVE_TTL
+# seconds (up to DJANGO_API_NEGATIVE_SIZE names), and a Bloom filter of all
+# list names is refreshed every LIST_NAMES_REFRESH_INTERVAL seconds (0 to
+# disable). Only every UNKNOWN_ALIAS_LOG_SAMPLE'th unknown alias is logged.
+DJANGO_API_NEGATIVE_TTL = 300
+DJANGO_API_NEGATIVE_SIZE = 4096
+LIST_NAMES_REFRESH_INTERVAL = 60
+UNKNOWN_ALIAS_LOG_SAMPLE = 100
+
+# Compress archived messages with "gzip" or "lzma" (None to store plain .eml).
+# See benchmark_archive.py for the trade-off on your own mail.
+ARCHIVE_COMPRESSION = None
+
+# Archived messages of ARCHIVE_MULTIPART_THRESHOLD bytes or more are spooled
+# to disk and uploaded as a multipart upload of ARCHIVE_MULTIPART_CHUNKSIZE
+# parts, ARCHIVE_MULTIPART_CONCURRENCY at a time.
+ARCHIVE_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+ARCHIVE_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+ARCHIVE_MULTIPART_CONCURRENCY = 4
+
+# Set ARCHIVE_SEGMENTS = True to pack archived messages into segment objects
+# (one per ARCHIVE_SEGMENT_WINDOW seconds or ARCHIVE_SEGMENT_SIZE bytes)
+# instead of one S3 object per message. The segments and the index that
+# maps archive/{uuid}.eml to them are kept in ARCHIVE_SEGMENT_DIR.
+ARCHIVE_SEGMENTS = False
+ARCHIVE_SEGMENT_DIR = "spool/segments"
+ARCHIVE_SEGMENT_WINDOW = 300
+ARCHIVE_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# SQLite index of archived mail, searchable with GET /control/mail
+# (None to disable).
+MAIL_INDEX_PATH = "spool/mailindex.sqlite3"
+
+# Recently archived and fetched messages are cached in ARCHIVE_CACHE_DIR,
+# up to ARCHIVE_CACHE_SIZE bytes (0 to disable), for resends.
+ARCHIVE_CACHE_DIR = "spool/cache"
+ARCHIVE_CACHE_SIZE = 256 * 1024 * 1024
+
+# Resend requests are queued as jobs in RESEND_JOB_PATH and run by
+# RESEND_JOB_WORKERS threads, each resending up to RESEND_WORKERS archived
+# messages in parallel. Finished jobs are kept for RESEND_JOB_RETENTION seconds.
+RESEND_WORKERS = 4
+RESEND_JOB_PATH = "spool/resend-jobs.jsonl"
+RESEND_JOB_WORKERS = 1
+RESEND_JOB_QUEUE_SIZE = 1000
+RESEND_JOB_RETENTION = 24 * 60 * 60
+
+# Cache of parsed failure reports used by python -m datmail.monitor.
+MONITOR_INDEX_PATH = "error/.monitor-index.json"
+
+# Failed and rejected envelopes are appended to a segmented journal in
+# FAILURE_JOURNAL_DIR, fsynced every FAILURE_JOURNAL_FSYNC_INTERVAL seconds.
+# Set FAILURE_LOG_FORMAT = "files" for one error/*.json + *.txt per failure.
+FAILURE_LOG_FORMAT = "journal"
+FAILURE_JOURNAL_DIR = "error/journal"
+FAILURE_JOURNAL_SEGMENT_SIZE = 16 * 1024 * 1024
+FAILURE_JOURNAL_FSYNC_INTERVAL = 1
+
+# Date-sharded archive of reports handled by python -m datmail.monitor.
+ERROR_ARCHIVE_DIR = "errorarchive"
@@ -1,5 +1,8 @@
 import json
 import logging
+import queue
+import threading
+import urllib.parse
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 try:
@@ -7,13 +10,131 @@ try:
 except ImportError:
     logger = logging.getLogger(__name__)
 
+try:
+    from datmail.config import DATMAIL_CONTROL_THREADS
+except ImportError:
+    DATMAIL_CONTROL_THREADS = 8
+
+
+# GET /control/mail query parameter -> MailIndex.query argument
+QUERY_FILTERS = {
+    "list": "mailing_list",
+    "sender": "sender",
+    "target": "target",
+    "since": "since",
+    "until": "until",
+    "status": "status",
+    "message_id": "message_id",
+    "limit": "limit",
+}
+
+
+def parse_bulk_resend_items(payload):
+    """Validate a bulk resend payload; return one item per target."""
+    items = []
+    for item in payload["items"]:
+        targets = item["targets"] if "targets" in item else [item["target"]]
+        fields = [item["request_uuid"], item["sender"], item["original_target"]]
+        if not isinstance(targets, list):
+            raise TypeError("targets must be a list")
+        for value in fields + targets:
+            if not isinstance(value, str):
+                raise TypeError("Expected a string, got %r" % (value,))
+        for target in targets:
+            items.append(
+                {
+                    "request_uuid": item["request_uuid"],
+                    "target": target,
+                    "sender": item["sender"],
+                    "original_target": item["original_target"],
+                }
+            )
+    return items
+
+
+class BoundedThreadingHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that handles at most `max_threads` requests at once.
+
+    Further connections wait in the listen backlog, so a burst of control
+    requests cannot spawn an unbounded number of threads.
+    """
+
+    daemon_threads = True
 
-def create_control_server(forwarder, token, host, port):
+    def __init__(self, server_address, handler_class, max_threads):
+        super().__init__(server_address, handler_class)
+        self._slots = threading.BoundedSemaphore(max_threads)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+
+def create_control_server(
+    forwarder, token, host, port, max_threads=DATMAIL_CONTROL_THREADS
+):
     class ControlHandler(BaseHTTPRequestHandler):
         server_version = "DatmailControl/1.0"
 
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            is_job = url.path.startswith("/control/jobs/")
+            if url.path not in ("/control/stats", "/control/mail") and not is_job:
+                self.send_error(404)
+                return
+
+            if self.headers.get("Authorization") != f"Bearer {token}":
+                self.send_error(401)
+                return
+
+            if url.path == "/control/mail":
+                self.query_mail(urllib.parse.parse_qs(url.query))
+                return
+
+            if is_job:
+                job = forwarder.get_resend_job(url.path[len("/control/jobs/") :])
+                if job is None:
+                    self.send_error(404, "Unknown job")
+                else:
+                    self.send_json(200, job)
+                return
+
+            self.send_json(200, forwarder.get_stats())
+
+        def query_mail(self, query):
+            """Search archived mail, e.g. ?list=best&sender=anders&since=2026-10-13"""
+            filters = {}
+            for param, name in QUERY_FILTERS.items():
+                if param in query:
+                    filters[name] = query[param][-1]
+            try:
+                mail = forwarder.query_mail(**filters)
+            except LookupError:
+                self.send_error(404, "Mail index disabled")
+                return
+            except ValueError:
+                self.send_error(400)
+                return
+            self.send_json(200, {"mail": mail})
+
+        def send_json(self, status, payload):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps(payload).encode("utf-8"))
+
         def do_POST(self):
-            if self.path != "/control/resend":
+            if self.path not in ("/control/resend", "/control/resend/bulk"):
                 self.send_error(404)
                 return
 
@@ -24,26 +145,27 @@ def create_control_server(forwarder, token, host, port):
             try:
                 content_length = int(self.headers.get("Content-Length", "0"))
                 payload = json.loads(self.rfile.read(content_length))
-                forwarder.resend_archived_mail(
-                    request_uuid=payload["request_uuid"],
-                    target=payload["target"],
-                    sender=payload["sender"],
-                    original_target=payload["original_target"],
-                )
+                if self.path == "/control/resend/bulk":
+                    items = parse_bulk_resend_items(payload)
+                else:
+                    items = parse_bulk_resend_items({"items": [payload]})
             except (KeyError, ValueError, TypeError):
                 self.send_error(400)
                 return
+
+            try:
+                job = forwarder.submit_resend(items)
+            except queue.Full:
+                self.send_error(503, "Too many queued resend jobs")
+                return
             except Exception:
-                logger.exception("Failed to resend archived mail")
+                logger.exception("Failed to queue resend of archived mail")
                 self.send_error(502)
                 return
 
-            self.send_response(202)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "queued"}).encode("utf-8"))
+            self.send_json(202, {"status": "queued", "job_id": job["id"]})
 
         def log_message(self, format, *args):
             return
 
-    return ThreadingHTTPServer((host, port), ControlHandler)
+    return BoundedThreadingHTTPServer((host, port), ControlHandler, max_threads)
@@ -2,8 +2,11 @@ import os
 import re
 import email
 import collections
+import concurrent.futures
 import itertools
 
+from datmail.errorarchive import ErrorArchive
+
 
 # Spammers cause many bogus/invalid DSNs to be sent around.
 # Only trust DSNs from our local postmasters (REPORT_FROM)
@@ -20,7 +23,7 @@ HEADER_PATTERN = (
     r'List-Id: .*%s' % re.escape('.fredagscafeen.dk') +
     r'|Received: from %s\s+' % re.escape('172.18.0.2') +
     r'by %s' % re.escape('emailtunnel.local'))
-HEADER_PATTERN_BYTES = HEADER_PATTERN.encode('ascii')
+HEADER_RE = re.compile(HEADER_PATTERN)
 
 
 class ReportParseError(Exception):
@@ -303,6 +306,25 @@ def notification_from_report(report):
         for message, recipients in n.items())
 
 
+def has_header_marker(message):
+    '''
+    Whether a header of `message` or of any part in it matches HEADER_PATTERN.
+
+    Only the header blocks are searched (and the payload of
+    text/rfc822-headers parts, which is a header block), so a bounce with
+    large attachments is not serialized just to look for the marker.
+    '''
+    for part in message.walk():
+        for name, value in part.items():
+            if HEADER_RE.search('%s: %s' % (name, value)):
+                return True
+        if part.get_content_type() == 'text/rfc822-headers':
+            payload = part.get_payload()
+            if isinstance(payload, str) and HEADER_RE.search(payload):
+                return True
+    return False
+
+
 def parse_delivery_report(message):
     # https://tools.ietf.org/html/rfc3464#section-2
     if message.get_content_type() != 'multipart/report':
@@ -314,7 +336,7 @@ def parse_delivery_report(message):
     # Only trust DSNs from our local postmasters (REPORT_FROM)
     # or DSNs containing a magic marker (HEADER_PATTERN regex).
     if message.get('From') not in REPORT_FROM:
-        if not re.search(HEADER_PATTERN_BYTES, message.as_bytes()):
+        if not has_header_marker(message):
             # Probably not legitimate
             return
 
@@ -356,21 +378,28 @@ def parse_delivery_report(message):
     return EmailDeliveryReport(notification, undelivered_message, recipients)
 
 
-def email_delivery_reports():
-    # Helper function to parse all reports in the "errorarchive" directory
-    # in the repository.
+def repo_error_archive():
+    # The "errorarchive" directory in the repository.
     repo_root = os.path.dirname(os.path.dirname(
         os.path.abspath(__file__)))
-    path = os.path.join(repo_root, 'errorarchive')
-    for filename in sorted(os.listdir(path)):
-        base, ext = os.path.splitext(filename)
-        if ext != '.mail':
-            continue
-        filepath = os.path.join(path, filename)
-        with open(filepath, 'rb') as fp:
-            message = email.message_from_binary_file(fp)
+    return ErrorArchive(os.path.join(repo_root, 'errorarchive'))
+
+
+def parse_report_file(filepath):
+    with open(filepath, 'rb') as fp:
+        message = email.message_from_binary_file(fp)
+    return parse_delivery_report(message)
+
+
+def email_delivery_reports(since=None, until=None, archive=None):
+    # Helper function to parse all reports in the "errorarchive" directory
+    # in the repository, optionally only those stored between the ISO
+    # dates `since` and `until` (inclusive).
+    if archive is None:
+        archive = repo_error_archive()
+    for base, filepath in archive.paths('mail', since, until):
         try:
-            parsed = parse_delivery_report(message)
+            parsed = parse_report_file(filepath)
         except ReportParseError as exn:
             print(base, exn)
             continue
@@ -380,3 +409,69 @@ def email_delivery_reports():
 
         if parsed:
             yield base, parsed
+
+
+def parse_report_files(chunk):
+    # Runs in a worker process of parallel_email_delivery_reports.
+    results = []
+    for base, filepath in chunk:
+        try:
+            results.append((base, parse_report_file(filepath), None))
+        except Exception as exn:
+            results.append((base, None, exn))
+    chunk_stats = dict(stats)
+    stats.clear()
+    return results, chunk_stats
+
+
+def parallel_email_delivery_reports(since=None, until=None, archive=None,
+                                    workers=None, ordered=True, chunksize=32):
+    '''
+    Like email_delivery_reports, but parse the files in `workers` processes.
+
+    Files are parsed in chunks of `chunksize`, and at most two chunks per
+    worker are in flight at a time, so memory use does not grow with the
+    size of the archive. With ordered=False, the reports of each chunk are
+    yielded as soon as it has been parsed.
+    '''
+    if archive is None:
+        archive = repo_error_archive()
+    workers = workers or os.cpu_count() or 1
+    paths = archive.paths('mail', since, until)
+    chunks = iter(lambda: list(itertools.islice(paths, chunksize)), [])
+    pending = collections.deque()
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        def submit():
+            chunk = next(chunks, None)
+            if chunk:
+                pending.append(executor.submit(parse_report_files, chunk))
+
+        try:
+            for i in range(2 * workers):
+                submit()
+            while pending:
+                if ordered:
+                    future = pending.popleft()
+                else:
+                    done, _ = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    future = done.pop()
+                    pending.remove(future)
+                results, chunk_stats = future.result()
+                submit()
+                stats.update(chunk_stats)
+                for base, parsed, exn in results:
+                    if isinstance(exn, ReportParseError):
+                        print(base, exn)
+                        continue
+                    elif exn is not None:
+                        print(base, exn)
+                        raise exn
+                    if parsed:
+                        yield base, parsed
+        finally:
+            # Do not parse the rest if the caller stops early
+            for future in pending:
+                future.cancel()
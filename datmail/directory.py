@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+
+from emailtunnel import logger
+
+from datmail.cache import CacheEntry
+
+try:
+    from datmail.config import DIRECTORY_SNAPSHOT_PATH, DIRECTORY_SYNC_INTERVAL
+except ImportError:
+    DIRECTORY_SNAPSHOT_PATH = None
+    DIRECTORY_SYNC_INTERVAL = 60
+
+
+class DirectorySnapshot:
+    """Local copy of all mailing lists and the spam filter.
+
+    Attach to a DjangoAPIClient as `api_client.snapshot`; once the snapshot
+    is ready, mailing-list lookups and the spam filter are answered from
+    memory only, and lists missing from the snapshot do not exist.
+
+    The snapshot is persisted to `path`, so a restart is ready immediately,
+    and is kept fresh by `sync`, which runs every `sync_interval` seconds:
+    it fetches the list index and only refetches a list when its
+    "updated_at" in the index changed, or, without "updated_at", when
+    Django does not answer its If-None-Match revalidation with 304.
+    """
+
+    def __init__(
+        self,
+        api_client,
+        path=DIRECTORY_SNAPSHOT_PATH,
+        sync_interval=DIRECTORY_SYNC_INTERVAL,
+    ):
+        self.api_client = api_client
+        self.path = path
+        self.sync_interval = sync_interval
+        self.lists = {}
+        self.versions = {}
+        self.spamfilter = None
+        self.synced_at = None
+        self.ready = False
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def get_mailinglist_info(self, list_name):
+        # List names are case-insensitive, like the local part of an address
+        return self.lists.get(list_name.lower())
+
+    def start(self):
+        try:
+            self.load()
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.exception("Could not load directory snapshot %s", self.path)
+        if not self.ready:
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Initial directory sync failed")
+        self._thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def load(self):
+        with open(self.path) as fp:
+            data = json.load(fp)
+        # Snapshots saved before names were lowercased may have mixed case
+        self.lists = {k.lower(): v for k, v in data["lists"].items()}
+        self.versions = {k.lower(): v for k, v in data["versions"].items()}
+        self.spamfilter = data["spamfilter"]
+        self.synced_at = data["synced_at"]
+        self.ready = True
+
+    def save(self):
+        data = {
+            "lists": self.lists,
+            "versions": self.versions,
+            "spamfilter": self.spamfilter,
+            "synced_at": self.synced_at,
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump(data, fp)
+        os.replace(tmp, self.path)
+
+    def sync(self):
+        """Bring the snapshot up to date; return the number of changed lists."""
+        index = self.api_client.get_mailinglist_names()
+        lists = {}
+        versions = {}
+        changed = 0
+        for entry in index:
+            name = entry["name"].lower()
+            version = self.versions.get(name)
+            updated_at = entry.get("updated_at")
+            if name in self.lists and updated_at and updated_at == version:
+                lists[name] = self.lists[name]
+                versions[name] = version
+                continue
+            previous = None
+            if name in self.lists and version and not updated_at:
+                previous = CacheEntry(self.lists[name], version, None)
+            info, etag = self.api_client.fetch_mailinglist_info(entry["name"], previous)
+            lists[name] = info
+            versions[name] = updated_at or etag
+            if previous is None or info is not previous.value:
+                changed += 1
+        changed += len(set(self.lists) - set(lists))
+
+        spamfilter = self.api_client.fetch_spamfilter_entries()
+        if changed or spamfilter != self.spamfilter or not self.ready:
+            self.lists = lists
+            self.versions = versions
+            self.spamfilter = spamfilter
+            self.synced_at = time.time()
+            if self.path:
+                self.save()
+        self.ready = True
+        return changed
+
+    def _sync_loop(self):
+        while not self._stopped.wait(self.sync_interval):
+            try:
+                changed = self.sync()
+            except Exception:
+                logger.exception("Directory sync failed; keeping the old snapshot")
+            else:
+                if changed:
+                    logger.info("Directory sync updated %s list(s)", changed)
@@ -0,0 +1,94 @@
+import collections
+import os
+import threading
+import urllib.parse
+
+from emailtunnel import logger
+
+from datmail.chunks import body_chunks, body_size
+
+try:
+    from datmail.config import ARCHIVE_CACHE_DIR, ARCHIVE_CACHE_SIZE
+except ImportError:
+    ARCHIVE_CACHE_DIR = "spool/cache"
+    ARCHIVE_CACHE_SIZE = 256 * 1024 * 1024
+
+
+class DiskCache:
+    """Size-bounded LRU cache of archived objects on local disk.
+
+    Holds recently archived and recently fetched messages, so resending
+    the same message several times only downloads it once. The least
+    recently used files are deleted once the cache exceeds `max_bytes`.
+    Access order survives a restart through the files' mtimes.
+    """
+
+    def __init__(self, directory=ARCHIVE_CACHE_DIR, max_bytes=ARCHIVE_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = collections.Counter()
+        self._files = collections.OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            if filename.endswith(".tmp"):
+                os.unlink(path)
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, filename, st.st_size))
+        for mtime, filename, size in sorted(entries):
+            self._files[filename] = size
+            self.size += size
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def get(self, object_name):
+        filename = urllib.parse.quote(object_name, safe="")
+        try:
+            with open(self._path(filename), "rb") as fp:
+                body = fp.read()
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            return None
+        with self._lock:
+            if filename in self._files:
+                self._files.move_to_end(filename)
+            self.stats["hits"] += 1
+        try:
+            os.utime(self._path(filename))
+        except FileNotFoundError:
+            pass  # Evicted meanwhile; we already have the body
+        return body
+
+    def put(self, object_name, body):
+        size = body_size(body)
+        if size > self.max_bytes:
+            return
+        filename = urllib.parse.quote(object_name, safe="")
+        path = self._path(filename)
+        try:
+            with open(path + ".tmp", "wb") as fp:
+                for chunk in body_chunks(body):
+                    fp.write(chunk)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            logger.exception("Could not cache %s", object_name)
+            return
+        with self._lock:
+            self.size += size - self._files.pop(filename, 0)
+            self._files[filename] = size
+            while self.size > self.max_bytes:
+                victim, victim_size = self._files.popitem(last=False)
+                self.size -= victim_size
+                self.stats["evictions"] += 1
+                try:
+                    os.unlink(self._path(victim))
+                except FileNotFoundError:
+                    pass
+
+    def metrics(self):
+        return dict(self.stats, size=self.size, files=len(self._files))
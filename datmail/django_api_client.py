@@ -1,17 +1,185 @@
+import collections
+import threading
+import time
+
 import requests
 
+from datmail.cache import TTLCache
+from datmail.mailinglist import MailingList, rebuild_member_index
+
 try:
     from datmail.config import DJANGO_API_URL, DJANGO_API_TOKEN
 except ImportError:
     DJANGO_API_URL = None
     DJANGO_API_TOKEN = None
 
+try:
+    from datmail.config import (
+        DJANGO_API_CACHE_TTL,
+        DJANGO_API_CACHE_STALE_TTL,
+        DJANGO_API_CACHE_SIZE,
+    )
+except ImportError:
+    DJANGO_API_CACHE_TTL = 60
+    DJANGO_API_CACHE_STALE_TTL = 600
+    DJANGO_API_CACHE_SIZE = 256
+
+try:
+    from datmail.config import DJANGO_API_NEGATIVE_TTL, DJANGO_API_NEGATIVE_SIZE
+except ImportError:
+    DJANGO_API_NEGATIVE_TTL = 300
+    DJANGO_API_NEGATIVE_SIZE = 4096
+
+try:
+    from datmail.config import (
+        DJANGO_API_POOL_SIZE,
+        DJANGO_API_BREAKER_THRESHOLD,
+        DJANGO_API_BREAKER_RESET,
+    )
+except ImportError:
+    DJANGO_API_POOL_SIZE = 10
+    DJANGO_API_BREAKER_THRESHOLD = 5
+    DJANGO_API_BREAKER_RESET = 30
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Fail fast after `threshold` consecutive failures of an endpoint.
+
+    While open, calls raise CircuitOpenError immediately instead of waiting
+    for a timeout. After `reset_timeout` seconds a single trial call is let
+    through; its outcome closes the circuit again or keeps it open.
+    """
+
+    def __init__(self, threshold, reset_timeout, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self, name):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return
+        raise CircuitOpenError("Django API endpoint %r is unavailable" % name)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+
+EndpointStats = collections.namedtuple(
+    "EndpointStats", "calls failures rejected total_latency max_latency"
+)
+
+
+class Endpoint:
+    def __init__(self, name):
+        self.name = name
+        self.breaker = CircuitBreaker(
+            DJANGO_API_BREAKER_THRESHOLD, DJANGO_API_BREAKER_RESET
+        )
+        self.stats = EndpointStats(0, 0, 0, 0.0, 0.0)
+        self._lock = threading.Lock()
+
+    def record(self, latency=None, failed=False, rejected=False):
+        with self._lock:
+            s = self.stats
+            if rejected:
+                self.stats = s._replace(rejected=s.rejected + 1)
+                return
+            self.stats = s._replace(
+                calls=s.calls + 1,
+                failures=s.failures + failed,
+                total_latency=s.total_latency + latency,
+                max_latency=max(s.max_latency, latency),
+            )
+
+    def as_dict(self):
+        s = self.stats
+        return {
+            "state": self.breaker.state,
+            "calls": s.calls,
+            "failures": s.failures,
+            "rejected": s.rejected,
+            "avg_latency": s.total_latency / s.calls if s.calls else None,
+            "max_latency": s.max_latency,
+        }
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide requests.Session with a keep-alive pool."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=DJANGO_API_POOL_SIZE,
+            )
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
 class DjangoAPIClient:
     def __init__(self):
         if not DJANGO_API_URL or not DJANGO_API_TOKEN:
             raise ValueError("DJANGO_API_URL and DJANGO_API_TOKEN must be set in config")
         self.base_url = DJANGO_API_URL.rstrip("/")
         self.token = DJANGO_API_TOKEN
+        # Mailing lists are looked up several times per envelope,
+        # so keep recent responses around instead of asking Django every time.
+        self.list_cache = TTLCache(
+            ttl=DJANGO_API_CACHE_TTL,
+            stale_ttl=DJANGO_API_CACHE_STALE_TTL,
+            max_entries=DJANGO_API_CACHE_SIZE,
+        )
+        # Names Django answered 404 for; dictionary spam to random local
+        # parts would otherwise cost one request per recipient.
+        self.missing_lists = TTLCache(
+            ttl=DJANGO_API_NEGATIVE_TTL, max_entries=DJANGO_API_NEGATIVE_SIZE
+        )
+        # Set to a ListNameFilter to skip names that are certainly not lists
+        self.list_names = None
+        # list name -> MailingList compiled from the current list info
+        self.compiled_lists = {}
+        self.bulk_upsert_supported = True
+        # Set to a DirectorySnapshot to serve lists and the spam filter locally
+        self.snapshot = None
+        self.endpoints = {}
+        self._endpoints_lock = threading.Lock()
 
     def _headers(self):
         return {
@@ -19,8 +187,49 @@ class DjangoAPIClient:
             "Content-Type": "application/json",
         }
 
+    def _endpoint(self, name):
+        with self._endpoints_lock:
+            endpoint = self.endpoints.get(name)
+            if endpoint is None:
+                endpoint = self.endpoints[name] = Endpoint(name)
+            return endpoint
+
+    def _request(self, endpoint_name, method, url, **kwargs):
+        """Send a request on the shared session through the endpoint's breaker.
+
+        Connection errors, timeouts and 5xx responses count as failures;
+        any other response means the endpoint is up.
+        """
+        endpoint = self._endpoint(endpoint_name)
+        try:
+            endpoint.breaker.before_call(endpoint_name)
+        except CircuitOpenError:
+            endpoint.record(rejected=True)
+            raise
+        t = time.monotonic()
+        try:
+            r = getattr(get_session(), method)(url, **kwargs)
+        except Exception:
+            endpoint.breaker.record_failure()
+            endpoint.record(time.monotonic() - t, failed=True)
+            raise
+        failed = r.status_code >= 500
+        if failed:
+            endpoint.breaker.record_failure()
+        else:
+            endpoint.breaker.record_success()
+        endpoint.record(time.monotonic() - t, failed=failed)
+        return r
+
+    def endpoint_stats(self):
+        with self._endpoints_lock:
+            endpoints = list(self.endpoints.values())
+        return {e.name: e.as_dict() for e in endpoints}
+
     def upsert_incoming_mail(self, payload):
-        r = requests.post(
+        r = self._request(
+            "incoming-mails",
+            "post",
             f"{self.base_url}/monitoring/incoming-mails/",
             json=payload,
             headers=self._headers(),
@@ -30,17 +239,32 @@ class DjangoAPIClient:
 
         return r
 
+    def upsert_incoming_mails(self, payloads):
+        """Upsert several monitoring reports, in one request if Django supports it."""
+        if self.bulk_upsert_supported:
+            r = self._request(
+                "incoming-mails/bulk",
+                "post",
+                f"{self.base_url}/monitoring/incoming-mails/bulk/",
+                json=payloads,
+                headers=self._headers(),
+                timeout=5,
+            )
+            if r.status_code not in (404, 405):
+                r.raise_for_status()
+                return r
+            self.bulk_upsert_supported = False
+
+        for payload in payloads:
+            self.upsert_incoming_mail(payload)
+
     def get_admin_emails(self):
         return self.get_mailinglist_members("admin")
     
     def get_mailinglist_members(self, list_name):
-        r = requests.get(
-            f"{self.base_url}/mail/lists/{list_name}/",
-            headers=self._headers(),
-            timeout=5
-        )
-        r.raise_for_status()
-        result_json = r.json()
+        result_json = self.get_mailinglist_info(list_name)
+        if result_json is None:
+            raise ValueError("No such mailing list: %r" % list_name)
 
         members = result_json.get("members", [])
         if not isinstance(members, list):
@@ -55,23 +279,110 @@ class DjangoAPIClient:
         return email_list, ids_list
 
     def get_mailinglist_info(self, list_name):
-        r = requests.get(
-            f"{self.base_url}/mail/lists/{list_name}/",
+        list_name = list_name.lower()
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.ready:
+            return snapshot.get_mailinglist_info(list_name)
+        list_names = self.list_names
+        if list_names is not None and not list_names.might_exist(list_name):
+            self.missing_lists.count("filtered")
+            return None
+        if self.missing_lists.contains(list_name):
+            return None
+        list_info = self.list_cache.get(list_name, self.fetch_mailinglist_info)
+        if list_info is None:
+            self.list_cache.invalidate(list_name)
+            self.missing_lists.put(list_name, True)
+        return list_info
+
+    def get_mailinglist(self, list_name):
+        """Return `list_name` as a MailingList, or None if there is no such list.
+
+        The list is only recompiled when the cache or snapshot hands out a
+        new version of its info.
+        """
+        list_name = list_name.lower()
+        list_info = self.get_mailinglist_info(list_name)
+        if list_info is None:
+            self.compiled_lists.pop(list_name, None)
+            return None
+        mailing_list = self.compiled_lists.get(list_name)
+        if mailing_list is None or mailing_list.info is not list_info:
+            self.compiled_lists.pop(list_name, None)
+            # Start over when the member index is mostly former members
+            live = sum(len(m.emails) for m in list(self.compiled_lists.values()))
+            rebuild_member_index(live + len(list_info.get("members") or []))
+            mailing_list = MailingList(list_info)
+            self.compiled_lists[list_name] = mailing_list
+        return mailing_list
+
+    def get_mailinglist_names(self):
+        """Return the index of all mailing lists as a list of dicts.
+
+        Each entry has at least a "name"; an "updated_at" is used by
+        DirectorySnapshot to skip lists that have not changed.
+        """
+        r = self._request(
+            "lists",
+            "get",
+            f"{self.base_url}/mail/lists/",
             headers=self._headers(),
             timeout=5
         )
         r.raise_for_status()
-        return r.json()
+        result_json = r.json()
+        if not isinstance(result_json, list):
+            raise ValueError("Expected mailing list index to be a list")
+        return [
+            entry if isinstance(entry, dict) else {"name": entry}
+            for entry in result_json
+        ]
+
+    def fetch_mailinglist_info(self, list_name, previous=None):
+        headers = self._headers()
+        if previous is not None and previous.etag:
+            headers["If-None-Match"] = previous.etag
+        r = self._request(
+            "lists",
+            "get",
+            f"{self.base_url}/mail/lists/{list_name}/",
+            headers=headers,
+            timeout=5
+        )
+        if r.status_code == 304 and previous is not None:
+            return previous.value, previous.etag
+        if r.status_code == 404:
+            return None, None
+        r.raise_for_status()
+        return r.json(), r.headers.get("ETag")
+
+    def cache_stats(self):
+        return dict(
+            self.list_cache.stats,
+            size=len(self.list_cache),
+            negative=dict(self.missing_lists.stats, size=len(self.missing_lists)),
+        )
 
     def get_spamfilter(self):
-        r = requests.get(
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.ready:
+            result_json = snapshot.spamfilter
+        else:
+            result_json = self.fetch_spamfilter_entries()
+        return self.parse_spamfilter(result_json)
+
+    def fetch_spamfilter_entries(self):
+        r = self._request(
+            "spamfilter",
+            "get",
             f"{self.base_url}/mail/spamfilter/",
             headers=self._headers(),
             timeout=5
         )
         r.raise_for_status()
-        result_json = r.json()
+        return r.json()
 
+    def parse_spamfilter(self, result_json):
         if not isinstance(result_json, list):
             raise ValueError("Expected spam filter to be a list")
 
@@ -90,3 +401,20 @@ class DjangoAPIClient:
                 allowed_domains.append(domain)
 
         return allowed_domains, blocked_domains
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def get_shared_client():
+    """Return the process-wide DjangoAPIClient, creating it on first use.
+
+    Sharing one client means sharing its mailing-list cache between the
+    forwarder's policy checks and recipient expansion in datmail.address.
+    """
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = DjangoAPIClient()
+        return _shared_client
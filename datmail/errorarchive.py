@@ -0,0 +1,142 @@
+import datetime
+import json
+import os
+import re
+import sys
+
+try:
+    from datmail.config import ERROR_ARCHIVE_DIR
+except ImportError:
+    ERROR_ARCHIVE_DIR = "errorarchive"
+
+EXTENSIONS = ("txt", "json", "mail")
+
+SHARD_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def shard_for(basename, mtime):
+    """The date shard of a report: the date in its name, else of its mtime.
+
+    >>> shard_for("2026-10-13_12-00-00.000001", 0)
+    '2026-10-13'
+    """
+    if SHARD_PATTERN.match(basename[:10]):
+        return basename[:10]
+    return datetime.date.fromtimestamp(mtime).isoformat()
+
+
+def in_range(shard, since=None, until=None):
+    """Whether `shard` is in [since, until]; both are ISO dates or None."""
+    return (since is None or shard >= str(since)) and (
+        until is None or shard <= str(until)
+    )
+
+
+class ErrorArchive:
+    """Date-sharded archive of handled failure reports.
+
+    Reports are moved into errorarchive/YYYY-MM-DD/ by the date they were
+    stored, and each shard has a manifest.jsonl with the basename, total
+    size, mtime and summary of every report in it. Analyses read the
+    manifests, or the files of just the shards in a date range, instead of
+    listing one huge directory.
+    """
+
+    def __init__(self, directory=ERROR_ARCHIVE_DIR):
+        self.directory = directory
+
+    def _shard_path(self, shard):
+        return os.path.join(self.directory, shard)
+
+    def add(self, source, basename, summary=None):
+        """Move the files of report `basename` from directory `source`."""
+        files = {}
+        for ext in EXTENSIONS:
+            try:
+                files[ext] = os.stat(os.path.join(source, "%s.%s" % (basename, ext)))
+            except FileNotFoundError:
+                pass
+        if not files:
+            raise FileNotFoundError("No files for report %s in %s" % (basename, source))
+        mtime = int(max(st.st_mtime for st in files.values()))
+        shard = shard_for(basename, mtime)
+        os.makedirs(self._shard_path(shard), exist_ok=True)
+        for ext in files:
+            filename = "%s.%s" % (basename, ext)
+            os.rename(
+                os.path.join(source, filename),
+                os.path.join(self._shard_path(shard), filename),
+            )
+        entry = {
+            "basename": basename,
+            "size": sum(st.st_size for st in files.values()),
+            "mtime": mtime,
+            "summary": summary,
+            "files": sorted(files),
+        }
+        with open(os.path.join(self._shard_path(shard), "manifest.jsonl"), "a") as fp:
+            fp.write(json.dumps(entry) + "\n")
+        return shard
+
+    def shards(self, since=None, until=None):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            name
+            for name in names
+            if SHARD_PATTERN.match(name) and in_range(name, since, until)
+        )
+
+    def manifest(self, shard):
+        entries = []
+        try:
+            with open(os.path.join(self._shard_path(shard), "manifest.jsonl")) as fp:
+                for line in fp:
+                    if line.endswith("\n"):
+                        entries.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def entries(self, since=None, until=None):
+        """Yield (shard, manifest entry) of the reports in a date range."""
+        for shard in self.shards(since, until):
+            for entry in self.manifest(shard):
+                yield shard, entry
+
+    def paths(self, ext, since=None, until=None):
+        """Yield (basename, path) of the reports' .`ext` files, in order."""
+        for shard, entry in self.entries(since, until):
+            if ext in entry["files"]:
+                yield entry["basename"], os.path.join(
+                    self._shard_path(shard), "%s.%s" % (entry["basename"], ext)
+                )
+
+    def migrate(self):
+        """Move reports from the old flat layout into shards."""
+        basenames = set()
+        for filename in os.listdir(self.directory):
+            base, ext = os.path.splitext(filename)
+            if ext[1:] in EXTENSIONS and os.path.isfile(
+                os.path.join(self.directory, filename)
+            ):
+                basenames.add(base)
+        for basename in sorted(basenames):
+            try:
+                with open(os.path.join(self.directory, basename + ".json")) as fp:
+                    summary = json.load(fp).get("summary")
+            except (OSError, ValueError, AttributeError):
+                summary = None
+            self.add(self.directory, basename, summary)
+        return len(basenames)
+
+
+def main():
+    archive = ErrorArchive(sys.argv[1] if len(sys.argv) > 1 else ERROR_ARCHIVE_DIR)
+    print("Moved %s report(s) into date shards" % archive.migrate())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import collections
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+
+from emailtunnel import logger
+
+from datmail.errorarchive import ERROR_ARCHIVE_DIR
+
+try:
+    from datmail.config import (
+        FAILURE_LOG_FORMAT,
+        FAILURE_JOURNAL_DIR,
+        FAILURE_JOURNAL_SEGMENT_SIZE,
+        FAILURE_JOURNAL_FSYNC_INTERVAL,
+    )
+except ImportError:
+    FAILURE_LOG_FORMAT = "journal"
+    FAILURE_JOURNAL_DIR = "error/journal"
+    FAILURE_JOURNAL_SEGMENT_SIZE = 16 * 1024 * 1024
+    FAILURE_JOURNAL_FSYNC_INTERVAL = 1
+
+FAILURE_JOURNAL_ARCHIVE_DIR = os.path.join(ERROR_ARCHIVE_DIR, "journal")
+
+IndexEntry = collections.namedtuple("IndexEntry", "segment offset length mtime id")
+
+
+def new_segment_name():
+    # Names sort in the order segments were written; the cursor relies on it
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S.%f")
+
+
+def format_index_line(entry):
+    return "%d %d %d %s\n" % (entry.offset, entry.length, entry.mtime, entry.id)
+
+
+def read_index(directory, segment):
+    """Return the IndexEntry of each complete record in `segment`."""
+    entries = []
+    try:
+        with open(os.path.join(directory, segment + ".idx")) as fp:
+            lines = fp.readlines()
+    except FileNotFoundError:
+        return entries
+    for line in lines:
+        if not line.endswith("\n"):
+            break  # Being written
+        offset, length, mtime, record_id = line.split(" ", 3)
+        entries.append(
+            IndexEntry(segment, int(offset), int(length), int(mtime), record_id[:-1])
+        )
+    return entries
+
+
+class FailureJournal:
+    """Append-only journal of failed and rejected envelopes.
+
+    Replaces the error/*.json and *.txt files written per failure: each
+    record is a JSON line in the current segment file, and the segment's
+    .idx gets a line "offset length mtime id" for it. Writes go to the OS
+    at once but are fsynced in batches every `fsync_interval` seconds by a
+    background thread, so the SMTP path does not wait for the disk.
+    Segments are rotated at `segment_size` bytes, and every start begins
+    a new segment. The monitor reads the journal with FailureJournalReader.
+    """
+
+    def __init__(
+        self,
+        directory=FAILURE_JOURNAL_DIR,
+        segment_size=FAILURE_JOURNAL_SEGMENT_SIZE,
+        fsync_interval=FAILURE_JOURNAL_FSYNC_INTERVAL,
+    ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._segment = None
+        self._file = None
+        self._index = None
+        self._dirty = False
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._repair_indexes()
+        self._thread = threading.Thread(
+            target=self._sync_loop, name="datmail-failures", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._lock:
+            self._close()
+
+    def append(self, record):
+        """Journal the dict `record`; return its ID."""
+        now = time.time()
+        record = dict(record, mtime=int(now))
+        record["id"] = "%s-%s" % (
+            datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d_%H-%M-%S.%f"),
+            uuid.uuid4().hex[:8],
+        )
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.segment_size:
+                self._rotate()
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            # The index line is written last, so readers that go by the
+            # index never see a partly written record.
+            entry = IndexEntry(
+                self._segment, offset, len(line), record["mtime"], record["id"]
+            )
+            self._index.write(format_index_line(entry))
+            self._index.flush()
+            self._dirty = True
+            self.stats["records"] += 1
+        return record["id"]
+
+    def sync(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.fsync(self._file.fileno())
+            os.fsync(self._index.fileno())
+            self._dirty = False
+            self.stats["fsyncs"] += 1
+
+    def metrics(self):
+        return dict(self.stats, segment=self._segment)
+
+    def _rotate(self):
+        # Called with self._lock held
+        self._close()
+        segment = new_segment_name()
+        while self._segment is not None and segment <= self._segment:
+            segment = new_segment_name()
+        self._segment = segment
+        path = os.path.join(self.directory, self._segment)
+        self._file = open(path + ".jsonl", "ab")
+        self._index = open(path + ".idx", "a")
+        self.stats["segments"] += 1
+
+    def _close(self):
+        # Called with self._lock held
+        if self._file is None:
+            return
+        if self._dirty:
+            os.fsync(self._file.fileno())
+            os.fsync(self._index.fileno())
+            self._dirty = False
+        self._file.close()
+        self._index.close()
+        self._file = self._index = None
+
+    def _repair_indexes(self):
+        # A crash between writing a record and its index line leaves the
+        # record unindexed; index the complete lines after the last entry.
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".jsonl"):
+                continue
+            segment = filename[: -len(".jsonl")]
+            entries = read_index(self.directory, segment)
+            end = entries[-1].offset + entries[-1].length if entries else 0
+            path = os.path.join(self.directory, segment)
+            with open(path + ".jsonl", "rb") as fp:
+                fp.seek(end)
+                lines = fp.read().split(b"\n")[:-1]
+            if not lines:
+                continue
+            with open(path + ".idx", "a") as index:
+                # Drop a torn last index line
+                index.truncate(sum(len(format_index_line(e)) for e in entries))
+                for line in lines:
+                    try:
+                        record = json.loads(line)
+                        entry = IndexEntry(
+                            segment, end, len(line) + 1, record["mtime"], record["id"]
+                        )
+                        index.write(format_index_line(entry))
+                    except (ValueError, KeyError):
+                        logger.warning("Skipping corrupt record in %s", segment)
+                    end += len(line) + 1
+            logger.info("Indexed %s unindexed record(s) in %s", len(lines), segment)
+
+    def _sync_loop(self):
+        while not self._stopped.wait(self.fsync_interval):
+            try:
+                self.sync()
+            except OSError:
+                logger.exception("Could not fsync the failure journal")
+
+
+class FailureJournalReader:
+    """Reads the failure journal for the monitor.
+
+    `pending` returns the index entries after the cursor, i.e. the records
+    that have not been reported yet, and `mark_handled` moves the cursor
+    past them and moves segments that have been fully reported (except
+    the newest, which may still be written) to `archive_directory`.
+    """
+
+    def __init__(
+        self,
+        directory=FAILURE_JOURNAL_DIR,
+        archive_directory=FAILURE_JOURNAL_ARCHIVE_DIR,
+    ):
+        self.directory = directory
+        self.archive_directory = archive_directory
+
+    @property
+    def cursor_path(self):
+        return os.path.join(self.directory, "cursor.json")
+
+    def segments(self):
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(f[: -len(".jsonl")] for f in filenames if f.endswith(".jsonl"))
+
+    def load_cursor(self):
+        try:
+            with open(self.cursor_path) as fp:
+                cursor = json.load(fp)
+        except FileNotFoundError:
+            return "", 0
+        return cursor["segment"], cursor["offset"]
+
+    def pending(self):
+        cursor = self.load_cursor()
+        entries = []
+        for segment in self.segments():
+            if segment < cursor[0]:
+                continue
+            for entry in read_index(self.directory, segment):
+                if (entry.segment, entry.offset) >= cursor:
+                    entries.append(entry)
+        return entries
+
+    def read(self, entries):
+        """Yield the record of each of `entries`, in order."""
+        fp = None
+        segment = None
+        try:
+            for entry in entries:
+                if entry.segment != segment:
+                    if fp is not None:
+                        fp.close()
+                    segment = entry.segment
+                    fp = open(os.path.join(self.directory, segment + ".jsonl"), "rb")
+                fp.seek(entry.offset)
+                yield json.loads(fp.read(entry.length))
+        finally:
+            if fp is not None:
+                fp.close()
+
+    def mark_handled(self, entries):
+        if entries:
+            last = entries[-1]
+            tmp = self.cursor_path + ".tmp"
+            with open(tmp, "w") as fp:
+                json.dump(
+                    {"segment": last.segment, "offset": last.offset + last.length}, fp
+                )
+            os.replace(tmp, self.cursor_path)
+        cursor = self.load_cursor()
+        os.makedirs(self.archive_directory, exist_ok=True)
+        for segment in self.segments()[:-1]:
+            if segment > cursor[0]:
+                break
+            if segment == cursor[0]:
+                entries = read_index(self.directory, segment)
+                if entries and entries[-1].offset + entries[-1].length > cursor[1]:
+                    break
+            for ext in (".jsonl", ".idx"):
+                os.rename(
+                    os.path.join(self.directory, segment + ext),
+                    os.path.join(self.archive_directory, segment + ext),
+                )
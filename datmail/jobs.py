@@ -0,0 +1,215 @@
+import collections
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from emailtunnel import logger
+
+try:
+    from datmail.config import (
+        RESEND_JOB_PATH,
+        RESEND_JOB_WORKERS,
+        RESEND_JOB_QUEUE_SIZE,
+        RESEND_JOB_RETENTION,
+    )
+except ImportError:
+    RESEND_JOB_PATH = "spool/resend-jobs.jsonl"
+    RESEND_JOB_WORKERS = 1
+    RESEND_JOB_QUEUE_SIZE = 1000
+    RESEND_JOB_RETENTION = 24 * 60 * 60
+
+# Compact the journal once it has this many more lines than there are jobs
+COMPACT_SLACK = 1000
+
+
+class ResendJobQueue:
+    """Persistent queue of resend jobs, run by a fixed number of threads.
+
+    `submit` journals the job and returns it with its ID at once; `workers`
+    threads run queued jobs in order through the forwarder's
+    bulk_resend_archived_mail, so control requests never relay mail
+    themselves. At most `max_queued` jobs may wait; `submit` raises
+    queue.Full beyond that.
+
+    Every state change is appended to a journal, which is read back on
+    start: queued jobs survive a restart, and jobs that were running when
+    the process died are run again. Finished jobs and their results can
+    be looked up with `get` for `retention` seconds.
+    """
+
+    def __init__(
+        self,
+        forwarder,
+        path=RESEND_JOB_PATH,
+        workers=RESEND_JOB_WORKERS,
+        max_queued=RESEND_JOB_QUEUE_SIZE,
+        retention=RESEND_JOB_RETENTION,
+    ):
+        self.forwarder = forwarder
+        self.path = path
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self.jobs = collections.OrderedDict()
+        self.stats = collections.Counter()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._journal = None
+        self._journal_lines = 0
+        self._threads = []
+
+    def start(self):
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._load()
+            self._journal = open(self.path, "a")
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name="datmail-resend-job-%s" % i, daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        """Stop after the running jobs; queued jobs are run on the next start."""
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def submit(self, items):
+        """Queue resend_archived_mail arguments `items`; return the new job."""
+        with self._lock:
+            queued = self._queue.qsize()
+            if queued >= self.max_queued:
+                self.stats["rejected"] += 1
+                raise queue.Full("%s resend jobs already queued" % queued)
+            job = dict(
+                id=uuid.uuid4().hex,
+                status="queued",
+                created_at=time.time(),
+                items=list(items),
+            )
+            self._record(job)
+            self.stats["submitted"] += 1
+        self._queue.put(job["id"])
+        return self.describe(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else self.describe(job)
+
+    @staticmethod
+    def describe(job):
+        """The public view of `job`, without its queued items."""
+        result = {k: v for k, v in job.items() if k != "items"}
+        if "items" in job:
+            result["size"] = len(job["items"])
+        return result
+
+    def metrics(self):
+        with self._lock:
+            states = collections.Counter(job["status"] for job in self.jobs.values())
+        return dict(self.stats, **states)
+
+    def _record(self, job):
+        # Called with self._lock held
+        self.jobs[job["id"]] = job
+        if self._journal is None:
+            self._prune()
+            return
+        self._journal.write(json.dumps(job) + "\n")
+        self._journal.flush()
+        self._journal_lines += 1
+        if self._journal_lines > len(self.jobs) + COMPACT_SLACK:
+            self._prune()
+            self._compact()
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = dict(self.jobs[job_id], **fields)
+            self._record(job)
+        return job
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            job = self._update(job_id, status="running", started_at=time.time())
+            try:
+                results = self.forwarder.bulk_resend_archived_mail(job["items"])
+            except Exception as e:
+                logger.exception("Resend job %s failed", job_id)
+                self.stats["errors"] += 1
+                fields = dict(status="failed", error=str(e))
+            else:
+                failed = sum(1 for r in results if r["status"] != "sent")
+                self.stats["completed"] += 1
+                fields = dict(
+                    status="done",
+                    sent=len(results) - failed,
+                    failed=failed,
+                    results=results,
+                )
+            with self._lock:
+                # Finished jobs keep their results but not their items
+                job = self.describe(self.jobs[job_id])
+                job.update(fields, finished_at=time.time())
+                self._record(job)
+
+    def _prune(self):
+        # Called with self._lock held
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self.jobs.items()):
+            if job.get("finished_at", cutoff) < cutoff:
+                del self.jobs[job_id]
+
+    def _compact(self):
+        # Called with self._lock held
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fp:
+            for job in self.jobs.values():
+                fp.write(json.dumps(job) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, self.path)
+        self._journal_lines = len(self.jobs)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = open(self.path, "a")
+
+    def _load(self):
+        try:
+            with open(self.path) as fp:
+                lines = fp.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                job = json.loads(line)
+                self.jobs[job["id"]] = job
+            except (ValueError, KeyError, TypeError):
+                # Torn write from a crash; the rest of the journal is fine
+                logger.warning("Skipping corrupt line in %s", self.path)
+        self._prune()
+        requeued = 0
+        for job in self.jobs.values():
+            if job["status"] in ("queued", "running"):
+                job["status"] = "queued"
+                job.pop("started_at", None)
+                self._queue.put(job["id"])
+                requeued += 1
+        self._compact()
+        if requeued:
+            logger.info("Requeued %s resend job(s) from %s", requeued, self.path)
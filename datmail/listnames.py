@@ -0,0 +1,87 @@
+import hashlib
+import math
+import threading
+
+from emailtunnel import logger
+
+try:
+    from datmail.config import LIST_NAMES_REFRESH_INTERVAL
+except ImportError:
+    LIST_NAMES_REFRESH_INTERVAL = 60
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter of strings.
+
+    `might_contain` has no false negatives, and false positives at about
+    `error_rate` once `capacity` items have been added.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def might_contain(self, item):
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item)
+        )
+
+    __contains__ = might_contain
+
+
+class ListNameFilter:
+    """Bloom filter of all mailing list names, refreshed in the background.
+
+    Attach to a DjangoAPIClient as `api_client.list_names` to answer lookups
+    of names that are certainly not mailing lists without asking Django.
+    Until the list index has been loaded once, every name may exist.
+    """
+
+    def __init__(self, api_client, refresh_interval=LIST_NAMES_REFRESH_INTERVAL):
+        self.api_client = api_client
+        self.refresh_interval = refresh_interval
+        self.names = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        index = self.api_client.get_mailinglist_names()
+        names = BloomFilter(len(index))
+        for entry in index:
+            names.add(entry["name"].lower())
+        self.names = names
+        return len(index)
+
+    def might_exist(self, list_name):
+        names = self.names
+        return names is None or list_name.lower() in names
+
+    def start(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("Could not load mailing list names from Django: %s", e)
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _refresh_loop(self):
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Could not refresh mailing list names: %s", e)
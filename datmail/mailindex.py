@@ -0,0 +1,158 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from datmail.config import MAIL_INDEX_PATH
+except ImportError:
+    MAIL_INDEX_PATH = "spool/mailindex.sqlite3"
+
+# Archived messages expire after 90 days, and so do their index rows
+RETENTION = datetime.timedelta(days=90)
+
+# Expired rows are deleted on open, and then by `add` every PRUNE_EVERY
+# rows or PRUNE_INTERVAL seconds, whichever comes first
+PRUNE_EVERY = 1000
+PRUNE_INTERVAL = 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mail (
+    request_uuid TEXT PRIMARY KEY,
+    received_at TEXT NOT NULL,
+    mailfrom TEXT,
+    sender TEXT,
+    target TEXT,
+    mailing_list TEXT,
+    size INTEGER,
+    message_id TEXT,
+    status TEXT NOT NULL DEFAULT 'RECEIVED',
+    reason TEXT NOT NULL DEFAULT '',
+    recipients INTEGER
+);
+CREATE INDEX IF NOT EXISTS mail_received_at ON mail (received_at);
+CREATE INDEX IF NOT EXISTS mail_list ON mail (mailing_list, received_at);
+CREATE INDEX IF NOT EXISTS mail_message_id ON mail (message_id);
+"""
+
+COLUMNS = (
+    "request_uuid received_at mailfrom sender target mailing_list size "
+    "message_id status reason recipients"
+).split()
+
+
+class MailIndex:
+    """Local SQLite index of archived mail.
+
+    A row is added when a message is archived and gets its final status
+    when it is reported as PROCESSED or DROPPED, so operators can find
+    messages (e.g. everything to "best" from one sender on one day) and
+    resend them by request_uuid without listing the S3 bucket.
+    """
+
+    def __init__(self, path=MAIL_INDEX_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._added = 0
+        self._pruned_at = None
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self.prune()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def prune(self):
+        """Delete the rows of messages older than RETENTION."""
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - RETENTION
+        with self._lock, self._db:
+            self._added = 0
+            self._pruned_at = time.monotonic()
+            self._db.execute(
+                "DELETE FROM mail WHERE received_at < ?",
+                (cutoff.isoformat().replace("+00:00", "Z"),),
+            )
+
+    def add(self, request_uuid, received_at, **fields):
+        """Record a received message; `fields` are columns of the mail table."""
+        row = dict(fields, request_uuid=request_uuid, received_at=received_at)
+        unknown = set(row) - set(COLUMNS)
+        if unknown:
+            raise ValueError("Unknown mail index columns: %s" % sorted(unknown))
+        names = ", ".join(row)
+        placeholders = ", ".join("?" * len(row))
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO mail ({names}) VALUES ({placeholders})",
+                list(row.values()),
+            )
+            self._added += 1
+            due = (
+                self._added >= PRUNE_EVERY
+                or time.monotonic() - self._pruned_at >= PRUNE_INTERVAL
+            )
+        if due:
+            self.prune()
+
+    def set_status(self, request_uuid, status, reason="", recipients=None):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE mail SET status = ?, reason = ?, recipients = ? "
+                "WHERE request_uuid = ?",
+                (status, reason, recipients, request_uuid),
+            )
+
+    def query(
+        self,
+        mailing_list=None,
+        sender=None,
+        target=None,
+        since=None,
+        until=None,
+        status=None,
+        message_id=None,
+        limit=100,
+    ):
+        """Return matching rows as dicts, newest first.
+
+        `sender` matches a substring of the envelope or header sender;
+        `since` and `until` are ISO dates or timestamps (UTC).
+        """
+        where = []
+        args = []
+        if mailing_list:
+            where.append("mailing_list = ?")
+            args.append(mailing_list.lower())
+        if sender:
+            where.append("(mailfrom LIKE ? OR sender LIKE ?)")
+            args += ["%" + sender + "%"] * 2
+        if target:
+            where.append("target LIKE ?")
+            args.append(target)
+        if since:
+            where.append("received_at >= ?")
+            args.append(since)
+        if until:
+            where.append("received_at < ?")
+            args.append(until)
+        if status:
+            where.append("status = ?")
+            args.append(status.upper())
+        if message_id:
+            where.append("message_id = ?")
+            args.append(message_id)
+        sql = "SELECT %s FROM mail" % ", ".join(COLUMNS)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY received_at DESC LIMIT ?"
+        args.append(int(limit))
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
@@ -0,0 +1,129 @@
+import threading
+
+from datmail.email_utils import extract_original_sender
+
+
+def normalize_address(address):
+    """
+    >>> normalize_address(" <Anders@Example.com> ")
+    'anders@example.com'
+    """
+    address = address.strip()
+    if address.startswith("<") and address.endswith(">"):
+        address = address[1:-1].strip()
+    return address.lower()
+
+
+class MemberIndex:
+    """Interns member emails to small consecutive integer IDs.
+
+    A set of members is then a bitmap (a Python int with bit i set for
+    member i), so recipient expressions like "best+koordinator-anders" are
+    evaluated with a few big-int operations instead of string sets.
+
+    IDs are never freed, so the shared `member_index` is replaced by
+    `rebuild_member_index` once it holds many more emails than the
+    current lists; bitmaps are only comparable within one index.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.emails = []
+        self._lock = threading.Lock()
+
+    def intern(self, email):
+        member_id = self.ids.get(email)
+        if member_id is None:
+            with self._lock:
+                member_id = self.ids.setdefault(email, len(self.emails))
+                if member_id == len(self.emails):
+                    self.emails.append(email)
+        return member_id
+
+    def bitmap(self, emails):
+        ids = [self.intern(email) for email in emails]
+        if not ids:
+            return 0
+        bits = bytearray(b"0") * (max(ids) + 1)
+        for member_id in ids:
+            bits[member_id] = ord("1")
+        return int(bits[::-1], 2)
+
+    def lookup(self, bitmap):
+        """Return the emails in `bitmap`, in order of interning."""
+        bits = bin(bitmap)[:1:-1]
+        emails = self.emails
+        result = []
+        i = bits.find("1")
+        while i != -1:
+            result.append(emails[i])
+            i = bits.find("1", i + 1)
+        return result
+
+    def __len__(self):
+        return len(self.emails)
+
+
+member_index = MemberIndex()
+
+
+def rebuild_member_index(live):
+    """Replace member_index if it has outgrown the `live` emails in use.
+
+    Return whether it was replaced. Lists compiled against the old index
+    compute their bitmap in the new one on first use.
+    """
+    global member_index
+    if len(member_index) <= 2 * live + 1000:
+        return False
+    member_index = MemberIndex()
+    return True
+
+
+class MemberList(list):
+    """Member emails of a mailing list, with their bitmap in a MemberIndex."""
+
+    __slots__ = ("_bits",)
+
+    def __init__(self, emails):
+        super().__init__(emails)
+        index = member_index
+        self._bits = (index, index.bitmap(self))
+
+    def bitmap_in(self, index):
+        """Return the bitmap of these emails in `index`."""
+        bits = self._bits
+        if bits[0] is not index:
+            # Compiled before member_index was rebuilt
+            bits = self._bits = (index, index.bitmap(self))
+        return bits[1]
+
+
+class MailingList:
+    """Mailing list info from Django, compiled once per version.
+
+    `emails` is the member list used for recipient expansion and `members`
+    the normalized addresses used for authorization, so both only walk the
+    member list when Django returns a new version of the list.
+    """
+
+    __slots__ = ("info", "id", "is_only_internal", "emails", "members")
+
+    def __init__(self, info):
+        members = info.get("members") or []
+        self.info = info
+        self.id = info.get("id")
+        self.is_only_internal = bool(info.get("isOnlyInternal"))
+        self.emails = MemberList(
+            m.get("email") for m in members if isinstance(m.get("email"), str)
+        )
+        self.members = frozenset(normalize_address(e) for e in self.emails)
+
+    def has_member(self, address):
+        """Whether `address`, or the sender it is an SRS rewrite of, is a member."""
+        if not isinstance(address, str):
+            return False
+        if normalize_address(address) in self.members:
+            return True
+        original = extract_original_sender(address)
+        return original != address and normalize_address(original) in self.members
@@ -14,6 +14,9 @@ import datmail.headers
 from datmail.delivery_reports import parse_delivery_report
 from datmail.config import ADMINS
 from datmail.address import get_admin_emails
+from datmail.errorarchive import ErrorArchive
+from datmail.failures import FailureJournalReader
+from datmail.reportindex import ReportIndex
 
 
 
@@ -58,37 +61,27 @@ def get_report(basename):
     return report
 
 
-def archive_report(basename):
-    for ext in "txt json mail".split():
-        filename = "%s.%s" % (basename, ext)
-        try:
-            try:
-                os.rename("error/%s" % filename, "errorarchive/%s" % filename)
-            except FileNotFoundError:
-                if ext == "mail":
-                    pass
-                else:
-                    raise
-        except Exception:
-            logger.exception("Failed to move %s" % filename)
-
-
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-n", "--dry-run", action="store_true")
-    args = parser.parse_args()
+def get_report_key(basename):
+    """The mtimes that `get_report` depends on, to key the report index."""
+    key = [
+        os.stat("error/%s.txt" % basename).st_mtime_ns,
+        os.stat("error/%s.json" % basename).st_mtime_ns,
+    ]
+    try:
+        key.append(os.stat("error/%s.mail" % basename).st_mtime_ns)
+    except FileNotFoundError:
+        key.append(None)
+    return key
 
-    configure_logging(args.dry_run)
 
+def get_reports(index):
+    """Return the reports in error/, parsing only those not in `index`."""
     try:
         filenames = os.listdir("error")
     except OSError:
         filenames = []
 
-    now = int(time.time())
-    oldest = now
     reports = []
-
     for filename in sorted(filenames):
         if not filename.endswith(".txt"):
             continue
@@ -96,7 +89,11 @@ def main():
         basename = filename[:-4]
 
         try:
-            report = get_report(basename)
+            key = get_report_key(basename)
+            report = index.get(basename, key)
+            if report is None:
+                report = get_report(basename)
+                index.put(basename, key, report)
         except Exception:
             exc_value = sys.exc_info()[1]
             logger.exception("get_report failed")
@@ -104,23 +101,70 @@ def main():
                 "subject": "<get_report(%r) failed: %s>" % (basename, exc_value),
                 "basename": basename,
             }
-        else:
-            oldest = min(oldest, report["mtime"])
 
         reports.append(report)
 
+    return reports
+
+
+def get_journal_reports(journal, entries):
+    """Return the failure journal records of `entries` as reports."""
+    reports = []
+    for record in journal.read(entries):
+        report = {
+            k: record.get(k) for k in "mailfrom rcpttos subject date summary".split()
+        }
+        report["mtime"] = record["mtime"]
+        report["basename"] = record["id"]
+        reports.append(report)
+    return reports
+
+
+def archive_report(archive, report):
+    try:
+        archive.add("error", report["basename"], report.get("summary"))
+    except Exception:
+        logger.exception("Failed to archive %s" % report["basename"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    configure_logging(args.dry_run)
+
+    index = ReportIndex()
+    index.load()
+    reports = get_reports(index)
+    try:
+        index.save()
+    except OSError:
+        logger.exception("Could not save report index")
+    logger.info("Parsed %s new report(s), %s cached", index.misses, index.hits)
+
+    # The journal index has the count and age without reading any records
+    journal = FailureJournalReader()
+    entries = journal.pending()
+
+    now = int(time.time())
+    mtimes = [r["mtime"] for r in reports if "mtime" in r]
+    oldest = min([now] + mtimes + [entry.mtime for entry in entries])
+    count = len(reports) + len(entries)
+
     age = now - oldest
 
     logger.info(
         "%s report(s) / age %s (limit is %s / %s)"
-        % (len(reports), age, MAX_SIZE, MAX_DAYS * 24 * 60 * 60)
+        % (count, age, MAX_SIZE, MAX_DAYS * 24 * 60 * 60)
     )
 
-    if not args.dry_run and (
-        len(reports) <= MAX_SIZE and age <= MAX_DAYS * 24 * 60 * 60
-    ):
+    if not args.dry_run and (count <= MAX_SIZE and age <= MAX_DAYS * 24 * 60 * 60):
         return
 
+    file_reports = list(reports)
+    reports += get_journal_reports(journal, entries)
+
     admins, _ = get_admin_emails()
 
     keys = "mailfrom rcpttos subject date summary mtime basename".split()
@@ -206,8 +250,10 @@ def main():
             pass
 
     # If no exception was raised, the following code is run
-    for report in reports:
-        archive_report(report["basename"])
+    archive = ErrorArchive()
+    for report in file_reports:
+        archive_report(archive, report)
+    journal.mark_handled(entries)
 
 
 if __name__ == "__main__":
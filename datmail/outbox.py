@@ -0,0 +1,234 @@
+import collections
+import json
+import os
+import threading
+import uuid
+
+from emailtunnel import logger
+
+try:
+    from datmail.config import (
+        REPORT_OUTBOX_PATH,
+        REPORT_BATCH_SIZE,
+        REPORT_FLUSH_INTERVAL,
+        REPORT_MAX_BACKOFF,
+    )
+except ImportError:
+    REPORT_OUTBOX_PATH = "spool/outbox.jsonl"
+    REPORT_BATCH_SIZE = 100
+    REPORT_FLUSH_INTERVAL = 2
+    REPORT_MAX_BACKOFF = 300
+
+try:
+    from datmail.config import REPORT_DEAD_LETTER_PATH
+except ImportError:
+    REPORT_DEAD_LETTER_PATH = "spool/outbox-dead.jsonl"
+
+
+def is_rejected(exc):
+    """Whether Django refused the request itself (4xx), so retrying is pointless."""
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+
+class ReportOutbox:
+    """Durable, batched outbox for monitoring reports to Django.
+
+    `put` appends the report to a journal file and returns. A background
+    thread sends the pending reports in bulk every `flush_interval` seconds
+    (or as soon as `batch_size` reports are waiting), backing off
+    exponentially while Django is unavailable. Reports for the same
+    request_uuid are coalesced, so only the latest one is sent.
+
+    A batch Django rejects with a 4xx response is split in halves until
+    the rejected reports are found; those are appended to
+    `dead_letter_path` and dropped, so they do not block the reports
+    behind them.
+
+    The journal is compacted to the still-unsent reports once per flush
+    and is read back on start, so reports survive a restart.
+    """
+
+    def __init__(
+        self,
+        api_client,
+        path=REPORT_OUTBOX_PATH,
+        batch_size=REPORT_BATCH_SIZE,
+        flush_interval=REPORT_FLUSH_INTERVAL,
+        max_backoff=REPORT_MAX_BACKOFF,
+        dead_letter_path=REPORT_DEAD_LETTER_PATH,
+    ):
+        self.api_client = api_client
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.dead_letter_path = dead_letter_path
+        self.pending = collections.OrderedDict()
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._journal = None
+        self._compacting = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._journal = open(self.path, "a")
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._journal is not None:
+            self._journal.close()
+
+    def put(self, payload):
+        key = payload.get("request_uuid") or str(uuid.uuid4())
+        line = json.dumps(payload) + "\n"
+        with self._lock:
+            if self._journal is not None:
+                self._journal.write(line)
+                self._journal.flush()
+            if self._compacting is not None:
+                self._compacting.append(line)
+            if key in self.pending:
+                self.stats["coalesced"] += 1
+            self.pending[key] = payload
+            self.pending.move_to_end(key)
+            waiting = len(self.pending)
+        if waiting >= self.batch_size:
+            self._wakeup.set()
+
+    def metrics(self):
+        return dict(self.stats, pending=len(self.pending))
+
+    def flush(self):
+        """Send all pending reports; raise if Django could not take them."""
+        with self._lock:
+            batch = list(self.pending.items())
+        done = 0
+        try:
+            for i in range(0, len(batch), self.batch_size):
+                chunk = batch[i : i + self.batch_size]
+                self._send(chunk)
+                done += len(chunk)
+        finally:
+            if done and self._journal is not None:
+                self._compact()
+
+    def _send(self, chunk):
+        try:
+            self.api_client.upsert_incoming_mails([p for k, p in chunk])
+        except Exception as e:
+            if not is_rejected(e):
+                raise
+            if len(chunk) > 1:
+                # Find the rejected report(s) and send the rest
+                self.stats["splits"] += 1
+                self._send(chunk[: len(chunk) // 2])
+                self._send(chunk[len(chunk) // 2 :])
+                return
+            self._dead_letter(chunk[0][1], e)
+        else:
+            self.stats["sent"] += len(chunk)
+            self.stats["batches"] += 1
+        with self._lock:
+            for key, payload in chunk:
+                # A newer report for the same mail may have arrived
+                if self.pending.get(key) is payload:
+                    del self.pending[key]
+
+    def _dead_letter(self, payload, exc):
+        logger.error(
+            "Django rejected the report for %s (%s); writing it to %s",
+            payload.get("request_uuid"),
+            exc,
+            self.dead_letter_path,
+        )
+        directory = os.path.dirname(self.dead_letter_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.dead_letter_path, "a") as fp:
+            fp.write(json.dumps(payload) + "\n")
+        self.stats["dead_lettered"] += 1
+
+    def _load(self):
+        try:
+            with open(self.path) as fp:
+                lines = fp.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                payload = json.loads(line)
+            except ValueError:
+                # Torn write from a crash; the rest of the journal is fine
+                logger.warning("Skipping corrupt line in %s", self.path)
+                continue
+            key = payload.get("request_uuid") or str(uuid.uuid4())
+            self.pending[key] = payload
+            self.pending.move_to_end(key)
+        if self.pending:
+            logger.info(
+                "Loaded %s unsent report(s) from %s", len(self.pending), self.path
+            )
+
+    def _compact(self):
+        # Rewrite the journal outside the lock; reports put meanwhile are
+        # collected in self._compacting and appended at the end.
+        with self._lock:
+            payloads = list(self.pending.values())
+            self._compacting = []
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as fp:
+                for payload in payloads:
+                    fp.write(json.dumps(payload) + "\n")
+                fp.flush()
+                os.fsync(fp.fileno())
+                with self._lock:
+                    fp.writelines(self._compacting)
+                    fp.flush()
+                    os.replace(tmp, self.path)
+                    if self._journal is not None:
+                        self._journal.close()
+                        self._journal = open(self.path, "a")
+        finally:
+            with self._lock:
+                self._compacting = None
+
+    def _flush_loop(self):
+        backoff = None
+        while True:
+            if backoff is None:
+                self._wakeup.wait(self.flush_interval)
+            else:
+                # Do not let a filling outbox cut the backoff short
+                self._stopped.wait(backoff)
+            self._wakeup.clear()
+            stopping = self._stopped.is_set()
+            if self.pending:
+                try:
+                    self.flush()
+                except Exception:
+                    self.stats["failures"] += 1
+                    backoff = min(
+                        (backoff or self.flush_interval) * 2, self.max_backoff
+                    )
+                    logger.exception(
+                        "Could not report %s mail(s) to Django; retrying in %ss",
+                        len(self.pending),
+                        backoff,
+                    )
+                else:
+                    backoff = None
+            if stopping:
+                return
@@ -0,0 +1,61 @@
+import json
+import os
+
+from emailtunnel import logger
+
+try:
+    from datmail.config import MONITOR_INDEX_PATH
+except ImportError:
+    MONITOR_INDEX_PATH = "error/.monitor-index.json"
+
+# Bump to invalidate cached reports when get_report changes what it returns
+VERSION = 2
+
+
+class ReportIndex:
+    """Parsed failure reports, cached across monitor runs.
+
+    Entries are keyed by basename and by the mtimes of the report's files
+    (see monitor.get_report_key), so a report is only parsed again when
+    one of them changes. `save` writes back just the entries looked up or
+    added in this run, which drops reports that have since been archived.
+    """
+
+    def __init__(self, path=MONITOR_INDEX_PATH):
+        self.path = path
+        self.reports = {}
+        self.seen = {}
+        self.hits = self.misses = 0
+
+    def load(self):
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logger.warning("Ignoring corrupt report index %s", self.path)
+            return
+        if data.get("version") == VERSION:
+            self.reports = data["reports"]
+
+    def get(self, basename, key):
+        entry = self.reports.get(basename)
+        if entry is None or entry["key"] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.seen[basename] = entry
+        return dict(entry["report"])
+
+    def put(self, basename, key, report):
+        self.seen[basename] = {"key": key, "report": dict(report)}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump({"version": VERSION, "reports": self.seen}, fp)
+        os.replace(tmp, self.path)
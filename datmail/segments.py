@@ -0,0 +1,340 @@
+import collections
+import datetime
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from emailtunnel import logger
+
+from datmail.chunks import (
+    ChunkReader,
+    body_chunks,
+    body_size,
+    compress_file,
+    decompress,
+)
+
+try:
+    from datmail.config import (
+        ARCHIVE_SEGMENTS,
+        ARCHIVE_SEGMENT_DIR,
+        ARCHIVE_SEGMENT_WINDOW,
+        ARCHIVE_SEGMENT_SIZE,
+    )
+except ImportError:
+    ARCHIVE_SEGMENTS = False
+    ARCHIVE_SEGMENT_DIR = "spool/segments"
+    ARCHIVE_SEGMENT_WINDOW = 300
+    ARCHIVE_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Archived objects expire after 90 days, so older index entries are dropped
+RETENTION = datetime.timedelta(days=90).total_seconds()
+
+# Rewrite index.jsonl once it has this many more lines than the index
+COMPACT_SLACK = 10000
+
+IndexEntry = collections.namedtuple(
+    "IndexEntry", "segment offset length codec stored_at"
+)
+
+
+SEGMENT_PREFIX = "archive/segments/"
+
+
+def segment_key(segment):
+    return f"{SEGMENT_PREFIX}{segment}.seg"
+
+
+class SegmentStorage:
+    """Packs archived messages into time-windowed segment objects.
+
+    Drop-in for Storage behind ArchiveQueue: `put_object` appends the
+    (optionally compressed) message to a local segment file and records
+    object name -> (segment, offset, length) in an append-only index.
+    A segment is sealed and uploaded as a single object once it is
+    `window` seconds old or `max_size` bytes large, together with a
+    copy of its index entries, so a spam wave costs a few large PUTs
+    instead of one PUT per message.
+
+    `get_object` reads the message back from the local segment or with a
+    range GET, so archive/{uuid}.eml keys (as reported to Django) keep
+    resolving. Names that are not in the index, e.g. messages archived
+    before segments were enabled, are fetched from `storage` directly.
+
+    When index.jsonl is missing, e.g. on a new host, the index is rebuilt
+    from the uploaded .idx.json objects. Expired entries are dropped and
+    index.jsonl is compacted by the background thread.
+    """
+
+    def __init__(
+        self,
+        storage,
+        directory=ARCHIVE_SEGMENT_DIR,
+        window=ARCHIVE_SEGMENT_WINDOW,
+        max_size=ARCHIVE_SEGMENT_SIZE,
+    ):
+        self.storage = storage
+        self.directory = directory
+        self.window = window
+        self.max_size = max_size
+        self.index = {}
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._upload_lock = threading.Lock()
+        self._index_file = None
+        self._index_lines = 0
+        self._compacting = None
+        self._segment = None
+        self._file = None
+        self._opened_at = None
+        self._entries = []
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, "index.jsonl")
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, segment + ".seg")
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+        self._index_file = open(self.index_path, "a")
+        self._thread = threading.Thread(
+            target=self._seal_loop, name="datmail-segments", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.seal()
+        self.upload_sealed()
+        if self._index_file is not None:
+            self._index_file.close()
+
+    def put_object(self, body, object_name):
+        self._append(ChunkReader(body_chunks(body)), body_size(body), object_name)
+
+    def put_file(self, path, object_name):
+        with open(path, "rb") as fp:
+            self._append(fp, os.fstat(fp.fileno()).st_size, object_name)
+
+    def get_object(self, object_name):
+        entry = self.index.get(object_name)
+        if entry is None:
+            return self.storage.get_object(object_name)
+        path = self._segment_path(entry.segment)
+        # The segment may be open, sealed, or sealed and uploaded
+        for local_path in [path + ".open", path]:
+            try:
+                with open(local_path, "rb") as fp:
+                    fp.seek(entry.offset)
+                    return decompress(fp.read(entry.length), entry.codec)
+            except FileNotFoundError:
+                pass
+        data = self.storage.get_range(
+            segment_key(entry.segment), entry.offset, entry.length
+        )
+        self.stats["range_gets"] += 1
+        return decompress(data, entry.codec)
+
+    def metrics(self):
+        return dict(self.stats, indexed=len(self.index), open_segment=self._segment)
+
+    def _append(self, fileobj, size, object_name):
+        data, codec = compress_file(fileobj, self.storage.compression, size)
+        try:
+            with self._lock:
+                if self._file is None:
+                    self._open_segment()
+                offset = self._file.tell()
+                shutil.copyfileobj(data, self._file)
+                self._file.flush()
+                entry = IndexEntry(
+                    self._segment,
+                    offset,
+                    self._file.tell() - offset,
+                    codec,
+                    time.time(),
+                )
+                line = json.dumps([object_name] + list(entry)) + "\n"
+                self._index_file.write(line)
+                self._index_file.flush()
+                self._index_lines += 1
+                if self._compacting is not None:
+                    self._compacting.append(line)
+                self.index[object_name] = entry
+                self._entries.append((object_name, entry))
+                self.stats["appended"] += 1
+                full = self._file.tell() >= self.max_size
+        finally:
+            if data is not fileobj:
+                data.close()
+        if full:
+            self.seal()
+            self.upload_sealed()
+
+    def _open_segment(self):
+        # Called with self._lock held
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self._segment = "%s-%s" % (now.strftime("%Y%m%dT%H%M%S"), uuid.uuid4().hex[:8])
+        self._file = open(self._segment_path(self._segment) + ".open", "wb")
+        self._opened_at = time.monotonic()
+        self._entries = []
+
+    def seal(self):
+        """Close the open segment, so it is uploaded by `upload_sealed`."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            path = self._segment_path(self._segment)
+            with open(path + ".idx", "w") as fp:
+                json.dump([[name] + list(entry) for name, entry in self._entries], fp)
+            os.replace(path + ".open", path)
+            self._file = None
+            self._segment = None
+            self._entries = []
+
+    def upload_sealed(self):
+        """Upload all sealed segments; stop at the first failure."""
+        with self._upload_lock:
+            for filename in sorted(os.listdir(self.directory)):
+                if not filename.endswith(".seg"):
+                    continue
+                segment = filename[: -len(".seg")]
+                path = self._segment_path(segment)
+                try:
+                    self.storage.put_file(path, segment_key(segment), compress=False)
+                    with open(path + ".idx", "rb") as fp:
+                        self.storage.put_object(
+                            fp.read(), segment_key(segment) + ".idx.json"
+                        )
+                except Exception:
+                    logger.exception("Could not upload archive segment %s", segment)
+                    return
+                os.unlink(path)
+                os.unlink(path + ".idx")
+                self.stats["segments_uploaded"] += 1
+
+    def _recover_open_segments(self):
+        # A segment left open by a crash is sealed as it is; its index
+        # entries are in index.jsonl.
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".seg.open"):
+                path = os.path.join(self.directory, filename)
+                segment = filename[: -len(".seg.open")]
+                entries = [
+                    [name] + list(entry)
+                    for name, entry in self.index.items()
+                    if entry.segment == segment
+                ]
+                with open(path[: -len(".open")] + ".idx", "w") as fp:
+                    json.dump(entries, fp)
+                os.replace(path, path[: -len(".open")])
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as fp:
+                lines = fp.readlines()
+        except FileNotFoundError:
+            lines = self._rebuild_index()
+        cutoff = time.time() - RETENTION
+        for line in lines:
+            try:
+                name, *fields = json.loads(line)
+                entry = IndexEntry(*fields)
+            except (ValueError, TypeError):
+                logger.warning("Skipping corrupt line in %s", self.index_path)
+                continue
+            if entry.stored_at >= cutoff:
+                self.index[name] = entry
+        self._index_lines = len(lines)
+        if len(self.index) < len(lines) or not os.path.exists(self.index_path):
+            # Compact away expired and corrupt entries
+            tmp = self.index_path + ".tmp"
+            self._write_index(tmp, self.index.items())
+            os.replace(tmp, self.index_path)
+        self._recover_open_segments()
+
+    def _rebuild_index(self):
+        """Return the index lines of the uploaded and sealed segments."""
+        entries = []
+        try:
+            keys = [
+                key
+                for key in self.storage.list_objects(SEGMENT_PREFIX)
+                if key.endswith(".seg.idx.json")
+            ]
+            for key in keys:
+                entries.extend(json.loads(self.storage.get_object(key)))
+        except Exception:
+            logger.exception("Could not rebuild the segment index from storage")
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".seg.idx"):
+                with open(os.path.join(self.directory, filename)) as fp:
+                    entries.extend(json.load(fp))
+        # Oldest first, so compact_index can drop expired entries from the front
+        entries.sort(key=lambda entry: entry[-1])
+        logger.info("Rebuilt the segment index with %s entries", len(entries))
+        return [json.dumps(entry) + "\n" for entry in entries]
+
+    @staticmethod
+    def _write_index(path, items):
+        with open(path, "w") as fp:
+            for name, entry in items:
+                fp.write(json.dumps([name] + list(entry)) + "\n")
+
+    def compact_index(self):
+        """Drop expired entries from the index.
+
+        index.jsonl is rewritten once it has COMPACT_SLACK lines more
+        than the index, outside the lock that `put_object` needs.
+        """
+        cutoff = time.time() - RETENTION
+        with self._lock:
+            expired = list(
+                itertools.takewhile(
+                    lambda item: item[1].stored_at < cutoff, self.index.items()
+                )
+            )
+            for name, entry in expired:
+                del self.index[name]
+            if self._index_lines <= len(self.index) + COMPACT_SLACK:
+                return
+            items = list(self.index.items())
+            self._compacting = []
+        # Lines appended meanwhile are collected in self._compacting
+        tmp = self.index_path + ".tmp"
+        try:
+            self._write_index(tmp, items)
+            with self._lock:
+                with open(tmp, "a") as fp:
+                    fp.writelines(self._compacting)
+                os.replace(tmp, self.index_path)
+                self._index_file.close()
+                self._index_file = open(self.index_path, "a")
+                self._index_lines = len(items) + len(self._compacting)
+        finally:
+            with self._lock:
+                self._compacting = None
+        self.stats["index_compactions"] += 1
+
+    def _seal_loop(self):
+        interval = min(self.window, 30)
+        while not self._stopped.wait(interval):
+            if (
+                self._file is not None
+                and time.monotonic() - self._opened_at >= self.window
+            ):
+                self.seal()
+            self.upload_sealed()
+            self.compact_index()
@@ -1,3 +1,5 @@
+import concurrent.futures
+import copy
 import datetime
 from email.generator import BytesGenerator
 import email.header
@@ -10,6 +12,7 @@ import os
 import re
 import sys
 import textwrap
+import threading
 import traceback
 import uuid
 from collections import OrderedDict, namedtuple
@@ -20,12 +23,28 @@ import datmail.address
 import datmail.headers
 import datmail.email_utils as email_utils
 from datmail.address import GroupAlias  # PeriodAlias, DirectAlias,
+from datmail.archive import ArchiveQueue
+from datmail.chunks import body_size
 from datmail.delivery_reports import parse_delivery_report
+from datmail.directory import DIRECTORY_SNAPSHOT_PATH, DirectorySnapshot
+from datmail.diskcache import ARCHIVE_CACHE_SIZE, DiskCache
 from datmail.dmarc import has_strict_dmarc_policy
+from datmail.failures import FAILURE_LOG_FORMAT, FailureJournal
 from datmail.config import SRS_SECRET, CC_MAILLISTS, ADMINS
-from datmail.django_api_client import DjangoAPIClient
+from datmail.django_api_client import get_shared_client
+from datmail.jobs import ResendJobQueue
+from datmail.listnames import LIST_NAMES_REFRESH_INTERVAL, ListNameFilter
+from datmail.mailindex import MAIL_INDEX_PATH, MailIndex
+from datmail.outbox import REPORT_OUTBOX_PATH, ReportOutbox
+from datmail.segments import ARCHIVE_SEGMENTS, SegmentStorage
+from datmail.spamfilter import SpamFilter
 from datmail.storage import Storage
 
+try:
+    from datmail.config import RESEND_WORKERS
+except ImportError:
+    RESEND_WORKERS = 4
+
 RecipientGroup = namedtuple("RecipientGroup", "origin recipients".split())
 
 
@@ -74,14 +93,77 @@ class DatForwarder(SMTPForwarder):
     {data}
     """
 
+    # SMTP DATA of the envelope being received on this thread; see
+    # process_message and store_envelope.
+    _received = threading.local()
+
     def __init__(self, *args, **kwargs):
         self.year = datetime.datetime.today().year
         self.exceptions = set()
         self.delivered = 0
         self.deliver_recipients = {}
-        self.storage = Storage(bucket_name="mail-archive", region="fredagscafeen")
-        self.api_client = DjangoAPIClient()
+        storage = Storage(bucket_name="mail-archive", region="fredagscafeen")
+        self.segments = None
+        if ARCHIVE_SEGMENTS:
+            storage = self.segments = SegmentStorage(storage)
+            self.segments.start()
+        cache = DiskCache() if ARCHIVE_CACHE_SIZE else None
+        self.storage = ArchiveQueue(storage, cache=cache)
+        self.storage.start()
+        self.api_client = get_shared_client()
+        if DIRECTORY_SNAPSHOT_PATH and self.api_client.snapshot is None:
+            self.api_client.snapshot = DirectorySnapshot(self.api_client)
+            self.api_client.snapshot.start()
+        elif LIST_NAMES_REFRESH_INTERVAL and self.api_client.list_names is None:
+            self.api_client.list_names = ListNameFilter(self.api_client)
+            self.api_client.list_names.start()
+        self.mail_index = MailIndex() if MAIL_INDEX_PATH else None
+        self.outbox = None
+        if REPORT_OUTBOX_PATH:
+            self.outbox = ReportOutbox(self.api_client)
+            self.outbox.start()
+        self.failures = None
+        if FAILURE_LOG_FORMAT == "journal":
+            self.failures = FailureJournal()
+            self.failures.start()
+        self.spam_filter = SpamFilter(self.api_client)
+        self.spam_filter.start()
         super(DatForwarder, self).__init__(*args, **kwargs)
+        # Started last, since requeued jobs may start relaying right away
+        self.resend_jobs = ResendJobQueue(self)
+        self.resend_jobs.start()
+
+    def shutdown(self):
+        self.resend_jobs.stop()
+        self.spam_filter.stop()
+        if self.api_client.snapshot is not None:
+            self.api_client.snapshot.stop()
+        if self.api_client.list_names is not None:
+            self.api_client.list_names.stop()
+        self.storage.stop()
+        if self.segments is not None:
+            self.segments.stop()
+        if self.outbox is not None:
+            self.outbox.stop()
+        if self.mail_index is not None:
+            self.mail_index.close()
+        if self.failures is not None:
+            self.failures.stop()
+
+    def get_stats(self):
+        stats = {
+            "django_api": self.api_client.endpoint_stats(),
+            "django_api_cache": self.api_client.cache_stats(),
+            "archive": self.storage.metrics(),
+        }
+        if self.segments is not None:
+            stats["archive_segments"] = self.segments.metrics()
+        if self.outbox is not None:
+            stats["report_outbox"] = self.outbox.metrics()
+        if self.failures is not None:
+            stats["failure_journal"] = self.failures.metrics()
+        stats["resend_jobs"] = self.resend_jobs.metrics()
+        return stats
 
     def should_mailhole(self, message, recipient, sender):
         # Forward messages (do not sink to mailhole)
@@ -97,9 +179,21 @@ class DatForwarder(SMTPForwarder):
             self.year,
         )
 
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        # Keep the DATA buffer, so the archive gets the bytes as received
+        self._received.data = data
+        try:
+            return super(DatForwarder, self).process_message(
+                peer, mailfrom, rcpttos, data, **kwargs
+            )
+        finally:
+            self._received.data = None
+
     def log_receipt(self, peer, envelope):
         mailfrom = envelope.mailfrom
         message = envelope.message
+        if getattr(envelope, "raw_data", None) is None:
+            envelope.raw_data = getattr(self._received, "data", None)
         envelope.received_at = datetime.datetime.now(datetime.timezone.utc)
 
         envelope_id = self.generate_uuid()
@@ -257,7 +351,7 @@ class DatForwarder(SMTPForwarder):
                 envelope.rcpttos = [dsn_recipient]
             if not self.REWRITE_FROM and not self.STRIP_HTML:
                 self.fix_headers(envelope.message)
-            return super(DatForwarder, self).handle_envelope(envelope, peer)
+            return self.forward_envelope(envelope, peer)
         if self.handle_delivery_report(envelope):
             return
         envelope.from_domain = self.get_from_domain(envelope)
@@ -278,10 +372,7 @@ class DatForwarder(SMTPForwarder):
                 # Poor man's spam filter
                 from_domain = envelope.from_domain.lower()
                 if from_domain:
-                    allowed_domains, blocked_domains = self.api_client.get_spamfilter()
-                    if not any(
-                        from_domain.endswith(tld) for tld in allowed_domains
-                    ) or any(from_domain.endswith(tld) for tld in blocked_domains):
+                    if self.spam_filter.is_spam(from_domain):
                         summary = "Rejected: spam filter triggered"
                         logger.info(
                             "%s: %s (%s) -> %s",
@@ -295,7 +386,8 @@ class DatForwarder(SMTPForwarder):
                         return
 
                 # Check authorization for internal-only lists
-                list_name = rcptto.split("@")[0]
+                # Recipient expansion is case-insensitive, so the check must be too
+                list_name = rcptto.split("@")[0].lower()
                 # If the envelope.mailfrom was rewritten by SRS, recover the original
                 sender_email = email_utils.extract_original_sender(envelope.mailfrom)
                 if not self.is_sender_authorized_for_list(sender_email, list_name):
@@ -328,8 +420,28 @@ class DatForwarder(SMTPForwarder):
 
         if not self.REWRITE_FROM and not self.STRIP_HTML:
             self.fix_headers(envelope.message)
-        result = super(DatForwarder, self).handle_envelope(envelope, peer)
-        return result
+        return self.forward_envelope(envelope, peer)
+
+    def forward_envelope(self, envelope, peer):
+        """Let SMTPForwarder expand and forward the envelope, then report it.
+
+        SMTPForwarder calls self.forward once per RecipientGroup; forward
+        only collects the recipients so that a single PROCESSED report with
+        the final recipient set is sent per envelope.
+        """
+        envelope.expanded_recipients = set()
+        try:
+            return super(DatForwarder, self).handle_envelope(envelope, peer)
+        finally:
+            self.report_forwarded_mail(envelope)
+
+    def report_forwarded_mail(self, envelope):
+        if envelope.expanded_recipients:
+            self.report_processed_mail(
+                envelope,
+                envelope.expanded_recipients,
+                self.get_report_mailing_list(envelope),
+            )
 
     def _ensure_list_cc(self, message, list_name):
         """
@@ -409,17 +521,11 @@ class DatForwarder(SMTPForwarder):
     def translate_recipient(self, rcptto):
         name, domain = rcptto.split("@")
 
-        recipients, origin = datmail.address.translate_recipient(name, list_group_origins=True)
-        if not recipients:
-            logger.info("Invalid recipient: %s resolved to an empty list", name)
-            raise InvalidRecipient(rcptto)
-        recipients.sort(key=lambda r: origin[r])
-        group_iter = itertools.groupby(recipients, key=lambda r: origin[r])
-        groups = [
+        expansion = datmail.address.expand_recipient(name)
+        return [
             RecipientGroup(origin=o, recipients=frozenset(group))
-            for o, group in group_iter
+            for o, group in expansion.groups()
         ]
-        return groups
 
     def get_group_recipients(self, group):
         return group.recipients
@@ -432,15 +538,16 @@ class DatForwarder(SMTPForwarder):
                 return True
             
             try:
-                list_info = self.api_client.get_mailinglist_info(list_name)  # Check if list exists and is internal-only
+                mailing_list = self.api_client.get_mailinglist(list_name)  # Check if list exists and is internal-only
             except Exception:
                 logger.exception(f"Error fetching mailing list info for {list_name}")
                 return True  # Allow if we cannot fetch list info
             
-            if list_info.get("isOnlyInternal") and list_info.get("members"):
+            if mailing_list is None:
+                return True  # No such list; recipient expansion rejects it
+            if mailing_list.is_only_internal and mailing_list.members:
                 # List is internal-only, check if sender is a member
-                members = list_info.get("members", [])
-                return sender_email.lower() in [m.get("email", "").lower() for m in members]
+                return mailing_list.has_member(sender_email)
             else:
                 return True  # Not an internal-only list
         except Exception:
@@ -554,17 +661,9 @@ class DatForwarder(SMTPForwarder):
             charset = email.charset.Charset("utf-8")
             charset.header_encoding = charset.body_encoding = email.charset.QP
             message.message.set_payload(t, charset=charset)
-        # Use SRS-encoded MAIL FROM when delivering externally
-        original_envelope.expanded_recipients = set(
-            getattr(original_envelope, "expanded_recipients", set())
-        )
         original_envelope.expanded_recipients.update(recipients)
+        # Use SRS-encoded MAIL FROM when delivering externally
         sender = self.get_envelope_mailfrom(original_envelope, recipients=recipients)
-        self.report_processed_mail(
-            original_envelope,
-            getattr(original_envelope, "expanded_recipients", set()),
-            self.get_report_mailing_list(original_envelope),
-        )
         super().forward(original_envelope, message, recipients, sender)
 
     def log_invalid_recipient(self, envelope, exn):
@@ -653,17 +752,36 @@ class DatForwarder(SMTPForwarder):
             return None
         return target.split("@", 1)[0].lower()
 
+    def get_report_sender(self, envelope):
+        address = self.get_message_sender(envelope)
+        if isinstance(address, tuple) and len(address) == 2:
+            return f"%s <%s>" % (address[0], address[1])
+        elif isinstance(address, str):
+            return address
+        else:
+            return str(address)
+
+    def submit_report(self, payload):
+        if self.mail_index is not None:
+            try:
+                self.mail_index.set_status(
+                    payload["request_uuid"],
+                    payload["status"],
+                    payload["reason"],
+                    len(payload["expanded_recipients"]),
+                )
+            except Exception:
+                logger.exception("Could not update mail index")
+        if self.outbox is not None:
+            self.outbox.put(payload)
+        else:
+            self.api_client.upsert_incoming_mail(payload)
+
     def report_processed_mail(self, envelope, expanded_recipients, mailing_list_name):
         if self.api_client is None:
             return
         
-        address = self.get_message_sender(envelope)
-        if isinstance(address, tuple) and len(address) == 2:
-            sender = f"%s <%s>" % (address[0], address[1])
-        elif isinstance(address, str):
-            sender = address
-        else:            
-            sender = str(address)
+        sender = self.get_report_sender(envelope)
 
         payload = {
             "request_uuid": self.get_request_uuid(envelope),
@@ -677,7 +795,7 @@ class DatForwarder(SMTPForwarder):
             "expanded_recipients": sorted(expanded_recipients),
         }
         try:
-            self.api_client.upsert_incoming_mail(payload)
+            self.submit_report(payload)
         except Exception:
             logger.exception("Could not report processed mail to Django")
 
@@ -685,13 +803,7 @@ class DatForwarder(SMTPForwarder):
         if self.api_client is None:
             return
         
-        address = self.get_message_sender(envelope)
-        if isinstance(address, tuple) and len(address) == 2:
-            sender = f"%s <%s>" % (address[0], address[1])
-        elif isinstance(address, str):
-            sender = address
-        else:            
-            sender = str(address)
+        sender = self.get_report_sender(envelope)
 
         payload = {
             "request_uuid": self.get_request_uuid(envelope),
@@ -705,19 +817,85 @@ class DatForwarder(SMTPForwarder):
             "expanded_recipients": [],
         }
         try:
-            self.api_client.upsert_incoming_mail(payload)
+            self.submit_report(payload)
         except Exception:
             logger.exception("Could not report dropped mail to Django")
 
-    def resend_archived_mail(self, request_uuid, target, sender, original_target):
+    def get_archived_message(self, request_uuid, batch=None):
+        """Fetch and parse an archived message.
+
+        Within a resend `batch` (a dict shared by the resends of one
+        request), each message is fetched and parsed once and every resend
+        gets its own copy, since forwarding modifies the message.
+        """
+        if batch is not None and request_uuid in batch:
+            return copy.deepcopy(batch[request_uuid])
         raw_eml = self.storage.get_object(f"archive/{request_uuid}.eml")
         parsed_message = email.parser.BytesParser().parsebytes(raw_eml)
+        if batch is None:
+            return parsed_message
+        batch[request_uuid] = parsed_message
+        return copy.deepcopy(parsed_message)
+
+    def resend_archived_mail(
+        self, request_uuid, target, sender, original_target, batch=None
+    ):
+        parsed_message = self.get_archived_message(request_uuid, batch)
         message = Message(parsed_message)
         envelope = Envelope(message, sender, [original_target])
         group = RecipientGroup(GroupAlias(original_target.split("@", 1)[0]), [target])
         for field, value in self.get_extra_headers(envelope, group):
             envelope.message.set_unique_header(field, value)
+        envelope.expanded_recipients = set()
         self.forward(envelope, envelope.message, [target], sender)
+        self.report_forwarded_mail(envelope)
+
+    def bulk_resend_archived_mail(self, items, workers=RESEND_WORKERS):
+        """Resend many archived messages; return one result per item, in order.
+
+        Each item is a dict of resend_archived_mail arguments. The items for
+        one request_uuid run in order on one thread and share a single fetch
+        and parse; different messages are resent by up to `workers` threads.
+        """
+        groups = OrderedDict()
+        for i, item in enumerate(items):
+            groups.setdefault(item["request_uuid"], []).append(i)
+        results = [None] * len(items)
+
+        def resend_group(indexes):
+            batch = {}
+            for i in indexes:
+                item = items[i]
+                result = dict(request_uuid=item["request_uuid"], target=item["target"])
+                try:
+                    self.resend_archived_mail(batch=batch, **item)
+                except Exception as e:
+                    logger.exception(
+                        "Failed to resend %s to %s",
+                        item["request_uuid"],
+                        item["target"],
+                    )
+                    result.update(status="failed", error=str(e))
+                else:
+                    result.update(status="sent")
+                results[i] = result
+
+        if workers <= 1 or len(groups) <= 1:
+            for indexes in groups.values():
+                resend_group(indexes)
+            return results
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="datmail-resend"
+        ) as executor:
+            list(executor.map(resend_group, groups.values()))
+        return results
+
+    def submit_resend(self, items):
+        """Queue a resend job for `items`; see bulk_resend_archived_mail."""
+        return self.resend_jobs.submit(items)
+
+    def get_resend_job(self, job_id):
+        return self.resend_jobs.get(job_id)
 
     def get_raw_eml(self, message):
         """Helper to get the raw bytes of an email message."""
@@ -728,19 +906,71 @@ class DatForwarder(SMTPForwarder):
         gen.flatten(message.message)
         return out.getvalue()
     
+    def get_archive_body(self, envelope, envelope_id):
+        """Return the message to archive as a list of chunks.
+
+        If we have the SMTP DATA bytes, archive them as received with only
+        the X-Fredagscafeen-Envelope-ID header prepended; otherwise fall
+        back to flattening the parsed message.
+        """
+        raw_data = getattr(envelope, "raw_data", None)
+        if not isinstance(raw_data, (bytes, bytearray, memoryview)):
+            return [self.get_raw_eml(envelope.message)]
+        data = memoryview(raw_data)
+        eol = "\r\n" if b"\r\n" in bytes(data[:998]) else "\n"
+        header = "X-Fredagscafeen-Envelope-ID: %s%s" % (envelope_id, eol)
+        return [header.encode("ascii"), data]
+
     def store_envelope(self, envelope):
         """Store the raw email in S3 for archival."""
         try:
-            raw_eml = self.get_raw_eml(envelope.message)
             envelope_id = envelope.message.get_header("X-Fredagscafeen-Envelope-ID")
+            body = self.get_archive_body(envelope, envelope_id)
             object_name = f"archive/{envelope_id}.eml"
-            self.storage.upload_object(raw_eml, object_name)
+            self.storage.upload_object(body, object_name)
         except Exception as e:
             logger.error(f"Error storing envelope to S3: {e}")
+            return
+        if self.mail_index is not None:
+            try:
+                self.index_envelope(envelope, envelope_id, body_size(body))
+            except Exception:
+                logger.exception("Could not add %s to mail index", envelope_id)
+
+    def index_envelope(self, envelope, envelope_id, size):
+        self.mail_index.add(
+            envelope_id,
+            self.get_received_at(envelope),
+            mailfrom=str(envelope.mailfrom),
+            sender=self.get_report_sender(envelope),
+            target=self.get_report_target(envelope),
+            mailing_list=self.get_report_mailing_list(envelope),
+            size=size,
+            message_id=envelope.message.message.get("Message-ID"),
+        )
+
+    def query_mail(self, **filters):
+        """Search the mail index; see MailIndex.query."""
+        if self.mail_index is None:
+            raise LookupError("The mail index is disabled")
+        return self.mail_index.query(**filters)
 
     def store_failed_envelope(
         self, envelope, description, summary, inner_envelope=None
     ):
+        if inner_envelope is None:
+            inner_envelope = envelope
+        metadata = {
+            "mailfrom": inner_envelope.mailfrom,
+            "rcpttos": inner_envelope.rcpttos,
+            "subject": str(inner_envelope.message.subject),
+            "date": inner_envelope.message.get_header("Date"),
+            "summary": summary,
+        }
+        if self.failures is not None:
+            self.failures.append(dict(metadata, description=description))
+            return
+
         now = now_string()
 
         try:
@@ -748,16 +978,7 @@ class DatForwarder(SMTPForwarder):
         except FileExistsError:
             pass
 
-        if inner_envelope is None:
-            inner_envelope = envelope
         with open("error/%s.json" % now, "w") as fp:
-            metadata = {
-                "mailfrom": inner_envelope.mailfrom,
-                "rcpttos": inner_envelope.rcpttos,
-                "subject": str(inner_envelope.message.subject),
-                "date": inner_envelope.message.get_header("Date"),
-                "summary": summary,
-            }
             json.dump(metadata, fp)
 
         with open("error/%s.txt" % now, "w") as fp:
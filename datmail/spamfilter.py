@@ -0,0 +1,131 @@
+import threading
+
+from emailtunnel import logger
+
+try:
+    from datmail.config import SPAMFILTER_REFRESH_INTERVAL
+except ImportError:
+    SPAMFILTER_REFRESH_INTERVAL = 300
+
+
+def domain_labels(domain):
+    """Split `domain` into lowercase labels, starting from the TLD.
+
+    >>> domain_labels(".Fredagscafeen.dk")
+    ['dk', 'fredagscafeen']
+    """
+    domain = domain.strip().lower().strip(".")
+    if domain.startswith("*."):
+        domain = domain[2:]
+    if not domain:
+        return []
+    return domain.split(".")[::-1]
+
+
+class _Node:
+    __slots__ = ("children", "allowed", "blocked")
+
+    def __init__(self):
+        self.children = {}
+        self.allowed = False
+        self.blocked = False
+
+
+class DomainSuffixIndex:
+    """Compiled spam filter rules as a reversed-label suffix trie.
+
+    A rule for `fredagscafeen.dk` matches `fredagscafeen.dk` and any
+    subdomain of it, but not `evilfredagscafeen.dk`, since matching is done
+    on whole labels. Lookups walk at most one node per label of the domain.
+    """
+
+    def __init__(self, allowed_domains, blocked_domains, version=0):
+        self.version = version
+        self.root = _Node()
+        for domain in allowed_domains:
+            self._insert(domain).allowed = True
+        for domain in blocked_domains:
+            self._insert(domain).blocked = True
+
+    def _insert(self, domain):
+        node = self.root
+        for label in domain_labels(domain):
+            node = node.children.setdefault(label, _Node())
+        return node
+
+    def lookup(self, domain):
+        """Return (allowed, blocked) for the rules matching `domain`."""
+        node = self.root
+        allowed = node.allowed
+        blocked = node.blocked
+        for label in domain_labels(domain):
+            node = node.children.get(label)
+            if node is None:
+                break
+            allowed = allowed or node.allowed
+            blocked = blocked or node.blocked
+        return allowed, blocked
+
+    def is_spam(self, domain):
+        allowed, blocked = self.lookup(domain)
+        return blocked or not allowed
+
+
+class SpamFilter:
+    """Spam filter rules from Django, compiled and refreshed in the background.
+
+    `is_spam` only consults the most recently compiled DomainSuffixIndex,
+    which is swapped atomically on refresh. Until the rules have been
+    loaded once, `is_spam` fetches them itself and lets the error
+    propagate if Django is unavailable, so no mail is delivered unfiltered.
+    """
+
+    def __init__(self, api_client, refresh_interval=SPAMFILTER_REFRESH_INTERVAL):
+        self.api_client = api_client
+        self.refresh_interval = refresh_interval
+        self.index = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self):
+        index = self.index
+        return index.version if index is not None else 0
+
+    def refresh(self):
+        allowed_domains, blocked_domains = self.api_client.get_spamfilter()
+        self.index = DomainSuffixIndex(
+            allowed_domains, blocked_domains, version=self.version + 1
+        )
+        return self.index
+
+    def start(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Could not load spam filter from Django")
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _refresh_loop(self):
+        while True:
+            if self.index is None:
+                # Retry sooner until we have loaded the rules once
+                interval = min(self.refresh_interval, 30)
+            else:
+                interval = self.refresh_interval
+            if self._stopped.wait(interval):
+                return
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Could not refresh spam filter from Django")
+
+    def is_spam(self, domain):
+        index = self.index
+        if index is None:
+            index = self.refresh()
+        return index.is_spam(domain)
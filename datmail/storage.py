@@ -1,29 +1,113 @@
 import boto3
+import boto3.s3.transfer
 import datetime
+import os
 from emailtunnel import logger
+from datmail.chunks import (
+    CODECS,
+    ChunkReader,
+    body_chunks,
+    body_size,
+    compress,
+    compress_file,
+    decompress,
+)
 from datmail.config import S3_ENDPOINT_URL, S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY
 
+try:
+    from datmail.config import ARCHIVE_COMPRESSION
+except ImportError:
+    ARCHIVE_COMPRESSION = None
+
+try:
+    from datmail.config import (
+        ARCHIVE_MULTIPART_THRESHOLD,
+        ARCHIVE_MULTIPART_CHUNKSIZE,
+        ARCHIVE_MULTIPART_CONCURRENCY,
+    )
+except ImportError:
+    ARCHIVE_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+    ARCHIVE_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+    ARCHIVE_MULTIPART_CONCURRENCY = 4
+
+
 class Storage:
-    def __init__(self, bucket_name, region):
+    def __init__(
+        self, bucket_name, region, compression=ARCHIVE_COMPRESSION, s3_client=None
+    ):
+        if compression is not None and compression not in CODECS:
+            raise ValueError(f"Unknown archive compression {compression!r}")
         self.bucket_name = bucket_name
-        self.s3_client = boto3.client(
-            's3',
-            endpoint_url=S3_ENDPOINT_URL,
-            aws_access_key_id=S3_ACCESS_KEY_ID,
-            aws_secret_access_key=S3_SECRET_ACCESS_KEY,
-            region_name=region
+        self.compression = compression
+        if s3_client is None:
+            s3_client = boto3.client(
+                's3',
+                endpoint_url=S3_ENDPOINT_URL,
+                aws_access_key_id=S3_ACCESS_KEY_ID,
+                aws_secret_access_key=S3_SECRET_ACCESS_KEY,
+                region_name=region
+            )
+        self.s3_client = s3_client
+        self.multipart_threshold = ARCHIVE_MULTIPART_THRESHOLD
+        self.transfer_config = boto3.s3.transfer.TransferConfig(
+            multipart_threshold=ARCHIVE_MULTIPART_THRESHOLD,
+            multipart_chunksize=ARCHIVE_MULTIPART_CHUNKSIZE,
+            max_concurrency=ARCHIVE_MULTIPART_CONCURRENCY,
         )
 
-    def upload_object(self, body, object_name):
+    def _extra_args(self, codec):
+        return {
+            "Expires": datetime.datetime.now() + datetime.timedelta(days=90),
+            "Metadata": {"codec": codec} if codec else {},
+        }
+
+    def put_object(self, body, object_name):
+        size = body_size(body)
+        if size >= self.multipart_threshold:
+            self.put_fileobj(ChunkReader(body_chunks(body)), object_name, size)
+            return
+        body, codec = compress(body, self.compression)
+        if not isinstance(body, (bytes, bytearray)):
+            body = ChunkReader(body_chunks(body))
+        self.s3_client.put_object(
+            Body=body,
+            Bucket=self.bucket_name,
+            Key=object_name,
+            **self._extra_args(codec),
+        )
+
+        logger.info(f"File {object_name} uploaded to {self.bucket_name} with expiration in 90 days.")
+
+    def put_file(self, path, object_name, compress=True):
+        with open(path, "rb") as fp:
+            self.put_fileobj(
+                fp, object_name, os.fstat(fp.fileno()).st_size, compress=compress
+            )
+
+    def put_fileobj(self, fileobj, object_name, size, compress=True):
+        """Upload a large message from a file, in parallel multipart chunks.
+
+        Only a few chunks are in memory at a time, however large the message.
+        """
+        codec = self.compression if compress else None
+        body, codec = compress_file(fileobj, codec, size)
         try:
-            self.s3_client.put_object(
-                Body=body,
-                Bucket=self.bucket_name,
-                Key=object_name,
-                Expires=datetime.datetime.now() + datetime.timedelta(days=90)
+            self.s3_client.upload_fileobj(
+                body,
+                self.bucket_name,
+                object_name,
+                ExtraArgs=self._extra_args(codec),
+                Config=self.transfer_config,
             )
+        finally:
+            if body is not fileobj:
+                body.close()
+
+        logger.info(f"File {object_name} ({size} bytes) uploaded to {self.bucket_name} with expiration in 90 days.")
 
-            logger.info(f"File {object_name} uploaded to {self.bucket_name} with expiration in 90 days.")
+    def upload_object(self, body, object_name):
+        try:
+            self.put_object(body, object_name)
         except Exception as e:
             logger.error(f"Error uploading file: {e}")
 
@@ -33,7 +117,24 @@ class Storage:
                 Bucket=self.bucket_name,
                 Key=object_name,
             )
-            return response["Body"].read()
+            body = response["Body"].read()
+            return decompress(body, response.get("Metadata", {}).get("codec"))
         except Exception as e:
             logger.error(f"Error downloading file: {e}")
             raise
+
+    def list_objects(self, prefix):
+        """Yield the names of the objects whose names start with `prefix`."""
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"]
+
+    def get_range(self, object_name, offset, length):
+        """Return `length` bytes of `object_name` from `offset`, as stored."""
+        response = self.s3_client.get_object(
+            Bucket=self.bucket_name,
+            Key=object_name,
+            Range=f"bytes={offset}-{offset + length - 1}",
+        )
+        return response["Body"].read()
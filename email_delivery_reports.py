@@ -1,10 +1,18 @@
-from datmail.delivery_reports import email_delivery_reports, dump_stats
+import sys
+
+from datmail.delivery_reports import parallel_email_delivery_reports, dump_stats
 
 
 # prefixes = {}
 # postfixes = {}
 
 
-for errorname, report in email_delivery_reports():
-    print(errorname, report.notification)
-dump_stats()
+def main():
+    # Optional ISO date range, e.g. python email_delivery_reports.py 2026-01-01
+    for errorname, report in parallel_email_delivery_reports(*sys.argv[1:3]):
+        print(errorname, report.notification)
+    dump_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
-import os
 import re
+import sys
 import email
 
+from datmail.errorarchive import ErrorArchive
+
 
 BY_POSTFIX = r''
 SMTP_ID = r'with E?SMTPS? id [+A-Za-z0-9-]+'
@@ -21,10 +23,11 @@ patterns = [
 ]
 
 
-for f in os.listdir('errorarchive'):
-    if not f.endswith('.mail'):
-        continue
-    with open('errorarchive/%s' % f, 'rb') as fp:
+# Optional ISO date range, e.g. python received.py 2026-01-01 2026-06-30
+since, until = (sys.argv[1:] + [None, None])[:2]
+
+for f, path in ErrorArchive().paths('mail', since, until):
+    with open(path, 'rb') as fp:
         message = email.message_from_binary_file(fp)
     received = message.get_all('Received')
     if received is None:
@@ -1,7 +1,9 @@
 import datetime
 import importlib
+import itertools
 import os
 import sys
+import threading
 import types
 import unittest
 from unittest.mock import Mock, patch
@@ -23,6 +25,12 @@ from datmail.django_api_client import DjangoAPIClient
 class AddressTests(unittest.TestCase):
     def setUp(self):
         self.api_client = DjangoAPIClient()
+        patcher = patch(
+            "datmail.django_api_client.get_shared_client",
+            return_value=self.api_client,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     @requests_mock.Mocker()
     def test_get_admin_emails(self, m):
@@ -128,6 +136,20 @@ class AddressTests(unittest.TestCase):
         with self.assertRaises(address.InvalidRecipient):
             address.translate_recipient("anyalias", list_group_origins=True)
     
+    def test_open_circuit_is_logged_without_traceback(self):
+        self.api_client.get_mailinglist = Mock(
+            side_effect=address.datmail.django_api_client.CircuitOpenError("open")
+        )
+
+        with patch.object(address, "circuit_open_count", itertools.count(1)):
+            with patch.object(address, "logger") as logger:
+                result = address.parse_alias_group("best", self.api_client)
+                address.parse_alias_group("alle", self.api_client)
+
+        self.assertEqual(result, (None, None, None, None))
+        logger.exception.assert_not_called()
+        logger.warning.assert_called_once()
+
     @requests_mock.Mocker()
     def test_translate_recipient_valid_alias(self, m):
         m.get("http://localhost:8000/en/api/mail/lists/testlist/", json={
@@ -153,4 +175,75 @@ class AddressTests(unittest.TestCase):
         self.assertIn("test@example.com", recipient_emails)
         self.assertIn("test2@example.com", recipient_emails)
         self.assertEqual(group_origins.get("test@example.com"), address.GroupAlias("testlist"))
-        self.assertEqual(group_origins.get("test2@example.com"), address.GroupAlias("testlist"))
\ No newline at end of file
+        self.assertEqual(group_origins.get("test2@example.com"), address.GroupAlias("testlist"))
+
+    def test_parse_recipient_resolves_aliases_concurrently(self):
+        lists = {
+            "best": ["a@example.com", "b@example.com", "c@example.com"],
+            "koordinator": ["d@example.com"],
+            "anders": ["b@example.com"],
+        }
+        barrier = threading.Barrier(3, timeout=5)
+
+        def get_mailinglist_info(name):
+            barrier.wait()
+            return {"members": [{"email": e} for e in lists[name]]}
+
+        self.api_client.get_mailinglist_info = Mock(side_effect=get_mailinglist_info)
+
+        recipient_emails, origins = address.parse_recipient(
+            "best+koordinator-anders", self.api_client
+        )
+
+        self.assertEqual(
+            recipient_emails, ["a@example.com", "c@example.com", "d@example.com"]
+        )
+        self.assertEqual(
+            origins,
+            [
+                address.GroupAlias("best"),
+                address.GroupAlias("best"),
+                address.GroupAlias("koordinator"),
+            ],
+        )
+
+    def test_parse_recipient_origin_is_last_group_adding_the_member(self):
+        lists = {
+            "best": ["a@example.com", "b@example.com"],
+            "anders": ["b@example.com"],
+            "fu": ["b@example.com", "c@example.com"],
+        }
+        self.api_client.get_mailinglist_info = Mock(
+            side_effect=lambda name: {"members": [{"email": e} for e in lists[name]]}
+        )
+
+        recipient_emails, origins = address.parse_recipient(
+            "fu-anders+best", self.api_client
+        )
+
+        self.assertEqual(recipient_emails, ["a@example.com", "b@example.com", "c@example.com"])
+        self.assertEqual(
+            origins,
+            [address.GroupAlias("best"), address.GroupAlias("best"), address.GroupAlias("fu")],
+        )
+
+    def test_groups_are_looked_up_as_they_are_reached(self):
+        lists = {"best": ["a@example.com"], "fu": ["b@example.com"]}
+        self.api_client.get_mailinglist_info = Mock(
+            side_effect=lambda name: {"members": [{"email": e} for e in lists[name]]}
+        )
+        expansion = address.evaluate_recipient("best+fu", self.api_client)
+
+        with patch.object(expansion.index, "lookup", wraps=expansion.index.lookup) as lookup:
+            groups = expansion.groups()
+            self.assertEqual(next(groups), (address.GroupAlias("best"), ["a@example.com"]))
+            self.assertEqual(lookup.call_count, 1)
+            self.assertEqual(next(groups), (address.GroupAlias("fu"), ["b@example.com"]))
+
+    def test_parse_recipient_reports_all_invalid_aliases(self):
+        self.api_client.get_mailinglist_info = Mock(return_value=None)
+
+        with self.assertRaises(address.InvalidRecipient) as error:
+            address.parse_recipient("foo+bar", self.api_client)
+
+        self.assertEqual(error.exception.args[0], ["foo", "bar"])
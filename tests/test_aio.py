@@ -0,0 +1,68 @@
+import asyncio
+import smtplib
+import threading
+import unittest
+from unittest.mock import Mock
+
+from datmail.aio import ExecutorIngestServer
+
+
+class ExecutorIngestServerTests(unittest.TestCase):
+    def make_forwarder(self):
+        forwarder = Mock()
+        forwarder.DOMAIN = "fredagscafeen.dk"
+        forwarder.handle_envelope.return_value = None
+        return forwarder
+
+    def send(self, port, rcpttos):
+        with smtplib.SMTP("127.0.0.1", port) as client:
+            client.sendmail(
+                "sender@example.com", rcpttos, b"Subject: Test\r\n\r\nBody\r\n"
+            )
+
+    def run_server(self, forwarder, *deliveries):
+        async def scenario():
+            ingest = ExecutorIngestServer(forwarder, "127.0.0.1", 0, workers=4)
+            await ingest.start()
+            port = ingest.server.sockets[0].getsockname()[1]
+            loop = asyncio.get_running_loop()
+            try:
+                await asyncio.gather(
+                    *(
+                        loop.run_in_executor(None, self.send, port, rcpttos)
+                        for rcpttos in deliveries
+                    )
+                )
+            finally:
+                await ingest.stop()
+
+        asyncio.run(scenario())
+
+    def test_envelope_runs_through_forwarder_policy(self):
+        forwarder = self.make_forwarder()
+
+        self.run_server(forwarder, ["best+koordinator@fredagscafeen.dk"])
+
+        (peer, envelope), _ = forwarder.log_receipt.call_args
+        self.assertEqual(envelope.mailfrom, "sender@example.com")
+        self.assertEqual(envelope.rcpttos, ["best+koordinator@fredagscafeen.dk"])
+        forwarder.handle_envelope.assert_called_once_with(envelope, peer)
+        prefetched = {
+            c[0][0] for c in forwarder.api_client.get_mailinglist_info.call_args_list
+        }
+        self.assertEqual(prefetched, {"best", "koordinator"})
+        forwarder.handle_error.assert_not_called()
+
+    def test_envelopes_are_processed_concurrently(self):
+        forwarder = self.make_forwarder()
+        barrier = threading.Barrier(2, timeout=5)
+        forwarder.handle_envelope.side_effect = lambda envelope, peer: barrier.wait()
+
+        self.run_server(forwarder, ["best@fredagscafeen.dk"], ["alle@fredagscafeen.dk"])
+
+        self.assertEqual(forwarder.handle_envelope.call_count, 2)
+        forwarder.handle_error.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
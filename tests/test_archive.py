@@ -0,0 +1,148 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock
+
+from datmail.archive import REPLAY_MAX_ATTEMPTS, ArchiveQueue
+
+
+class ClientError(Exception):
+    """Stands in for botocore's ClientError."""
+
+    def __init__(self, status, code="Error"):
+        super().__init__(code)
+        self.response = {
+            "Error": {"Code": code},
+            "ResponseMetadata": {"HTTPStatusCode": status},
+        }
+
+
+class ArchiveQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.storage = Mock()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.spool_dir = tmp.name
+        self.archive = ArchiveQueue(
+            self.storage, spool_dir=self.spool_dir, maxsize=1, workers=1
+        )
+
+    def test_upload_object_returns_before_upload_and_worker_uploads(self):
+        release = threading.Event()
+        self.storage.put_object.side_effect = lambda body, name: release.wait(5)
+        self.archive.start()
+
+        self.archive.upload_object(b"eml", "archive/a.eml")
+        self.assertEqual(self.archive.get_object("archive/a.eml"), b"eml")
+        release.set()
+        self.archive.stop()
+
+        self.storage.put_object.assert_called_once_with(b"eml", "archive/a.eml")
+        self.assertEqual(self.archive.metrics()["uploaded"], 1)
+        self.assertIsNotNone(self.archive.metrics()["last_upload_latency"])
+
+    def test_full_queue_spills_to_spool(self):
+        self.archive.upload_object(b"first", "archive/a.eml")
+        self.archive.upload_object(b"second", "archive/b.eml")
+
+        self.assertEqual(self.archive.metrics()["queue_depth"], 1)
+        self.assertEqual(self.archive.metrics()["spooled"], 1)
+        self.assertEqual(os.listdir(self.spool_dir), ["archive%2Fb.eml"])
+        self.assertEqual(self.archive.get_object("archive/b.eml"), b"second")
+
+    def test_failed_upload_is_spooled_and_replayed_on_recovery(self):
+        self.storage.put_object.side_effect = ConnectionError("S3 down")
+        self.archive.start()
+        self.archive.upload_object(b"eml", "archive/a.eml")
+        self.archive.stop()
+
+        self.assertFalse(self.archive.s3_available)
+        self.assertEqual(os.listdir(self.spool_dir), ["archive%2Fa.eml"])
+
+        self.storage.put_object.side_effect = None
+        self.archive.replay()
+
+        self.assertTrue(self.archive.s3_available)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+        self.storage.put_object.assert_called_with(b"eml", "archive/a.eml")
+        self.assertEqual(self.archive.metrics()["replayed"], 1)
+
+    def test_get_object_falls_back_to_storage(self):
+        self.storage.get_object.return_value = b"stored"
+
+        self.assertEqual(self.archive.get_object("archive/a.eml"), b"stored")
+
+    def test_chunked_body_is_spooled_and_served_joined(self):
+        self.archive.s3_available = False
+        self.archive.upload_object(
+            [b"X-Id: 1\r\n", memoryview(b"eml")], "archive/a.eml"
+        )
+
+        with open(os.path.join(self.spool_dir, "archive%2Fa.eml"), "rb") as fp:
+            self.assertEqual(fp.read(), b"X-Id: 1\r\neml")
+        self.assertEqual(self.archive.get_object("archive/a.eml"), b"X-Id: 1\r\neml")
+
+    def test_large_message_is_uploaded_from_the_spool(self):
+        self.archive.large_size = 4
+        self.archive.start()
+        self.archive.upload_object(
+            [b"X-Id: 1\r\n", memoryview(b"eml")], "archive/a.eml"
+        )
+        self.archive.stop()
+
+        (path, object_name), _ = self.storage.put_file.call_args
+        self.assertEqual(object_name, "archive/a.eml")
+        self.assertEqual(path, os.path.join(self.spool_dir, "archive%2Fa.eml"))
+        self.assertEqual(self.archive.pending, {})
+        self.assertEqual(os.listdir(self.spool_dir), [])
+        self.assertEqual(self.archive.metrics()["streamed"], 1)
+
+    def spool(self, *names):
+        self.archive.s3_available = False
+        for name in names:
+            self.archive.upload_object(name.encode(), "archive/%s.eml" % name)
+
+    def test_rejected_message_is_quarantined_and_the_rest_replayed(self):
+        self.spool("a", "b", "c", "d")
+
+        def put_object(body, object_name):
+            if body == b"a":
+                raise ClientError(400, "InvalidRequest")
+
+        self.storage.put_object.side_effect = put_object
+        self.archive.replay()
+
+        self.assertTrue(self.archive.s3_available)
+        self.assertEqual(os.listdir(self.spool_dir), ["quarantine"])
+        self.assertEqual(os.listdir(self.archive.quarantine_dir), ["archive%2Fa.eml"])
+        self.assertEqual(self.archive.metrics()["replayed"], 3)
+        self.assertEqual(self.archive.metrics()["quarantined"], 1)
+
+    def test_message_failing_while_others_upload_is_quarantined(self):
+        self.spool("a")
+
+        def put_object(body, object_name):
+            if body == b"a":
+                raise ClientError(500, "InternalError")
+
+        self.storage.put_object.side_effect = put_object
+        for i in range(REPLAY_MAX_ATTEMPTS):
+            self.assertIn("archive%2Fa.eml", os.listdir(self.spool_dir))
+            self.spool("b%s" % i)
+            self.archive.replay()
+
+        self.assertEqual(os.listdir(self.spool_dir), ["quarantine"])
+        self.assertEqual(os.listdir(self.archive.quarantine_dir), ["archive%2Fa.eml"])
+        self.assertEqual(self.archive.metrics()["replayed"], REPLAY_MAX_ATTEMPTS)
+
+    def test_replay_stops_when_s3_is_down(self):
+        self.spool("a", "b", "c", "d")
+        self.storage.put_object.side_effect = ClientError(503, "SlowDown")
+
+        self.archive.replay()
+
+        self.assertFalse(self.archive.s3_available)
+        self.assertEqual(self.storage.put_object.call_count, 3)
+        self.assertEqual(len(os.listdir(self.spool_dir)), 4)
+        self.assertEqual(self.archive.replay_failures, {})
@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from datmail.cache import TTLCache
+
+
+class TTLCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = TTLCache(
+            ttl=10, stale_ttl=20, max_entries=2, clock=lambda: self.now
+        )
+
+    def test_evicts_least_recently_used_entry(self):
+        load = Mock(side_effect=lambda key, previous: (key.upper(), None))
+
+        self.cache.get("a", load)
+        self.cache.get("b", load)
+        self.cache.get("a", load)
+        self.cache.get("c", load)
+
+        self.assertIsNotNone(self.cache.peek("a"))
+        self.assertIsNone(self.cache.peek("b"))
+        self.assertEqual(self.cache.stats["evictions"], 1)
+
+    def test_count_is_safe_across_threads(self):
+        def count():
+            for _ in range(10000):
+                self.cache.count("filtered")
+
+        threads = [threading.Thread(target=count) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.cache.stats["filtered"], 40000)
+
+    def test_stale_entry_is_served_while_refreshing_in_background(self):
+        def load(key, previous):
+            return ("old" if previous is None else "new"), None
+
+        self.cache.get("a", load)
+        self.now = 15
+
+        self.assertEqual(self.cache.get("a", load), "old")
+        for _ in range(100):
+            if self.cache.stats["refreshes"]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.cache.get("a", load), "new")
+        self.assertEqual(self.cache.stats["stale_hits"], 1)
+
+    def test_entry_past_stale_window_is_reloaded_inline(self):
+        load = Mock(return_value=("value", None))
+
+        self.cache.get("a", load)
+        self.now = 31
+        self.cache.get("a", load)
+
+        self.assertEqual(load.call_count, 2)
+        self.assertEqual(self.cache.stats["misses"], 2)
@@ -0,0 +1,24 @@
+import io
+import unittest
+
+from datmail.chunks import ChunkReader, body_size, join_body
+
+
+class ChunkReaderTests(unittest.TestCase):
+    chunks = [b"X-Header: 1\r\n", memoryview(b"Subject: Hi\r\n\r\nBody\r\n")]
+
+    def test_reads_chunks_as_one_file(self):
+        reader = ChunkReader(self.chunks)
+
+        self.assertEqual(reader.read(), join_body(self.chunks))
+        self.assertEqual(reader.size, body_size(self.chunks))
+
+    def test_seek_and_partial_reads(self):
+        reader = ChunkReader(self.chunks)
+
+        reader.seek(10)
+        self.assertEqual(reader.read(6), b"1\r\nSub")
+        reader.seek(-6, io.SEEK_END)
+        self.assertEqual(reader.read(), b"Body\r\n")
+        reader.seek(0)
+        self.assertEqual(reader.read(3), b"X-H")
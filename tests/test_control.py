@@ -1,4 +1,5 @@
 import json
+import queue
 import threading
 import unittest
 import urllib.error
@@ -26,9 +27,9 @@ class ControlServerTests(unittest.TestCase):
         self.addCleanup(thread.join, 1)
         return server, forwarder
 
-    def post(self, server, payload, token="shared-secret"):
+    def post(self, server, payload, token="shared-secret", path="/control/resend"):
         request = urllib.request.Request(
-            f"http://127.0.0.1:{server.server_address[1]}/control/resend",
+            f"http://127.0.0.1:{server.server_address[1]}{path}",
             data=json.dumps(payload).encode("utf-8"),
             headers={
                 "Authorization": f"Bearer {token}",
@@ -38,8 +39,9 @@ class ControlServerTests(unittest.TestCase):
         )
         return urllib.request.urlopen(request)
 
-    def test_resend_endpoint_authenticates_and_dispatches_resend(self):
+    def test_resend_endpoint_authenticates_and_queues_resend_job(self):
         server, forwarder = self.start_server()
+        forwarder.submit_resend.return_value = {"id": "job-1", "status": "queued"}
 
         response = self.post(
             server,
@@ -52,13 +54,20 @@ class ControlServerTests(unittest.TestCase):
         )
 
         self.assertEqual(response.status, 202)
-        self.assertEqual(json.loads(response.read()), {"status": "queued"})
-        forwarder.resend_archived_mail.assert_called_once_with(
-            request_uuid="request-123",
-            target="alice@example.com",
-            sender="sender@example.com",
-            original_target="best@fredagscafeen.dk",
+        self.assertEqual(
+            json.loads(response.read()), {"status": "queued", "job_id": "job-1"}
         )
+        forwarder.submit_resend.assert_called_once_with(
+            [
+                {
+                    "request_uuid": "request-123",
+                    "target": "alice@example.com",
+                    "sender": "sender@example.com",
+                    "original_target": "best@fredagscafeen.dk",
+                }
+            ]
+        )
+        forwarder.resend_archived_mail.assert_not_called()
 
     def test_resend_endpoint_rejects_invalid_token(self):
         server, forwarder = self.start_server()
@@ -76,11 +85,28 @@ class ControlServerTests(unittest.TestCase):
             )
 
         self.assertEqual(error.exception.code, 401)
-        forwarder.resend_archived_mail.assert_not_called()
+        forwarder.submit_resend.assert_not_called()
 
-    def test_resend_endpoint_returns_server_error_when_resend_fails(self):
+    def test_resend_endpoint_returns_unavailable_when_queue_is_full(self):
         server, forwarder = self.start_server()
-        forwarder.resend_archived_mail.side_effect = RuntimeError("S3 unavailable")
+        forwarder.submit_resend.side_effect = queue.Full()
+
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            self.post(
+                server,
+                {
+                    "request_uuid": "request-123",
+                    "target": "alice@example.com",
+                    "sender": "sender@example.com",
+                    "original_target": "best@fredagscafeen.dk",
+                },
+            )
+
+        self.assertEqual(error.exception.code, 503)
+
+    def test_resend_endpoint_returns_server_error_when_queueing_fails(self):
+        server, forwarder = self.start_server()
+        forwarder.submit_resend.side_effect = OSError("disk full")
 
         with patch.object(datmail.control, "logger") as logger:
             with self.assertRaises(urllib.error.HTTPError) as error:
@@ -97,6 +123,120 @@ class ControlServerTests(unittest.TestCase):
         self.assertEqual(error.exception.code, 502)
         logger.exception.assert_called_once()
 
+    def test_bulk_resend_expands_targets_into_one_job(self):
+        server, forwarder = self.start_server()
+        forwarder.submit_resend.return_value = {"id": "job-1", "status": "queued"}
+
+        response = self.post(
+            server,
+            {
+                "items": [
+                    {
+                        "request_uuid": "request-123",
+                        "targets": ["alice@example.com", "bob@example.com"],
+                        "sender": "sender@example.com",
+                        "original_target": "best@fredagscafeen.dk",
+                    },
+                    {
+                        "request_uuid": "request-456",
+                        "target": "carol@example.com",
+                        "sender": "sender@example.com",
+                        "original_target": "best@fredagscafeen.dk",
+                    },
+                ]
+            },
+            path="/control/resend/bulk",
+        )
+
+        self.assertEqual(response.status, 202)
+        self.assertEqual(json.loads(response.read())["job_id"], "job-1")
+        (items,), _ = forwarder.submit_resend.call_args
+        self.assertEqual(
+            [(item["request_uuid"], item["target"]) for item in items],
+            [
+                ("request-123", "alice@example.com"),
+                ("request-123", "bob@example.com"),
+                ("request-456", "carol@example.com"),
+            ],
+        )
+
+    def test_bulk_resend_rejects_malformed_items(self):
+        server, forwarder = self.start_server()
+
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            self.post(
+                server,
+                {"items": [{"request_uuid": "request-123", "targets": "alice"}]},
+                path="/control/resend/bulk",
+            )
+
+        self.assertEqual(error.exception.code, 400)
+        forwarder.submit_resend.assert_not_called()
+
+    def test_job_endpoint_returns_job_status(self):
+        server, forwarder = self.start_server()
+        forwarder.get_resend_job.side_effect = lambda job_id: (
+            {"id": job_id, "status": "done", "sent": 1} if job_id == "job-1" else None
+        )
+
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_address[1]}/control/jobs/job-1",
+            headers={"Authorization": "Bearer shared-secret"},
+        )
+        response = urllib.request.urlopen(request)
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(response.read())["status"], "done")
+
+        request.full_url = request.full_url.replace("job-1", "job-2")
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request)
+        self.assertEqual(error.exception.code, 404)
+
+    def test_stats_endpoint_returns_forwarder_stats(self):
+        server, forwarder = self.start_server()
+        forwarder.get_stats.return_value = {"archive": {"queue_depth": 3}}
+
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_address[1]}/control/stats",
+            headers={"Authorization": "Bearer shared-secret"},
+        )
+        response = urllib.request.urlopen(request)
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(response.read()), {"archive": {"queue_depth": 3}})
+
+    def get(self, server, path):
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_address[1]}{path}",
+            headers={"Authorization": "Bearer shared-secret"},
+        )
+        return urllib.request.urlopen(request)
+
+    def test_mail_endpoint_queries_mail_index(self):
+        server, forwarder = self.start_server()
+        forwarder.query_mail.return_value = [{"request_uuid": "request-123"}]
+
+        response = self.get(
+            server, "/control/mail?list=best&sender=anders&since=2026-10-13"
+        )
+
+        self.assertEqual(
+            json.loads(response.read()), {"mail": [{"request_uuid": "request-123"}]}
+        )
+        forwarder.query_mail.assert_called_once_with(
+            mailing_list="best", sender="anders", since="2026-10-13"
+        )
+
+    def test_mail_endpoint_is_not_found_without_mail_index(self):
+        server, forwarder = self.start_server()
+        forwarder.query_mail.side_effect = LookupError
+
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            self.get(server, "/control/mail?list=best")
+
+        self.assertEqual(error.exception.code, 404)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,127 @@
+import email
+import os
+import tempfile
+import unittest
+
+from datmail.delivery_reports import (
+    email_delivery_reports,
+    parallel_email_delivery_reports,
+    parse_delivery_report,
+)
+from datmail.errorarchive import ErrorArchive
+
+DSN = """\
+From: MAILER-DAEMON@pulerau.scitechtinget.dk (Mail Delivery System)
+To: best@fredagscafeen.dk
+Subject: Undelivered Mail Returned to Sender
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status;
+ boundary="BOUNDARY"
+
+--BOUNDARY
+Content-Type: text/plain
+
+The mail system could not deliver your message.
+
+--BOUNDARY
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; pulerau.scitechtinget.dk
+
+Final-Recipient: rfc822; {recipient}
+Action: failed
+Status: 5.1.1
+Diagnostic-Code: X-Postfix; unknown user
+
+--BOUNDARY
+Content-Type: message/rfc822
+
+From: anders@example.com
+To: best@fredagscafeen.dk
+Subject: {subject}
+
+Hej
+
+--BOUNDARY--
+"""
+
+
+def make_dsn(recipient="alice@example.com", subject="Fredagscafe"):
+    return DSN.format(recipient=recipient, subject=subject)
+
+
+def make_untrusted_dsn(headers, body="Hej\n", rfc822_headers=False):
+    dsn = make_dsn().replace(
+        "MAILER-DAEMON@pulerau.scitechtinget.dk (Mail Delivery System)",
+        "MAILER-DAEMON@mx.example.net",
+    )
+    if rfc822_headers:
+        dsn = dsn.replace(
+            "Content-Type: message/rfc822", "Content-Type: text/rfc822-headers"
+        )
+    return dsn.replace("Subject: Fredagscafe\n\nHej\n", headers + "\n" + body)
+
+
+class DeliveryReportTests(unittest.TestCase):
+    def test_parse_delivery_report(self):
+        report = parse_delivery_report(email.message_from_string(make_dsn()))
+
+        self.assertEqual(report.recipients, ["alice@example.com"])
+        self.assertEqual(report.notification, "<alice@example.com>: unknown user")
+        self.assertEqual(report.message["Subject"], "Fredagscafe")
+
+    def test_untrusted_report_needs_marker_in_returned_headers(self):
+        marker = "List-Id: best <best.fredagscafeen.dk>"
+        received = "Received: from 172.18.0.2\n\tby emailtunnel.local with SMTP"
+        for headers, rfc822_headers, legitimate in [
+            (marker, False, True),
+            (marker, True, True),
+            (received, False, True),
+            ("Subject: Spam", False, False),
+        ]:
+            dsn = make_untrusted_dsn(headers + "\n", rfc822_headers=rfc822_headers)
+            report = parse_delivery_report(email.message_from_string(dsn))
+            self.assertEqual(bool(report), legitimate, headers)
+
+    def test_marker_in_returned_body_is_not_trusted(self):
+        dsn = make_untrusted_dsn(
+            "Subject: Spam\n", body="List-Id: best <best.fredagscafeen.dk>\n"
+        )
+
+        self.assertIsNone(parse_delivery_report(email.message_from_string(dsn)))
+
+    def test_parallel_parser_matches_serial_parser(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = tmp.name
+        archive = ErrorArchive(os.path.join(root, "errorarchive"))
+        os.makedirs(archive.directory)
+        for day in range(1, 8):
+            basename = "2026-10-%02d_12-00-00.000001" % day
+            with open(os.path.join(root, basename + ".mail"), "w") as fp:
+                fp.write(make_dsn("user%s@example.com" % day))
+            archive.add(root, basename)
+
+        serial = [
+            (base, report.recipients)
+            for base, report in email_delivery_reports("2026-10-02", archive=archive)
+        ]
+        ordered = [
+            (base, report.recipients)
+            for base, report in parallel_email_delivery_reports(
+                "2026-10-02", archive=archive, workers=2, chunksize=2
+            )
+        ]
+        unordered = parallel_email_delivery_reports(
+            "2026-10-02", archive=archive, workers=2, chunksize=2, ordered=False
+        )
+
+        self.assertEqual(len(serial), 6)
+        self.assertEqual(ordered, serial)
+        self.assertEqual(
+            sorted((base, report.recipients) for base, report in unordered), serial
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
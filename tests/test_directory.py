@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from datmail.directory import DirectorySnapshot
+
+
+def list_info(*emails):
+    return {"id": 1, "isOnlyInternal": False, "members": [{"email": e} for e in emails]}
+
+
+class DirectorySnapshotTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "directory.json")
+        self.api_client = Mock()
+        self.api_client.get_mailinglist_names.return_value = [
+            {"name": "best", "updated_at": "1"},
+            {"name": "alle", "updated_at": "1"},
+        ]
+        self.lists = {
+            "best": list_info("a@example.com"),
+            "alle": list_info("b@example.com"),
+        }
+        self.api_client.fetch_mailinglist_info.side_effect = lambda name, previous: (
+            self.lists[name],
+            None,
+        )
+        self.api_client.fetch_spamfilter_entries.return_value = [{"tld": ".dk"}]
+        self.snapshot = DirectorySnapshot(self.api_client, path=self.path)
+
+    def test_sync_builds_and_persists_snapshot(self):
+        self.assertEqual(self.snapshot.sync(), 2)
+
+        restarted = DirectorySnapshot(self.api_client, path=self.path)
+        restarted.load()
+
+        self.assertTrue(restarted.ready)
+        self.assertEqual(restarted.get_mailinglist_info("best"), self.lists["best"])
+        self.assertIsNone(restarted.get_mailinglist_info("nosuchlist"))
+        self.assertEqual(restarted.spamfilter, [{"tld": ".dk"}])
+
+    def test_sync_only_refetches_changed_lists(self):
+        self.snapshot.sync()
+        self.api_client.fetch_mailinglist_info.reset_mock()
+        self.api_client.get_mailinglist_names.return_value = [
+            {"name": "best", "updated_at": "2"},
+        ]
+        self.lists["best"] = list_info("c@example.com")
+
+        self.assertEqual(self.snapshot.sync(), 2)
+
+        self.api_client.fetch_mailinglist_info.assert_called_once_with("best", None)
+        self.assertEqual(self.snapshot.get_mailinglist_info("best"), self.lists["best"])
+        self.assertIsNone(self.snapshot.get_mailinglist_info("alle"))
+
+    def test_sync_revalidates_lists_without_updated_at(self):
+        self.api_client.get_mailinglist_names.return_value = [{"name": "best"}]
+        self.api_client.fetch_mailinglist_info.side_effect = lambda name, previous: (
+            (previous.value, previous.etag) if previous else (self.lists[name], '"v1"')
+        )
+        self.snapshot.sync()
+
+        self.assertEqual(self.snapshot.sync(), 0)
+        (name, previous), _ = self.api_client.fetch_mailinglist_info.call_args
+        self.assertEqual(previous.etag, '"v1"')
+
+    def test_list_names_are_case_insensitive(self):
+        self.api_client.get_mailinglist_names.return_value = [
+            {"name": "Best", "updated_at": "1"},
+        ]
+        self.api_client.fetch_mailinglist_info.side_effect = lambda name, previous: (
+            self.lists[name.lower()],
+            None,
+        )
+        self.snapshot.sync()
+
+        for name in ["best", "BEST", "Best"]:
+            self.assertEqual(
+                self.snapshot.get_mailinglist_info(name), self.lists["best"], name
+            )
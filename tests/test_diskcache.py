@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from datmail.archive import ArchiveQueue
+from datmail.diskcache import DiskCache
+
+
+class DiskCacheTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def test_least_recently_used_objects_are_evicted(self):
+        cache = DiskCache(self.directory, max_bytes=10)
+        cache.put("archive/a.eml", b"aaaa")
+        cache.put("archive/b.eml", [b"bb", memoryview(b"bb")])
+        self.assertEqual(cache.get("archive/a.eml"), b"aaaa")
+
+        cache.put("archive/c.eml", b"cccc")
+
+        self.assertIsNone(cache.get("archive/b.eml"))
+        self.assertEqual(cache.get("archive/a.eml"), b"aaaa")
+        self.assertEqual(cache.metrics()["size"], 8)
+        self.assertEqual(cache.metrics()["evictions"], 1)
+
+    def test_cache_is_reloaded_from_disk(self):
+        DiskCache(self.directory, max_bytes=10).put("archive/a.eml", b"aaaa")
+
+        cache = DiskCache(self.directory, max_bytes=10)
+
+        self.assertEqual(cache.size, 4)
+        self.assertEqual(cache.get("archive/a.eml"), b"aaaa")
+
+    def test_archive_queue_reads_through_cache(self):
+        storage = Mock()
+        storage.get_object.return_value = b"stored"
+        archive = ArchiveQueue(
+            storage,
+            spool_dir=os.path.join(self.directory, "spool"),
+            cache=DiskCache(os.path.join(self.directory, "cache")),
+        )
+
+        self.assertEqual(archive.get_object("archive/a.eml"), b"stored")
+        self.assertEqual(archive.get_object("archive/a.eml"), b"stored")
+
+        storage.get_object.assert_called_once_with("archive/a.eml")
+        self.assertEqual(archive.metrics()["cache"]["hits"], 1)
@@ -2,7 +2,7 @@ import importlib
 import sys
 import types
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 import datmail
 
 
@@ -22,14 +22,19 @@ config.DJANGO_API_TOKEN = "secret-token"
 sys.modules["datmail.config"] = config
 datmail.config = config
 
-from datmail.django_api_client import DjangoAPIClient
+from datmail import mailinglist
+from datmail.django_api_client import CircuitBreaker, CircuitOpenError, DjangoAPIClient
+from datmail.mailinglist import MemberIndex
+
 
 class DjangoAPIClientTests(unittest.TestCase):
     def setUp(self):
         self.api_client = DjangoAPIClient()
 
     def test_upsert_incoming_mail_posts_expected_payload(self):
-        with patch("datmail.django_api_client.requests.post") as mocked_post:
+        with patch("datmail.django_api_client.get_session") as get_session:
+            mocked_post = get_session.return_value.post
+            mocked_post.return_value = Mock(status_code=201)
             payload = {"request_uuid": "55555555-5555-4555-8555-555555555555"}
             self.api_client.upsert_incoming_mail(payload)
 
@@ -42,3 +47,172 @@ class DjangoAPIClientTests(unittest.TestCase):
                 },
                 timeout=5,
             )
+
+    def test_open_circuit_fails_fast_without_calling_django(self):
+        with patch("datmail.django_api_client.get_session") as get_session:
+            mocked_get = get_session.return_value.get
+            mocked_get.side_effect = ConnectionError("connection refused")
+            breaker = self.api_client._endpoint("spamfilter").breaker
+            for _ in range(breaker.threshold):
+                with self.assertRaises(ConnectionError):
+                    self.api_client.get_spamfilter()
+
+            with self.assertRaises(CircuitOpenError):
+                self.api_client.get_spamfilter()
+
+        self.assertEqual(mocked_get.call_count, breaker.threshold)
+        stats = self.api_client.endpoint_stats()["spamfilter"]
+        self.assertEqual(stats["state"], "open")
+        self.assertEqual(stats["failures"], breaker.threshold)
+        self.assertEqual(stats["rejected"], 1)
+
+    def test_upsert_incoming_mails_falls_back_when_bulk_endpoint_is_missing(self):
+        payloads = [{"request_uuid": "a"}, {"request_uuid": "b"}]
+        with patch("datmail.django_api_client.get_session") as get_session:
+            mocked_post = get_session.return_value.post
+            mocked_post.return_value = Mock(status_code=404)
+            self.api_client.upsert_incoming_mails(payloads)
+            self.api_client.upsert_incoming_mails(payloads)
+
+        urls = [c[0][0] for c in mocked_post.call_args_list]
+        self.assertEqual(
+            urls,
+            ["http://localhost:8000/en/api/monitoring/incoming-mails/bulk/"]
+            + ["http://localhost:8000/en/api/monitoring/incoming-mails/"] * 4,
+        )
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker(2, 30, clock=lambda: self.now)
+
+    def test_half_open_lets_one_trial_call_through(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call("lists")
+
+        self.now = 30
+        self.breaker.before_call("lists")
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call("lists")
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_failed_trial_reopens_circuit(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now = 30
+        self.breaker.before_call("lists")
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, "open")
+
+
+class DjangoAPIClientCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.api_client = DjangoAPIClient()
+        self.now = 0
+        self.api_client.list_cache.clock = lambda: self.now
+
+    def response(self, status_code=200, json=None, etag=None):
+        r = Mock(status_code=status_code, headers={"ETag": etag} if etag else {})
+        r.json.return_value = json
+        return r
+
+    def test_get_mailinglist_info_is_served_from_cache_within_ttl(self):
+        list_info = {"id": 42, "members": [{"id": 1, "email": "a@example.com"}]}
+        with patch("datmail.django_api_client.get_session") as get_session:
+            mocked_get = get_session.return_value.get
+            mocked_get.return_value = self.response(json=list_info)
+
+            self.assertEqual(self.api_client.get_mailinglist_info("best"), list_info)
+            self.assertEqual(
+                self.api_client.get_mailinglist_members("best"),
+                (["a@example.com"], [1]),
+            )
+
+        mocked_get.assert_called_once()
+        self.assertEqual(self.api_client.cache_stats()["hits"], 1)
+        self.assertEqual(self.api_client.cache_stats()["misses"], 1)
+
+    def test_get_mailinglist_is_compiled_once_per_version(self):
+        list_info = {"id": 42, "members": [{"id": 1, "email": "a@example.com"}]}
+        self.api_client.get_mailinglist_info = Mock(return_value=list_info)
+
+        first = self.api_client.get_mailinglist("best")
+        self.assertIs(self.api_client.get_mailinglist("best"), first)
+
+        self.api_client.get_mailinglist_info.return_value = dict(list_info)
+        self.assertIsNot(self.api_client.get_mailinglist("best"), first)
+
+    def test_recompiling_a_list_rebuilds_an_outgrown_member_index(self):
+        list_info = {"id": 42, "members": [{"id": 1, "email": "a@example.com"}]}
+        self.api_client.get_mailinglist_info = Mock(return_value=list_info)
+        with patch.object(mailinglist, "member_index", MemberIndex()):
+            stale = mailinglist.member_index
+            stale.bitmap(["former%s@example.com" % i for i in range(3000)])
+
+            best = self.api_client.get_mailinglist("best")
+
+            self.assertIsNot(mailinglist.member_index, stale)
+            index = mailinglist.member_index
+            self.assertEqual(
+                index.lookup(best.emails.bitmap_in(index)), ["a@example.com"]
+            )
+
+    def test_snapshot_lookups_ignore_list_name_case(self):
+        list_info = {"id": 42, "isOnlyInternal": True, "members": []}
+        self.api_client.snapshot = Mock(ready=True)
+        self.api_client.snapshot.get_mailinglist_info.side_effect = lambda name: (
+            list_info if name == "best" else None
+        )
+
+        self.assertEqual(self.api_client.get_mailinglist("BEST").info, list_info)
+        self.api_client.snapshot.get_mailinglist_info.assert_called_once_with("best")
+
+    def test_unknown_list_is_negatively_cached(self):
+        with patch("datmail.django_api_client.get_session") as get_session:
+            mocked_get = get_session.return_value.get
+            mocked_get.return_value = self.response(status_code=404)
+
+            self.assertIsNone(self.api_client.get_mailinglist_info("asdfgh"))
+            self.assertIsNone(self.api_client.get_mailinglist_info("asdfgh"))
+
+        mocked_get.assert_called_once()
+        self.assertEqual(self.api_client.cache_stats()["negative"]["hits"], 1)
+
+    def test_list_name_filter_skips_names_that_are_not_lists(self):
+        self.api_client.list_names = Mock()
+        self.api_client.list_names.might_exist.return_value = False
+        with patch("datmail.django_api_client.get_session") as get_session:
+            self.assertIsNone(self.api_client.get_mailinglist_info("asdfgh"))
+
+        get_session.assert_not_called()
+        self.assertEqual(self.api_client.cache_stats()["negative"]["filtered"], 1)
+
+    def test_ready_snapshot_answers_without_calling_django(self):
+        self.api_client.snapshot = Mock(ready=True, spamfilter=[{"tld": ".dk"}])
+        self.api_client.snapshot.get_mailinglist_info.return_value = None
+        with patch("datmail.django_api_client.get_session") as get_session:
+            self.assertIsNone(self.api_client.get_mailinglist_info("nosuchlist"))
+            self.assertEqual(self.api_client.get_spamfilter(), ([".dk"], []))
+
+        get_session.assert_not_called()
+
+    def test_expired_entry_is_revalidated_with_etag(self):
+        list_info = {"id": 42, "members": []}
+        self.api_client.list_cache.stale_ttl = 0
+        with patch("datmail.django_api_client.get_session") as get_session:
+            mocked_get = get_session.return_value.get
+            mocked_get.return_value = self.response(json=list_info, etag='"v1"')
+            self.api_client.get_mailinglist_info("best")
+
+            self.now = self.api_client.list_cache.ttl + 1
+            mocked_get.return_value = self.response(status_code=304)
+            self.assertEqual(self.api_client.get_mailinglist_info("best"), list_info)
+
+        self.assertEqual(mocked_get.call_args[1]["headers"]["If-None-Match"], '"v1"')
+        self.assertEqual(self.api_client.cache_stats()["not_modified"], 1)
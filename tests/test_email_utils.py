@@ -4,7 +4,7 @@ import datmail.email_utils as email_utils
 
 class ServerTests(unittest.TestCase):
     def setUp(self) -> None:
-        datmail.config.DSN_RECIPIENT = "web@fredagscafeen.dk"
+        email_utils.config.DSN_RECIPIENT = "web@fredagscafeen.dk"
 
     def test_extract_original_sender_valid_input(self):
         cleaned_mail = email_utils.extract_original_sender("SRS0=HASH=TTL=orig-domain=orig-local@forwarder")
@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import unittest
+
+from datmail.errorarchive import ErrorArchive
+
+
+class ErrorArchiveTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = tmp.name
+        self.error = os.path.join(root, "error")
+        self.archive = ErrorArchive(os.path.join(root, "errorarchive"))
+        os.makedirs(self.error)
+        os.makedirs(self.archive.directory)
+
+    def write_report(self, directory, basename, mail=True):
+        with open(os.path.join(directory, basename + ".json"), "w") as fp:
+            json.dump({"summary": "Spam from %s" % basename}, fp)
+        with open(os.path.join(directory, basename + ".txt"), "w") as fp:
+            fp.write("Summary: Spam\n")
+        if mail:
+            with open(os.path.join(directory, basename + ".mail"), "wb") as fp:
+                fp.write(b"Subject: Spam\n\nBody\n")
+
+    def test_reports_are_moved_into_date_shards_with_a_manifest(self):
+        self.write_report(self.error, "2026-10-13_12-00-00.000001")
+        self.write_report(self.error, "2026-10-13_13-00-00.000001", mail=False)
+
+        self.archive.add(self.error, "2026-10-13_12-00-00.000001", "Spam")
+        self.archive.add(self.error, "2026-10-13_13-00-00.000001")
+
+        self.assertEqual(os.listdir(self.error), [])
+        self.assertEqual(self.archive.shards(), ["2026-10-13"])
+        first, second = self.archive.manifest("2026-10-13")
+        self.assertEqual(first["summary"], "Spam")
+        self.assertEqual(first["files"], ["json", "mail", "txt"])
+        self.assertEqual(second["files"], ["json", "txt"])
+        self.assertGreater(first["size"], second["size"])
+
+    def test_iterators_skip_shards_outside_the_date_range(self):
+        for day in ["2026-10-11", "2026-10-12", "2026-10-13"]:
+            basename = day + "_12-00-00.000001"
+            self.write_report(self.error, basename)
+            self.archive.add(self.error, basename)
+
+        paths = list(self.archive.paths("mail", since="2026-10-12"))
+
+        self.assertEqual(
+            [basename[:10] for basename, path in paths], ["2026-10-12", "2026-10-13"]
+        )
+        self.assertTrue(all(os.path.exists(path) for basename, path in paths))
+        self.assertEqual(self.archive.shards(until="2026-10-11"), ["2026-10-11"])
+
+    def test_migrate_shards_the_flat_layout(self):
+        self.write_report(self.archive.directory, "2026-10-13_12-00-00.000001")
+        os.makedirs(os.path.join(self.archive.directory, "journal"))
+
+        self.assertEqual(self.archive.migrate(), 1)
+
+        [(shard, entry)] = self.archive.entries()
+        self.assertEqual(shard, "2026-10-13")
+        self.assertEqual(entry["summary"], "Spam from 2026-10-13_12-00-00.000001")
+
+
+if __name__ == "__main__":
+    unittest.main()
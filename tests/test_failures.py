@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+from datmail import errorarchive, failures
+from datmail.failures import FailureJournal, FailureJournalReader, read_index
+
+
+class FailureJournalTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = tmp.name
+        self.directory = os.path.join(root, "error", "journal")
+        self.archive = os.path.join(root, "errorarchive", "journal")
+
+    def start(self, **kwargs):
+        journal = FailureJournal(self.directory, fsync_interval=60, **kwargs)
+        journal.start()
+        self.addCleanup(journal.stop)
+        return journal
+
+    def reader(self):
+        return FailureJournalReader(self.directory, self.archive)
+
+    def test_records_are_pending_until_handled(self):
+        journal = self.start()
+        first = journal.append({"mailfrom": "a@example.com", "summary": "Spam"})
+        journal.append({"mailfrom": "b@example.com", "summary": "Unknown list"})
+
+        reader = self.reader()
+        entries = reader.pending()
+        records = list(reader.read(entries))
+        self.assertEqual([r["summary"] for r in records], ["Spam", "Unknown list"])
+        self.assertEqual(records[0]["id"], first)
+        self.assertEqual(entries[0].id, first)
+
+        reader.mark_handled(entries)
+        self.assertEqual(reader.pending(), [])
+
+        journal.append({"mailfrom": "c@example.com", "summary": "Later"})
+        self.assertEqual(len(reader.pending()), 1)
+
+    def test_handled_segments_are_archived_except_the_newest(self):
+        journal = self.start(segment_size=1)
+        for i in range(3):
+            journal.append({"summary": "failure %s" % i})
+        reader = self.reader()
+        self.assertEqual(len(reader.segments()), 3)
+
+        reader.mark_handled(reader.pending())
+
+        self.assertEqual(len(reader.segments()), 1)
+        self.assertEqual(len(os.listdir(self.archive)), 4)
+        self.assertEqual(reader.pending(), [])
+
+    def test_sync_fsyncs_in_batches(self):
+        journal = self.start()
+        for i in range(5):
+            journal.append({"summary": "failure %s" % i})
+
+        journal.sync()
+        journal.sync()
+
+        self.assertEqual(journal.metrics()["fsyncs"], 1)
+
+    def test_unindexed_records_are_indexed_on_start(self):
+        journal = self.start()
+        journal.append({"summary": "indexed"})
+        segment = journal.metrics()["segment"]
+        journal.stop()
+        path = os.path.join(self.directory, segment)
+        with open(path + ".jsonl", "ab") as fp:
+            fp.write(b'{"summary": "unindexed", "mtime": 1, "id": "x"}\n')
+        with open(path + ".idx", "a") as fp:
+            fp.write("42 1")  # Torn index line
+
+        self.start()
+
+        entries = read_index(self.directory, segment)
+        self.assertEqual([e.id for e in entries][1:], ["x"])
+        records = list(self.reader().read(entries))
+        self.assertEqual(records[1]["summary"], "unindexed")
+
+    def test_handled_segments_go_to_the_configured_error_archive(self):
+        self.assertEqual(
+            failures.FAILURE_JOURNAL_ARCHIVE_DIR,
+            os.path.join(errorarchive.ERROR_ARCHIVE_DIR, "journal"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import queue
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock
+
+from datmail.jobs import ResendJobQueue
+
+ITEM = {
+    "request_uuid": "request-123",
+    "target": "alice@example.com",
+    "sender": "sender@example.com",
+    "original_target": "best@fredagscafeen.dk",
+}
+
+
+def sent(items):
+    return [
+        dict(request_uuid=item["request_uuid"], target=item["target"], status="sent")
+        for item in items
+    ]
+
+
+class ResendJobQueueTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "jobs.jsonl")
+        self.forwarder = Mock()
+        self.forwarder.bulk_resend_archived_mail.side_effect = sent
+
+    def start(self, **kwargs):
+        jobs = ResendJobQueue(self.forwarder, path=self.path, **kwargs)
+        jobs.start()
+        self.addCleanup(jobs.stop)
+        return jobs
+
+    def wait_until_finished(self, jobs, job_id):
+        deadline = time.monotonic() + 5
+        while jobs.get(job_id)["status"] in ("queued", "running"):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        return jobs.get(job_id)
+
+    def test_submitted_job_is_run_and_keeps_results(self):
+        jobs = self.start()
+
+        job = jobs.submit([ITEM, dict(ITEM, target="bob@example.com")])
+        self.assertEqual((job["status"], job["size"]), ("queued", 2))
+
+        done = self.wait_until_finished(jobs, job["id"])
+        self.assertEqual(done["status"], "done")
+        self.assertEqual((done["sent"], done["failed"]), (2, 0))
+        self.assertEqual(done["results"][1]["target"], "bob@example.com")
+        self.assertEqual(jobs.metrics()["completed"], 1)
+
+    def test_failing_job_is_marked_failed(self):
+        self.forwarder.bulk_resend_archived_mail.side_effect = RuntimeError("boom")
+        jobs = self.start()
+
+        done = self.wait_until_finished(jobs, jobs.submit([ITEM])["id"])
+
+        self.assertEqual(done["status"], "failed")
+        self.assertEqual(done["error"], "boom")
+
+    def test_queued_jobs_survive_a_restart(self):
+        stopped = self.start(workers=0)
+        job_id = stopped.submit([ITEM])["id"]
+        stopped.stop()
+
+        jobs = self.start()
+
+        self.assertEqual(self.wait_until_finished(jobs, job_id)["status"], "done")
+        self.forwarder.bulk_resend_archived_mail.assert_called_once_with([ITEM])
+
+    def test_finished_jobs_are_pruned_after_retention(self):
+        jobs = self.start()
+        job_id = jobs.submit([ITEM])["id"]
+        self.wait_until_finished(jobs, job_id)
+        jobs.stop()
+
+        reloaded = self.start(retention=0)
+
+        self.assertIsNone(reloaded.get(job_id))
+
+    def test_submit_refuses_jobs_beyond_max_queued(self):
+        jobs = self.start(workers=0, max_queued=2)
+        jobs.submit([ITEM])
+        jobs.submit([ITEM])
+
+        with self.assertRaises(queue.Full):
+            jobs.submit([ITEM])
+        self.assertEqual(jobs.metrics()["rejected"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from unittest.mock import Mock
+
+from datmail.listnames import BloomFilter, ListNameFilter
+
+
+class BloomFilterTests(unittest.TestCase):
+    def test_added_names_are_always_found(self):
+        names = ["list%d" % i for i in range(1000)]
+        bloom = BloomFilter(len(names))
+        for name in names:
+            bloom.add(name)
+
+        self.assertTrue(all(name in bloom for name in names))
+
+    def test_false_positive_rate_is_near_error_rate(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add("list%d" % i)
+
+        false_positives = sum("spam%d" % i in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class ListNameFilterTests(unittest.TestCase):
+    def test_might_exist_before_and_after_refresh(self):
+        api_client = Mock()
+        api_client.get_mailinglist_names.return_value = [
+            {"name": "Best"},
+            {"name": "alle"},
+        ]
+        list_names = ListNameFilter(api_client)
+
+        self.assertTrue(list_names.might_exist("asdfgh"))
+        list_names.refresh()
+        self.assertTrue(list_names.might_exist("best"))
+        self.assertTrue(list_names.might_exist("ALLE"))
+        self.assertFalse(list_names.might_exist("asdfgh"))
@@ -0,0 +1,75 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from datmail import mailindex
+from datmail.mailindex import MailIndex
+
+
+class MailIndexTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.index = MailIndex(os.path.join(tmp.name, "mail.sqlite3"))
+        self.addCleanup(self.index.close)
+        self.index.add(
+            "uuid-1",
+            "2026-10-13T10:00:00Z",
+            mailfrom="anders@example.com",
+            sender="Anders <anders@example.com>",
+            target="best@fredagscafeen.dk",
+            mailing_list="best",
+            size=1234,
+            message_id="<1@example.com>",
+        )
+        self.index.add(
+            "uuid-2",
+            "2026-10-14T10:00:00Z",
+            mailfrom="bo@example.com",
+            target="alle@fredagscafeen.dk",
+            mailing_list="alle",
+        )
+
+    def test_query_filters(self):
+        def uuids(**filters):
+            return [row["request_uuid"] for row in self.index.query(**filters)]
+
+        self.assertEqual(uuids(), ["uuid-2", "uuid-1"])
+        self.assertEqual(uuids(mailing_list="BEST"), ["uuid-1"])
+        self.assertEqual(uuids(sender="anders"), ["uuid-1"])
+        self.assertEqual(uuids(since="2026-10-14"), ["uuid-2"])
+        self.assertEqual(uuids(until="2026-10-14"), ["uuid-1"])
+        self.assertEqual(uuids(message_id="<1@example.com>"), ["uuid-1"])
+        self.assertEqual(uuids(limit=1), ["uuid-2"])
+
+    def test_status_is_recorded(self):
+        self.index.set_status("uuid-1", "PROCESSED", "", 12)
+
+        (row,) = self.index.query(status="processed")
+        self.assertEqual(row["request_uuid"], "uuid-1")
+        self.assertEqual(row["recipients"], 12)
+        self.assertEqual(row["size"], 1234)
+        self.assertEqual(
+            self.index.query(status="RECEIVED")[0]["request_uuid"], "uuid-2"
+        )
+
+    def test_unknown_columns_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.index.add("uuid-3", "2026-10-15T10:00:00Z", subject="Hi")
+
+    def test_expired_rows_are_pruned_while_running(self):
+        expired = datetime.datetime.now(datetime.timezone.utc) - (
+            mailindex.RETENTION + datetime.timedelta(days=1)
+        )
+        # setUp added two rows, so the fourth add prunes
+        with patch.object(mailindex, "PRUNE_EVERY", 4):
+            self.index.add("uuid-old", expired.strftime("%Y-%m-%dT%H:%M:%SZ"))
+            uuids = [row["request_uuid"] for row in self.index.query()]
+            self.assertIn("uuid-old", uuids)
+            self.index.add("uuid-3", "2026-10-15T10:00:00Z")
+
+        uuids = [row["request_uuid"] for row in self.index.query()]
+        self.assertNotIn("uuid-old", uuids)
+        self.assertIn("uuid-3", uuids)
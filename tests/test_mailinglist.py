@@ -0,0 +1,69 @@
+import unittest
+from unittest.mock import Mock, patch
+
+import datmail.mailinglist
+from datmail.mailinglist import MailingList, MemberIndex, rebuild_member_index
+
+
+LIST_INFO = {
+    "id": 7,
+    "isOnlyInternal": True,
+    "members": [
+        {"id": 1, "email": "Anders@Example.com"},
+        {"id": 2, "email": None},
+        {"id": 3, "email": "bo@example.com"},
+    ],
+}
+
+
+class MailingListTests(unittest.TestCase):
+    def test_compiles_emails_and_normalized_members(self):
+        mailing_list = MailingList(LIST_INFO)
+
+        self.assertEqual(mailing_list.id, 7)
+        self.assertTrue(mailing_list.is_only_internal)
+        self.assertEqual(mailing_list.emails, ["Anders@Example.com", "bo@example.com"])
+        index = datmail.mailinglist.member_index
+        self.assertEqual(
+            index.lookup(mailing_list.emails.bitmap_in(index)), mailing_list.emails
+        )
+        self.assertEqual(mailing_list.members, {"anders@example.com", "bo@example.com"})
+
+    def test_has_member(self):
+        mailing_list = MailingList(LIST_INFO)
+
+        self.assertTrue(mailing_list.has_member("anders@example.COM"))
+        self.assertTrue(mailing_list.has_member("<bo@example.com>"))
+        self.assertTrue(
+            mailing_list.has_member("SRS0=HASH=TT=example.com=anders@forwarder.dk")
+        )
+        self.assertFalse(mailing_list.has_member("eve@example.com"))
+        self.assertFalse(mailing_list.has_member(None))
+
+
+class MemberIndexTests(unittest.TestCase):
+    def test_bitmap_round_trip(self):
+        index = MemberIndex()
+        a = index.bitmap(["a@example.com", "b@example.com", "c@example.com"])
+        b = index.bitmap(["b@example.com", "d@example.com"])
+
+        self.assertEqual(index.lookup(a & ~b), ["a@example.com", "c@example.com"])
+        self.assertEqual(index.lookup(a & b), ["b@example.com"])
+        self.assertEqual(index.lookup(0), [])
+        self.assertEqual(index.bitmap([]), 0)
+
+    @patch.object(datmail.mailinglist, "member_index", MemberIndex())
+    def test_rebuild_drops_former_members(self):
+        datmail.mailinglist.member_index.bitmap(
+            ["former%s@example.com" % i for i in range(3000)]
+        )
+        mailing_list = MailingList(LIST_INFO)
+
+        self.assertFalse(rebuild_member_index(live=2000))
+        self.assertTrue(rebuild_member_index(live=2))
+
+        index = datmail.mailinglist.member_index
+        self.assertEqual(len(index), 0)
+        bitmap = mailing_list.emails.bitmap_in(index)
+        self.assertEqual(bitmap, 0b11)
+        self.assertEqual(index.lookup(bitmap), mailing_list.emails)
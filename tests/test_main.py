@@ -31,6 +31,11 @@ def load_main_module():
     sys.modules["datmail.control"] = control_module
     datmail.control = control_module
 
+    aio_module = types.ModuleType("datmail.aio")
+    aio_module.ExecutorIngestServer = Mock()
+    sys.modules["datmail.aio"] = aio_module
+    datmail.aio = aio_module
+
     config_module = types.ModuleType("datmail.config")
     config_module.DATMAIL_CONTROL_HOST = "127.0.0.1"
     config_module.DATMAIL_CONTROL_PORT = 9100
@@ -48,7 +53,7 @@ class MainTests(unittest.TestCase):
         main_module = load_main_module()
         main_module.configure_logging = Mock()
         main_module.parser.parse_args = Mock(
-            return_value=argparse.Namespace(listen_port=9000, port=25)
+            return_value=argparse.Namespace(listen_port=9000, port=25, executor=False)
         )
         thread = Mock()
 
@@ -69,7 +74,32 @@ class MainTests(unittest.TestCase):
         )
         thread.start.assert_called_once_with()
         main_module.DatForwarder.return_value.run.assert_called_once_with()
+        main_module.ExecutorIngestServer.assert_not_called()
+
+    def test_main_runs_executor_ingest_server_when_requested(self):
+        main_module = load_main_module()
+        main_module.configure_logging = Mock()
+        main_module.parser.parse_args = Mock(
+            return_value=argparse.Namespace(listen_port=9000, port=25, executor=True)
+        )
+
+        with patch.object(main_module.threading, "Thread"):
+            main_module.main()
+
+        main_module.DatForwarder.assert_called_once_with(
+            None, None, "host.docker.internal", 25
+        )
+        main_module.ExecutorIngestServer.assert_called_once_with(
+            main_module.DatForwarder.return_value, "0.0.0.0", 9000
+        )
+        main_module.ExecutorIngestServer.return_value.run.assert_called_once_with()
+        main_module.DatForwarder.return_value.run.assert_not_called()
 
 
 if __name__ == "__main__":
     unittest.main()
+
+    def test_asyncio_flag_is_an_alias_of_executor(self):
+        main_module = load_main_module()
+
+        self.assertTrue(main_module.parser.parse_args(["--asyncio"]).executor)
@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from datmail.outbox import ReportOutbox
+
+
+class HTTPError(Exception):
+    """Stands in for requests' HTTPError."""
+
+    def __init__(self, status_code):
+        super().__init__("%s error" % status_code)
+        self.response = Mock(status_code=status_code)
+
+
+def report(request_uuid, status="PROCESSED"):
+    return {"request_uuid": request_uuid, "status": status}
+
+
+class ReportOutboxTests(unittest.TestCase):
+    def setUp(self):
+        self.api_client = Mock()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "outbox.jsonl")
+
+    def make_outbox(self, **kwargs):
+        kwargs.setdefault("dead_letter_path", self.path + ".dead")
+        outbox = ReportOutbox(self.api_client, path=self.path, **kwargs)
+        outbox.start()
+        self.addCleanup(outbox.stop)
+        return outbox
+
+    def test_flush_sends_coalesced_reports_in_batches(self):
+        outbox = ReportOutbox(self.api_client, path=self.path, batch_size=2)
+        outbox.put(report("a", "DROPPED"))
+        outbox.put(report("b"))
+        outbox.put(report("a"))
+        outbox.put(report("c"))
+
+        outbox.flush()
+
+        self.assertEqual(
+            [c[0][0] for c in self.api_client.upsert_incoming_mails.call_args_list],
+            [[report("b"), report("a")], [report("c")]],
+        )
+        self.assertEqual(outbox.metrics()["coalesced"], 1)
+        self.assertEqual(outbox.metrics()["pending"], 0)
+
+    def test_unsent_reports_survive_restart(self):
+        self.api_client.upsert_incoming_mails.side_effect = ConnectionError()
+        outbox = self.make_outbox(flush_interval=60)
+        outbox.put(report("a"))
+        outbox.put(report("b"))
+        with self.assertRaises(ConnectionError):
+            outbox.flush()
+        outbox.stop()
+
+        self.api_client.upsert_incoming_mails.side_effect = None
+        restarted = self.make_outbox(flush_interval=60)
+        restarted.flush()
+
+        self.api_client.upsert_incoming_mails.assert_called_with(
+            [report("a"), report("b")]
+        )
+        with open(self.path) as fp:
+            self.assertEqual(fp.read(), "")
+
+    def test_background_flush_when_batch_is_full(self):
+        outbox = self.make_outbox(batch_size=2, flush_interval=60)
+        outbox.put(report("a"))
+        outbox.put(report("b"))
+        outbox.stop()
+
+        self.api_client.upsert_incoming_mails.assert_called_once_with(
+            [report("a"), report("b")]
+        )
+
+    def test_rejected_report_is_dead_lettered_and_the_rest_sent(self):
+        def upsert_incoming_mails(payloads):
+            if report("c", "BAD") in payloads:
+                raise HTTPError(400)
+
+        self.api_client.upsert_incoming_mails.side_effect = upsert_incoming_mails
+        outbox = self.make_outbox(batch_size=8, flush_interval=60)
+        for key in "ab":
+            outbox.put(report(key))
+        outbox.put(report("c", "BAD"))
+        outbox.put(report("d"))
+
+        outbox.flush()
+
+        self.assertEqual(outbox.metrics()["pending"], 0)
+        self.assertEqual(outbox.metrics()["sent"], 3)
+        self.assertEqual(outbox.metrics()["dead_lettered"], 1)
+        with open(self.path + ".dead") as fp:
+            self.assertEqual(fp.read(), '{"request_uuid": "c", "status": "BAD"}\n')
+        with open(self.path) as fp:
+            self.assertEqual(fp.read(), "")
+
+    def test_server_errors_are_retried_not_dead_lettered(self):
+        self.api_client.upsert_incoming_mails.side_effect = HTTPError(503)
+        outbox = self.make_outbox(flush_interval=60)
+        outbox.put(report("a"))
+        outbox.put(report("b"))
+
+        with self.assertRaises(HTTPError):
+            outbox.flush()
+
+        self.assertEqual(outbox.metrics()["pending"], 2)
+        self.assertFalse(os.path.exists(self.path + ".dead"))
+
+    def test_reports_put_during_compaction_are_kept(self):
+        outbox = self.make_outbox(flush_interval=60)
+        outbox.put(report("a"))
+
+        with patch("datmail.outbox.os.fsync") as fsync:
+            fsync.side_effect = lambda fd: outbox.put(report("b"))
+            outbox.flush()
+        outbox.put(report("c"))
+
+        with open(self.path) as fp:
+            self.assertEqual(
+                [json.loads(line) for line in fp], [report("b"), report("c")]
+            )
@@ -0,0 +1,53 @@
+import json
+import os
+import tempfile
+import unittest
+
+from datmail.reportindex import ReportIndex
+
+
+class ReportIndexTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "index.json")
+
+    def reload(self):
+        index = ReportIndex(self.path)
+        index.load()
+        return index
+
+    def test_reports_are_cached_until_their_files_change(self):
+        index = self.reload()
+        self.assertIsNone(index.get("2026-10-13_12-00-00", [1, None]))
+        index.put("2026-10-13_12-00-00", [1, None], {"summary": "Spam"})
+        index.save()
+
+        index = self.reload()
+        self.assertEqual(
+            index.get("2026-10-13_12-00-00", [1, None]), {"summary": "Spam"}
+        )
+        self.assertIsNone(index.get("2026-10-13_12-00-00", [1, 2]))
+        self.assertEqual((index.hits, index.misses), (1, 1))
+
+    def test_save_drops_reports_not_seen_in_this_run(self):
+        index = self.reload()
+        index.put("archived", [1, None], {"summary": "Old"})
+        index.put("pending", [2, None], {"summary": "New"})
+        index.save()
+
+        index = self.reload()
+        index.get("pending", [2, None])
+        index.save()
+
+        self.assertEqual(list(self.reload().reports), ["pending"])
+
+    def test_index_from_another_version_is_ignored(self):
+        with open(self.path, "w") as fp:
+            json.dump({"version": 0, "reports": {"a": {}}}, fp)
+
+        self.assertEqual(self.reload().reports, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from datmail import segments as segments_module
+from datmail.segments import SegmentStorage, segment_key
+
+
+class FakeStorage:
+    compression = None
+
+    def __init__(self):
+        self.objects = {}
+        self.get_object = Mock(side_effect=KeyError)
+
+    def put_file(self, path, object_name, compress=True):
+        with open(path, "rb") as fp:
+            self.objects[object_name] = fp.read()
+
+    def put_object(self, body, object_name):
+        self.objects[object_name] = bytes(body)
+
+    def list_objects(self, prefix):
+        return [name for name in self.objects if name.startswith(prefix)]
+
+    def get_range(self, object_name, offset, length):
+        return self.objects[object_name][offset : offset + length]
+
+
+class SegmentStorageTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        self.storage = FakeStorage()
+        self.segments = SegmentStorage(self.storage, directory=self.directory)
+        self.segments.start()
+        self.addCleanup(self.segments.stop)
+
+    def test_messages_are_packed_into_one_segment(self):
+        self.segments.put_object(b"first", "archive/a.eml")
+        self.segments.put_object(
+            [b"X-Id: b\r\n", memoryview(b"second")], "archive/b.eml"
+        )
+
+        self.assertEqual(
+            self.segments.get_object("archive/b.eml"), b"X-Id: b\r\nsecond"
+        )
+        self.assertEqual(self.storage.objects, {})
+
+        self.segments.seal()
+        self.segments.upload_sealed()
+
+        (key,) = [k for k in self.storage.objects if k.endswith(".seg")]
+        self.assertEqual(self.storage.objects[key], b"firstX-Id: b\r\nsecond")
+        index = json.loads(self.storage.objects[key + ".idx.json"])
+        self.assertEqual(
+            [entry[0] for entry in index], ["archive/a.eml", "archive/b.eml"]
+        )
+        self.assertEqual(os.listdir(self.directory), ["index.jsonl"])
+
+    def test_uploaded_messages_are_read_with_range_gets(self):
+        self.segments.put_object(b"first", "archive/a.eml")
+        self.segments.put_object(b"second", "archive/b.eml")
+        self.segments.seal()
+        self.segments.upload_sealed()
+
+        self.assertEqual(self.segments.get_object("archive/b.eml"), b"second")
+        self.assertEqual(self.segments.metrics()["range_gets"], 1)
+
+    def test_full_segment_is_sealed_and_uploaded(self):
+        self.segments.max_size = 10
+        self.segments.put_object(b"0123456789", "archive/a.eml")
+        self.segments.put_object(b"next", "archive/b.eml")
+
+        self.assertEqual(self.segments.metrics()["segments_uploaded"], 1)
+        self.assertIsNotNone(self.segments.metrics()["open_segment"])
+
+    def test_index_and_open_segment_survive_a_restart(self):
+        self.segments.put_object(b"first", "archive/a.eml")
+        # Crash with the segment still open
+        self.segments._file.close()
+        self.segments._file = None
+
+        restarted = SegmentStorage(self.storage, directory=self.directory)
+        restarted.start()
+        self.addCleanup(restarted.stop)
+
+        self.assertEqual(restarted.get_object("archive/a.eml"), b"first")
+        restarted.upload_sealed()
+        key = segment_key(restarted.index["archive/a.eml"].segment)
+        self.assertEqual(self.storage.objects[key], b"first")
+
+    def test_unknown_names_fall_back_to_storage(self):
+        self.storage.get_object = Mock(return_value=b"legacy")
+
+        self.assertEqual(self.segments.get_object("archive/old.eml"), b"legacy")
+
+    def test_index_is_rebuilt_from_storage_when_missing(self):
+        self.segments.put_object(b"first", "archive/a.eml")
+        self.segments.seal()
+        self.segments.upload_sealed()
+        self.segments.put_object(b"second", "archive/b.eml")
+        self.segments.seal()
+        # b's segment is sealed but not uploaded
+        self.storage.put_file = Mock(side_effect=ConnectionError)
+        self.segments.stop()
+        self.storage.get_object = Mock(
+            side_effect=lambda name: self.storage.objects[name]
+        )
+        os.unlink(self.segments.index_path)
+
+        restarted = SegmentStorage(self.storage, directory=self.directory)
+        restarted.start()
+        self.addCleanup(restarted.stop)
+
+        self.assertEqual(sorted(restarted.index), ["archive/a.eml", "archive/b.eml"])
+        self.assertEqual(restarted.get_object("archive/a.eml"), b"first")
+        self.assertEqual(restarted.get_object("archive/b.eml"), b"second")
+        with open(restarted.index_path) as fp:
+            self.assertEqual(len(fp.readlines()), 2)
+
+    def test_expired_entries_are_dropped_and_the_index_compacted(self):
+        self.segments.put_object(b"old", "archive/old.eml")
+        self.segments.put_object(b"new", "archive/new.eml")
+        old = self.segments.index["archive/old.eml"]
+        self.segments.index["archive/old.eml"] = old._replace(stored_at=0)
+
+        with patch.object(segments_module, "COMPACT_SLACK", 0):
+            self.segments.compact_index()
+        self.segments.put_object(b"later", "archive/later.eml")
+
+        self.assertEqual(
+            list(self.segments.index), ["archive/new.eml", "archive/later.eml"]
+        )
+        with open(self.segments.index_path) as fp:
+            names = [json.loads(line)[0] for line in fp]
+        self.assertEqual(names, ["archive/new.eml", "archive/later.eml"])
+        self.assertEqual(self.segments.metrics()["index_compactions"], 1)
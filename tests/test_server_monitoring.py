@@ -2,6 +2,7 @@ import datetime
 import importlib
 import os
 import sys
+import tempfile
 import types
 import unittest
 from unittest.mock import Mock, patch
@@ -31,6 +32,8 @@ def load_server_module():
                     self._forward_recipients,
                     envelope.mailfrom,
                 )
+            for recipients in getattr(self, "_forward_groups", None) or []:
+                self.forward(envelope, envelope.message, recipients, envelope.mailfrom)
             return "handled-by-super"
 
         def forward(self, original_envelope, message, recipients, sender):
@@ -131,11 +134,17 @@ def load_server_module():
     return importlib.import_module("datmail.server")
 
 
+class FakeHeaders(dict):
+    def __delitem__(self, name):
+        # Like email.message.Message, deleting a missing header is a no-op
+        self.pop(name, None)
+
+
 class FakeMessage:
     def __init__(self):
         self.headers = {}
         self.subject = "Subject"
-        self.message = {"DKIM-Signature": "signature"}
+        self.message = FakeHeaders({"DKIM-Signature": "signature"})
 
     def add_header(self, name, value):
         self.headers[name] = value
@@ -179,6 +188,8 @@ class ServerMonitoringTests(unittest.TestCase):
         self.forwarder.STRIP_HTML = False
         self.forwarder.api_client = Mock()
         self.forwarder.api_client.get_spamfilter = Mock(return_value=[("fredagscafeen.dk", ".com"), ("hundichyan.com", "cheapwatches.com")])
+        self.forwarder.spam_filter = self.server_module.SpamFilter(self.forwarder.api_client)
+        self.forwarder.spam_filter.refresh()
         self.forwarder.store_failed_envelope = Mock()
         self.forwarder.fix_headers = Mock()
         self.forwarder.handle_delivery_report = Mock(return_value=False)
@@ -186,6 +197,8 @@ class ServerMonitoringTests(unittest.TestCase):
         self.forwarder.get_from_domain = Mock(return_value="example.com")
         self.forwarder.reject = Mock(return_value=None)
         self.forwarder.storage = Mock()
+        self.forwarder.outbox = None
+        self.forwarder.mail_index = None
         self.forwarder.deliver_recipients = {}
         self.forwarder.delivered = 0
         self.forwarder.year = 2026
@@ -203,6 +216,47 @@ class ServerMonitoringTests(unittest.TestCase):
         self.forwarder.store_envelope.assert_called_once_with(envelope)
         self.forwarder.api_client.upsert_incoming_mail.assert_not_called()
 
+    def test_store_envelope_archives_data_as_received(self):
+        envelope = FakeEnvelope()
+        envelope.message.add_header("X-Fredagscafeen-Envelope-ID", "request-123")
+        envelope.raw_data = b"Subject: Hi\r\n\r\nBody\r\n"
+
+        self.forwarder.store_envelope(envelope)
+
+        (body, object_name), _ = self.forwarder.storage.upload_object.call_args
+        self.assertEqual(object_name, "archive/request-123.eml")
+        self.assertEqual(
+            b"".join(body),
+            b"X-Fredagscafeen-Envelope-ID: request-123\r\n"
+            b"Subject: Hi\r\n\r\nBody\r\n",
+        )
+        self.assertIs(body[1].obj, envelope.raw_data)
+
+    def test_mail_index_records_archived_mail_and_final_status(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.forwarder.mail_index = self.server_module.MailIndex(
+            os.path.join(tmp.name, "mail.sqlite3")
+        )
+        self.addCleanup(self.forwarder.mail_index.close)
+        envelope = FakeEnvelope()
+        envelope.message.add_header("X-Fredagscafeen-Envelope-ID", "request-123")
+        envelope.raw_data = b"Subject: Hi\r\n\r\nBody\r\n"
+
+        self.forwarder.store_envelope(envelope)
+        self.forwarder.report_processed_mail(
+            envelope, expanded_recipients={"bob@example.com"}, mailing_list_name="best"
+        )
+
+        (row,) = self.forwarder.query_mail(mailing_list="best")
+        self.assertEqual(row["request_uuid"], "request-123")
+        self.assertEqual(row["status"], "PROCESSED")
+        self.assertEqual(row["recipients"], 1)
+        self.assertEqual(
+            row["size"],
+            len(b"X-Fredagscafeen-Envelope-ID: request-123\r\n" + envelope.raw_data),
+        )
+
     def test_report_processed_mail_posts_expected_payload(self):
         envelope = FakeEnvelope()
         envelope.message.add_header("X-Fredagscafeen-Envelope-ID", "request-123")
@@ -247,6 +301,18 @@ class ServerMonitoringTests(unittest.TestCase):
             }
         )
 
+    def test_reports_go_through_outbox_when_configured(self):
+        envelope = FakeEnvelope()
+        envelope.message.add_header("X-Fredagscafeen-Envelope-ID", "request-123")
+        self.forwarder.outbox = Mock()
+
+        self.forwarder.report_dropped_mail(envelope, "spam filter triggered")
+
+        self.forwarder.api_client.upsert_incoming_mail.assert_not_called()
+        (payload,), _ = self.forwarder.outbox.put.call_args
+        self.assertEqual(payload["request_uuid"], "request-123")
+        self.assertEqual(payload["status"], "DROPPED")
+
     def test_report_dropped_mail_handles_missing_target(self):
         envelope = FakeEnvelope(rcpttos=[])
         envelope.message.add_header("X-Fredagscafeen-Envelope-ID", "request-123")
@@ -267,6 +333,18 @@ class ServerMonitoringTests(unittest.TestCase):
             }
         )
 
+    def test_internal_only_check_ignores_list_name_case(self):
+        envelope = FakeEnvelope(rcpttos=["BEST@fredagscafeen.dk"])
+        self.forwarder.is_sender_authorized_for_list = Mock(return_value=False)
+        self.forwarder.report_dropped_mail = Mock()
+
+        self.forwarder.handle_envelope(envelope, peer=("127.0.0.1", 12345))
+
+        self.forwarder.is_sender_authorized_for_list.assert_called_once_with(
+            "sender@example.com", "best"
+        )
+        self.forwarder.report_dropped_mail.assert_called_once()
+
     def test_handle_envelope_reports_dropped_mail_after_reject(self):
         envelope = FakeEnvelope()
 
@@ -281,6 +359,30 @@ class ServerMonitoringTests(unittest.TestCase):
             "Rejected by DatForwarder.reject (invalid header encoding)",
         )
 
+    def test_handle_envelope_drops_spam_without_fetching_spam_filter(self):
+        envelope = FakeEnvelope()
+        self.forwarder.get_from_domain = Mock(return_value="shop.cheapwatches.com")
+        self.forwarder.report_dropped_mail = Mock()
+
+        self.forwarder.handle_envelope(envelope, peer=("127.0.0.1", 12345))
+
+        self.forwarder.api_client.get_spamfilter.assert_called_once_with()
+        self.forwarder.report_dropped_mail.assert_called_once_with(
+            envelope, "Rejected: spam filter triggered"
+        )
+        self.assertFalse(self.forwarder._super_handled)
+
+    def test_handle_envelope_fails_while_spam_filter_cannot_be_loaded(self):
+        envelope = FakeEnvelope()
+        self.forwarder.get_from_domain = Mock(return_value="fredagscafeen.dk")
+        self.forwarder.spam_filter.index = None
+        self.forwarder.api_client.get_spamfilter.side_effect = ConnectionError()
+
+        with self.assertRaises(ConnectionError):
+            self.forwarder.handle_envelope(envelope, peer=("127.0.0.1", 12345))
+
+        self.assertFalse(self.forwarder._super_handled)
+
     def test_handle_envelope_reports_processed_mail_after_super_handles_it(self):
         envelope = FakeEnvelope()
         envelope.message.add_header("X-Fredagscafeen-Envelope-ID", "request-123")
@@ -303,6 +405,22 @@ class ServerMonitoringTests(unittest.TestCase):
             "best",
         )
 
+    def test_handle_envelope_reports_once_for_all_recipient_groups(self):
+        envelope = FakeEnvelope()
+        self.forwarder._forward_groups = [
+            ["alice@example.com", "bob@example.com"],
+            ["carol@example.com"],
+        ]
+        self.forwarder.report_processed_mail = Mock()
+
+        self.forwarder.handle_envelope(envelope, peer=("127.0.0.1", 12345))
+
+        self.forwarder.report_processed_mail.assert_called_once_with(
+            envelope,
+            {"alice@example.com", "bob@example.com", "carol@example.com"},
+            "best",
+        )
+
     def test_handle_envelope_reports_processed_mail_without_monitoring_translation(self):
         envelope = FakeEnvelope()
         envelope.message.add_header("X-Fredagscafeen-Envelope-ID", "request-123")
@@ -345,6 +463,71 @@ class ServerMonitoringTests(unittest.TestCase):
         self.assertEqual(recipients, ["alice@example.com"])
         self.assertEqual(sender, "sender@example.com")
 
+    def test_resend_batch_fetches_and_parses_each_message_once(self):
+        self.forwarder.storage.get_object.return_value = b"Subject: Test\n\nBody"
+        self.forwarder.forward = Mock()
+        self.forwarder.get_extra_headers = Mock(return_value=[])
+        batch = {}
+
+        for target in ["alice@example.com", "bob@example.com"]:
+            self.forwarder.resend_archived_mail(
+                request_uuid="request-123",
+                target=target,
+                sender="sender@example.com",
+                original_target="best@fredagscafeen.dk",
+                batch=batch,
+            )
+
+        self.forwarder.storage.get_object.assert_called_once()
+        first, second = [c[0][1].message for c in self.forwarder.forward.call_args_list]
+        self.assertIsNot(first, second)
+        self.assertEqual(second["Subject"], "Test")
+
+    def test_bulk_resend_groups_items_per_message_and_reports_failures(self):
+        bodies = {
+            "archive/request-123.eml": b"Subject: One\n\nBody",
+            "archive/request-456.eml": b"Subject: Two\n\nBody",
+        }
+
+        def get_object(name):
+            if name not in bodies:
+                raise KeyError(name)
+            return bodies[name]
+
+        self.forwarder.storage.get_object.side_effect = get_object
+        self.forwarder.forward = Mock()
+        self.forwarder.get_extra_headers = Mock(return_value=[])
+        items = [
+            dict(
+                request_uuid=request_uuid,
+                target=target,
+                sender="sender@example.com",
+                original_target="best@fredagscafeen.dk",
+            )
+            for request_uuid, target in [
+                ("request-123", "alice@example.com"),
+                ("request-456", "alice@example.com"),
+                ("request-123", "bob@example.com"),
+                ("missing", "alice@example.com"),
+            ]
+        ]
+
+        with patch.object(self.server_module, "logger"):
+            results = self.forwarder.bulk_resend_archived_mail(items, workers=2)
+
+        self.assertEqual(
+            [(r["request_uuid"], r["target"], r["status"]) for r in results],
+            [
+                ("request-123", "alice@example.com", "sent"),
+                ("request-456", "alice@example.com", "sent"),
+                ("request-123", "bob@example.com", "sent"),
+                ("missing", "alice@example.com", "failed"),
+            ],
+        )
+        fetched = [c[0][0] for c in self.forwarder.storage.get_object.call_args_list]
+        self.assertEqual(fetched.count("archive/request-123.eml"), 1)
+        self.assertEqual(self.forwarder.forward.call_count, 3)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import Mock
+
+from datmail.spamfilter import DomainSuffixIndex, SpamFilter
+
+
+class DomainSuffixIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = DomainSuffixIndex(
+            allowed_domains=["fredagscafeen.dk", ".com"],
+            blocked_domains=["cheapwatches.com"],
+        )
+
+    def test_matches_domain_and_subdomains(self):
+        self.assertFalse(self.index.is_spam("fredagscafeen.dk"))
+        self.assertFalse(self.index.is_spam("mail.FREDAGSCAFEEN.dk"))
+        self.assertFalse(self.index.is_spam("example.com"))
+
+    def test_matches_on_label_boundaries(self):
+        self.assertTrue(self.index.is_spam("evilfredagscafeen.dk"))
+        self.assertFalse(self.index.is_spam("notcheapwatches.com"))
+
+    def test_blocked_domain_overrides_allowed_suffix(self):
+        self.assertTrue(self.index.is_spam("cheapwatches.com"))
+        self.assertTrue(self.index.is_spam("shop.cheapwatches.com"))
+
+    def test_unknown_domain_is_spam(self):
+        self.assertTrue(self.index.is_spam("example.org"))
+
+
+class SpamFilterTests(unittest.TestCase):
+    def test_refresh_compiles_new_version(self):
+        api_client = Mock()
+        api_client.get_spamfilter.return_value = (["example.com"], [])
+        spam_filter = SpamFilter(api_client)
+
+        spam_filter.refresh()
+        spam_filter.refresh()
+
+        self.assertEqual(spam_filter.version, 2)
+        self.assertFalse(spam_filter.is_spam("example.com"))
+        self.assertTrue(spam_filter.is_spam("example.org"))
+
+    def test_is_spam_loads_rules_that_failed_to_load_at_start(self):
+        api_client = Mock()
+        api_client.get_spamfilter.side_effect = ConnectionError("Django down")
+        spam_filter = SpamFilter(api_client)
+
+        with self.assertRaises(ConnectionError):
+            spam_filter.is_spam("example.org")
+
+        api_client.get_spamfilter.side_effect = None
+        api_client.get_spamfilter.return_value = (["example.com"], [])
+        self.assertTrue(spam_filter.is_spam("example.org"))
+        self.assertFalse(spam_filter.is_spam("example.com"))
+        api_client.get_spamfilter.assert_called_with()
+        self.assertEqual(api_client.get_spamfilter.call_count, 2)
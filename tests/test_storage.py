@@ -0,0 +1,123 @@
+import importlib
+import sys
+import types
+import unittest
+from unittest.mock import Mock
+
+import datmail
+
+
+config = types.ModuleType("datmail.config")
+config.S3_ENDPOINT_URL = None
+config.S3_ACCESS_KEY_ID = None
+config.S3_SECRET_ACCESS_KEY = None
+sys.modules["datmail.config"] = config
+datmail.config = config
+
+# Other tests replace datmail.storage with a stub
+sys.modules.pop("datmail.storage", None)
+storage_module = importlib.import_module("datmail.storage")
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Body, Bucket, Key, Metadata, **kwargs):
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        self.objects[Key] = (Body, Metadata)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs, Config):
+        self.objects[Key] = (Fileobj.read(), ExtraArgs["Metadata"])
+
+    def get_object(self, Bucket, Key):
+        body, metadata = self.objects[Key]
+        return {"Body": Mock(read=Mock(return_value=body)), "Metadata": metadata}
+
+
+class StorageCompressionTests(unittest.TestCase):
+    body = b"Subject: referat\r\n\r\n" + b"kaffe og kage " * 1000
+
+    def test_compressed_objects_are_decompressed_on_get(self):
+        for codec in ["gzip", "lzma"]:
+            s3 = FakeS3()
+            storage = storage_module.Storage("b", "r", compression=codec, s3_client=s3)
+
+            storage.put_object(self.body, "archive/a.eml")
+
+            stored, metadata = s3.objects["archive/a.eml"]
+            self.assertEqual(metadata, {"codec": codec})
+            self.assertLess(len(stored), len(self.body))
+            self.assertEqual(storage.get_object("archive/a.eml"), self.body)
+
+    def test_uncompressed_and_legacy_objects_are_returned_as_is(self):
+        s3 = FakeS3()
+        storage = storage_module.Storage("b", "r", compression="gzip", s3_client=s3)
+        s3.objects["archive/old.eml"] = (self.body, {})
+
+        storage.put_object(b"x", "archive/tiny.eml")
+
+        self.assertEqual(s3.objects["archive/tiny.eml"], (b"x", {}))
+        self.assertEqual(storage.get_object("archive/old.eml"), self.body)
+
+    def test_chunked_body_is_uploaded_without_joining(self):
+        s3 = FakeS3()
+        storage = storage_module.Storage("b", "r", compression=None, s3_client=s3)
+        s3.put_object = Mock(side_effect=s3.put_object)
+
+        storage.put_object([b"X-Id: 1\r\n", memoryview(self.body)], "archive/a.eml")
+
+        self.assertIsInstance(
+            s3.put_object.call_args[1]["Body"], storage_module.ChunkReader
+        )
+        self.assertEqual(
+            storage.get_object("archive/a.eml"), b"X-Id: 1\r\n" + self.body
+        )
+
+    def test_chunked_body_is_compressed(self):
+        s3 = FakeS3()
+        storage = storage_module.Storage("b", "r", compression="gzip", s3_client=s3)
+
+        storage.put_object([b"X-Id: 1\r\n", memoryview(self.body)], "archive/a.eml")
+
+        self.assertEqual(s3.objects["archive/a.eml"][1], {"codec": "gzip"})
+        self.assertEqual(
+            storage.get_object("archive/a.eml"), b"X-Id: 1\r\n" + self.body
+        )
+
+    def test_large_body_is_uploaded_with_multipart_transfer(self):
+        for codec in [None, "gzip"]:
+            s3 = FakeS3()
+            storage = storage_module.Storage("b", "r", compression=codec, s3_client=s3)
+            storage.multipart_threshold = 100
+            s3.put_object = Mock()
+
+            storage.put_object([b"X-Id: 1\r\n", memoryview(self.body)], "archive/a.eml")
+
+            s3.put_object.assert_not_called()
+            self.assertEqual(
+                s3.objects["archive/a.eml"][1], {"codec": codec} if codec else {}
+            )
+            self.assertEqual(
+                storage.get_object("archive/a.eml"), b"X-Id: 1\r\n" + self.body
+            )
+
+
+class StorageListingTests(unittest.TestCase):
+    def test_list_objects_follows_pagination(self):
+        s3 = Mock()
+        s3.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "archive/segments/a.seg"}]},
+            {"Contents": [{"Key": "archive/segments/a.seg.idx.json"}]},
+            {},
+        ]
+        storage = storage_module.Storage("b", "r", s3_client=s3)
+
+        self.assertEqual(
+            list(storage.list_objects("archive/segments/")),
+            ["archive/segments/a.seg", "archive/segments/a.seg.idx.json"],
+        )
+        s3.get_paginator.return_value.paginate.assert_called_once_with(
+            Bucket="b", Prefix="archive/segments/"
+        )